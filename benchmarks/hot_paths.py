@@ -0,0 +1,269 @@
+"""Measures the cost of the per-notification hot paths as sessions add up.
+
+Each benchmark sets up N tracked sessions, then times an operation on them,
+with stubs instead of the Plex server and the players. Results are in
+nanoseconds per operation, the best of several rounds.
+
+Usage:
+  python -m benchmarks.hot_paths run [--sizes 10,100,1000,10000] [--only NAME,...]
+                                     [--output FILE]
+  python -m benchmarks.hot_paths compare BASELINE CURRENT [--threshold 0.2]
+
+'compare' exits with status 1 if any benchmark got slower than its baseline by
+more than the threshold (a ratio: 0.2 means 20% slower).
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+from unittest.mock import patch
+from uuid import UUID
+
+from skippex.core import AutoSkipper
+from skippex.scheduling import VirtualScheduler
+from skippex.seekables import ChromecastMonitor, Seekable, SeekableProvider, SeekSerializer
+from skippex.sessions import (
+    EpisodeSession,
+    IntroMarker,
+    Session,
+    SessionDiscovery,
+    SessionDispatcher,
+    SessionListener,
+    SessionProvider,
+)
+
+
+Results = Dict[str, float]
+
+_ROUNDS = 5
+_OPS_PER_ROUND = 2000
+
+
+def _make_session(i: int, view_offset_ms: int, observed_at: float) -> EpisodeSession:
+    return EpisodeSession(
+        key=str(i),
+        state='playing',
+        rating_key=str(i),
+        title='Some Show - Some Episode',
+        player_id=f'player-{i}',
+        player_address=f'10.0.{i // 256}.{i % 256}',
+        player_title='Some Player',
+        view_offset_ms=view_offset_ms,
+        observed_at=observed_at,
+        intro_marker=IntroMarker(start=600000, end=660000),
+    )
+
+
+class _NoopListener(SessionListener):
+    def on_session_activity(self, session: Session):
+        pass
+
+    def on_session_removal(self, session: Session):
+        pass
+
+
+class _NoopSeekable(Seekable):
+    def seek(self, offset_ms: int):
+        pass
+
+
+class _NoopSeekableProvider(SeekableProvider):
+    def provide_seekable(self, session: Session) -> Seekable:
+        return _NoopSeekable()
+
+
+class _NoopSeekSerializer(SeekSerializer):
+    def seek(self, player_id, seekable, offset_ms, retry=False, on_done=None) -> bool:
+        return True
+
+
+class _StubSessionProvider(SessionProvider):
+    def __init__(self, sessions: Dict[str, Session]):
+        self._sessions = sessions
+
+    def provide(self, session_key: str) -> Session:
+        return self._sessions[session_key]
+
+
+def _make_auto_skipper(scheduler: VirtualScheduler) -> AutoSkipper:
+    return AutoSkipper(
+        _NoopSeekableProvider(),
+        scheduler=scheduler,
+        seek_serializer=_NoopSeekSerializer(),
+        max_sessions=100000,
+    )
+
+
+def _time_ns_per_op(op: Callable[[int], None]) -> float:
+    best = float('inf')
+    for _ in range(_ROUNDS):
+        started_at = time.perf_counter()
+        for i in range(_OPS_PER_ROUND):
+            op(i)
+        best = min(best, time.perf_counter() - started_at)
+    return best / _OPS_PER_ROUND * 1e9
+
+
+def bench_dispatch(size: int) -> float:
+    clock = VirtualScheduler()
+    dispatcher = SessionDispatcher(_NoopListener(), clock=clock)
+    sessions = [_make_session(i, 0, 0.0) for i in range(size)]
+    for s in sessions:
+        dispatcher.dispatch(s)
+    order = [random.randrange(size) for _ in range(_OPS_PER_ROUND)]
+    return _time_ns_per_op(lambda i: dispatcher.dispatch(sessions[order[i]]))
+
+
+def bench_handle_notification(size: int) -> float:
+    scheduler = VirtualScheduler()
+    sessions: Dict[str, Session] = {str(i): _make_session(i, 0, 0.0) for i in range(size)}
+    auto_skipper = _make_auto_skipper(scheduler)
+    discovery = SessionDiscovery(
+        server=None,  # type: ignore
+        provider=_StubSessionProvider(sessions),
+        dispatcher=SessionDispatcher(auto_skipper, clock=scheduler),
+        extrapolator=auto_skipper,
+        scheduler=scheduler,
+        max_timers=100000,
+    )
+    notifications = [{'sessionKey': str(i), 'state': 'playing'} for i in range(size)]
+    for n in notifications:
+        discovery._handle_notification(n)  # type: ignore
+    order = [random.randrange(size) for _ in range(_OPS_PER_ROUND)]
+    return _time_ns_per_op(lambda i: discovery._handle_notification(notifications[order[i]]))  # type: ignore
+
+
+def _tracked_auto_skipper(size: int):
+    clock = VirtualScheduler()
+    auto_skipper = _make_auto_skipper(clock)
+    sessions = [_make_session(i, 0, 0.0) for i in range(size)]
+    for s in sessions:
+        auto_skipper.accept_session(s)
+    clock.advance(1)
+    # Observed one second later, so that each accept measures the drift.
+    later = [_make_session(i, 1000, 1.0) for i in range(size)]
+    order = [random.randrange(size) for _ in range(_OPS_PER_ROUND)]
+    return auto_skipper, later, order
+
+
+def bench_accept_session(size: int) -> float:
+    auto_skipper, sessions, order = _tracked_auto_skipper(size)
+    return _time_ns_per_op(lambda i: auto_skipper.accept_session(sessions[order[i]]))
+
+
+def bench_extrapolate(size: int) -> float:
+    auto_skipper, sessions, order = _tracked_auto_skipper(size)
+    return _time_ns_per_op(lambda i: auto_skipper.extrapolate(sessions[order[i]]))
+
+
+def bench_session_activity(size: int) -> float:
+    # Before the intro, which is what most activity is.
+    auto_skipper, sessions, order = _tracked_auto_skipper(size)
+    return _time_ns_per_op(lambda i: auto_skipper.on_session_activity(sessions[order[i]]))
+
+
+def bench_chromecast_lookup(size: int) -> float:
+    listener = type('Listener', (), {'services': {}})()
+    monitor = ChromecastMonitor(listener, zconf=None, idle_timeout_sec=3600)  # type: ignore
+    addresses: List[str] = []
+    for i in range(size):
+        uuid = UUID(int=i)
+        address = f'10.0.{i // 256}.{i % 256}'
+        listener.services[uuid] = ({'name'}, uuid, 'Chromecast', f'Chromecast {i}', address, 8009)
+        monitor.add_callback(uuid, 'name')
+        addresses.append(address)
+
+    # Connected already: only the lookup is measured.
+    with patch('pychromecast.get_chromecast_from_service'):
+        for address in addresses:
+            monitor.get_chromecast_by_ip(address)
+        order = [random.randrange(size) for _ in range(_OPS_PER_ROUND)]
+        return _time_ns_per_op(lambda i: monitor.get_chromecast_by_ip(addresses[order[i]]))
+
+
+BENCHMARKS: Dict[str, Callable[[int], float]] = {
+    'dispatch': bench_dispatch,
+    'handle_notification': bench_handle_notification,
+    'accept_session': bench_accept_session,
+    'extrapolate': bench_extrapolate,
+    'session_activity': bench_session_activity,
+    'chromecast_lookup': bench_chromecast_lookup,
+}
+
+
+def run(sizes: List[int], names: List[str]) -> Results:
+    random.seed(0)
+    results: Results = {}
+    for name in names:
+        bench = BENCHMARKS[name]
+        for size in sizes:
+            ns = bench(size)
+            results[f'{name}/{size}'] = ns
+            print(f'{name + "/" + str(size):<28} {ns:12.0f} ns/op', file=sys.stderr)
+    return results
+
+
+def compare(baseline: Results, current: Results, threshold: float) -> List[str]:
+    """Prints the comparison, and returns the benchmarks that regressed."""
+    regressions = []
+    for name, baseline_ns in baseline.items():
+        if name not in current:
+            continue
+        ratio = current[name] / baseline_ns
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<28} {baseline_ns:12.0f} {current[name]:12.0f} ns/op {ratio:6.2f}x{flag}')
+    return regressions
+
+
+def _load(path: str) -> Results:
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_run = subparsers.add_parser('run')
+    parser_run.add_argument('--sizes', default='10,100,1000,10000')
+    parser_run.add_argument('--only', help='comma-separated benchmarks to run (default: all)')
+    parser_run.add_argument('--output', help='file to write the results to (default: stdout)')
+
+    parser_compare = subparsers.add_parser('compare')
+    parser_compare.add_argument('baseline')
+    parser_compare.add_argument('current')
+    parser_compare.add_argument('--threshold', type=float, default=0.2)
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        names = args.only.split(',') if args.only else list(BENCHMARKS)
+        results = run([int(s) for s in args.sizes.split(',')], names)
+        document = json.dumps({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'results': results,
+        }, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(document + '\n')
+        else:
+            print(document)
+    else:
+        regressions = compare(_load(args.baseline), _load(args.current), args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
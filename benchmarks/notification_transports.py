@@ -0,0 +1,183 @@
+"""Compares the notification transports' latency and CPU usage.
+
+A stand-in for the Plex server runs in a separate process on localhost. It
+serves the WebSocket and event stream endpoints, over which it pushes N
+'playing' notifications, each stamped with the time it was sent. Latency is
+from that stamp to the notification reaching the callback. CPU time is that
+of the receiving process only.
+
+Usage: python -m benchmarks.notification_transports [--frames 2000] [--interval-ms 1]
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import multiprocessing
+import socketserver
+import statistics
+import time
+from typing import Callable, List, Type
+from urllib.parse import parse_qs, urlparse
+
+from plexapi.server import PlexServer
+import requests
+
+from skippex.notifications import (
+    EventSourceTransport,
+    NotificationContainerDict,
+    NotificationTransport,
+    WebSocketTransport,
+)
+
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def _make_notification(i: int) -> dict:
+    return {
+        'sessionKey': str(i % 50),
+        'guid': '',
+        'ratingKey': str(1000 + i % 50),
+        'url': '',
+        'key': f'/library/metadata/{1000 + i % 50}',
+        'viewOffset': i * 1000,
+        'playQueueItemID': i % 50,
+        'state': 'playing',
+        'sentAt': time.monotonic(),
+    }
+
+
+def _ws_frame(payload: bytes) -> bytes:
+    # Unmasked text frame, as servers send them.
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x81, length])
+    elif length < 1 << 16:
+        header = bytes([0x81, 126]) + length.to_bytes(2, 'big')
+    else:
+        header = bytes([0x81, 127]) + length.to_bytes(8, 'big')
+    return header + payload
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request_line = self.rfile.readline().decode()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlparse(request_line.split()[1])
+        query = parse_qs(url.query)
+        frames = int(query['frames'][0])
+        interval_sec = float(query['interval'][0])
+        if url.path == '/:/websockets/notifications':
+            self._serve_websocket(headers['sec-websocket-key'], frames, interval_sec)
+        elif url.path == '/:/eventsource/notifications':
+            self._serve_eventsource(frames, interval_sec)
+
+    def _serve_websocket(self, key: str, frames: int, interval_sec: float):
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        self.wfile.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+        ).encode())
+        for i in range(frames):
+            time.sleep(interval_sec)
+            container = {'type': 'playing', 'size': 1, 'PlaySessionStateNotification': [_make_notification(i)]}
+            self.wfile.write(_ws_frame(json.dumps({'NotificationContainer': container}).encode()))
+        self.wfile.write(bytes([0x88, 0]))  # Close.
+
+    def _serve_eventsource(self, frames: int, interval_sec: float):
+        self.wfile.write((
+            'HTTP/1.1 200 OK\r\n'
+            'Content-Type: text/event-stream\r\n'
+            'Transfer-Encoding: chunked\r\n\r\n'
+        ).encode())
+        for i in range(frames):
+            time.sleep(interval_sec)
+            data = json.dumps({'PlaySessionStateNotification': _make_notification(i)})
+            event = f'event: playing\ndata: {data}\n\n'.encode()
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(event), event))
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def _serve(ports: 'multiprocessing.Queue[int]'):
+    with socketserver.ThreadingTCPServer(('127.0.0.1', 0), _StandInHandler) as server:
+        ports.put(server.server_address[1])
+        server.serve_forever()
+
+
+class _StandInServer(PlexServer):
+    """Only has what the transports use: never connects on its own."""
+
+    def __init__(self, baseurl: str, frames: int, interval_sec: float):
+        self._baseurl = baseurl
+        self._token = 'token'
+        self._showSecrets = False
+        self._session = requests.Session()
+        self._query = f'frames={frames}&interval={interval_sec}'
+
+    def url(self, key, includeToken=None):
+        # Tells the stand-in what to send.
+        delim = '&' if '?' in key else '?'
+        return super().url(f'{key}{delim}{self._query}', includeToken)
+
+
+def _measure(
+    make_transport: Callable[[PlexServer], NotificationTransport],
+    baseurl: str,
+    frames: int,
+    interval_sec: float,
+):
+    latencies_us: List[float] = []
+
+    def on_container(container: NotificationContainerDict):
+        for notification in container['PlaySessionStateNotification']:  # type: ignore
+            latencies_us.append((time.monotonic() - notification['sentAt']) * 1e6)
+
+    transport = make_transport(_StandInServer(baseurl, frames, interval_sec))
+    cpu_started_at = time.process_time()
+    transport.run_forever(lambda: None, on_container)
+    cpu_sec = time.process_time() - cpu_started_at
+    assert len(latencies_us) == frames, len(latencies_us)
+    return latencies_us, cpu_sec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--interval-ms', type=float, default=1)
+    args = parser.parse_args()
+
+    ports: 'multiprocessing.Queue[int]' = multiprocessing.Queue()
+    server_process = multiprocessing.Process(target=_serve, args=(ports,), daemon=True)
+    server_process.start()
+    baseurl = f'http://127.0.0.1:{ports.get(timeout=10)}'
+
+    transports: List[Type[NotificationTransport]] = [WebSocketTransport, EventSourceTransport]
+    try:
+        print(f'{args.frames} notifications, {args.interval_ms}ms apart')
+        print(f'{"transport":>12} {"p50 us":>8} {"p95 us":>8} {"max us":>8} {"CPU ms":>8} {"CPU us/frame":>13}')
+        for transport_class in transports:
+            # Warm up, e.g. the imports and the connection pool.
+            _measure(transport_class, baseurl, 10, 0)
+            latencies_us, cpu_sec = _measure(transport_class, baseurl, args.frames, args.interval_ms / 1000)
+            latencies_us.sort()
+            p95 = latencies_us[int(len(latencies_us) * 0.95)]
+            print(
+                f'{transport_class.name:>12} {statistics.median(latencies_us):>8.0f} {p95:>8.0f} '
+                f'{max(latencies_us):>8.0f} {cpu_sec * 1000:>8.1f} {cpu_sec * 1e6 / args.frames:>13.1f}'
+            )
+    finally:
+        server_process.terminate()
+
+
+if __name__ == '__main__':
+    main()
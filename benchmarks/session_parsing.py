@@ -0,0 +1,120 @@
+"""Compares the CPU and memory costs of reading sessions with and without plexapi.
+
+Parses a synthetic /status/sessions response with N episode sessions, shaped
+like the server's (media, parts, streams, user, player...), and reads the
+fields Skippex needs from every session: with plexapi, as the default
+SessionProvider does, or with the lean parser. Times are the best of several
+rounds; peak memory is measured separately with tracemalloc.
+
+Usage: python -m benchmarks.session_parsing [--sessions 1,10,100,500]
+"""
+
+import argparse
+from io import BytesIO
+import time
+import tracemalloc
+from typing import Callable, List
+from xml.etree import ElementTree
+
+from plexapi.server import PlexServer
+
+from skippex.parsing import iter_session_elements
+
+
+_ROUNDS = 5
+
+
+def make_sessions_xml(count: int) -> bytes:
+    items = []
+    for i in range(count):
+        items.append(f'''
+<Video addedAt="1600000000" art="/library/metadata/1/art/1" duration="1320000"
+    grandparentKey="/library/metadata/1" grandparentRatingKey="1" grandparentTitle="Some Show {i}"
+    guid="plex://episode/{i}" index="{i % 20}" key="/library/metadata/{1000 + i}" librarySectionID="2"
+    parentIndex="1" parentKey="/library/metadata/2" parentRatingKey="2" parentTitle="Season 1"
+    ratingKey="{1000 + i}" sessionKey="{i}" summary="{'Lorem ipsum dolor sit amet. ' * 10}"
+    thumb="/library/metadata/{1000 + i}/thumb/1" title="Episode {i}" type="episode"
+    updatedAt="1600000000" viewOffset="{i * 1000}" year="2020">
+  <Media audioChannels="2" audioCodec="aac" bitrate="2000" container="mkv" duration="1320000"
+      height="720" id="{i}" videoCodec="h264" videoResolution="720" width="1280">
+    <Part container="mkv" duration="1320000" file="/media/show/episode{i}.mkv" id="{i}"
+        key="/library/parts/{i}/file.mkv" size="300000000">
+      <Stream bitrate="1800" codec="h264" default="1" height="720" id="{3 * i}" index="0" streamType="1" width="1280" />
+      <Stream bitrate="192" channels="2" codec="aac" default="1" id="{3 * i + 1}" index="1" language="English" streamType="2" />
+      <Stream codec="srt" id="{3 * i + 2}" index="2" language="English" streamType="3" />
+    </Part>
+  </Media>
+  <Director id="1" tag="Some Director" />
+  <Writer id="2" tag="Some Writer" />
+  <User id="1" thumb="https://plex.tv/users/1/avatar" title="someone" />
+  <Player address="192.168.1.{i % 250}" device="Chromecast" machineIdentifier="player-{i}"
+      model="" platform="Chromecast" product="Plex for Chromecast" profile="Chromecast"
+      state="playing" title="Player {i}" vendor="" version="1.0" local="1" relayed="0" secure="1" userID="1" />
+  <Session id="session-{i}" bandwidth="2000" location="lan" />
+</Video>''')
+    return f'<MediaContainer size="{count}">{"".join(items)}\n</MediaContainer>'.encode()
+
+
+def _make_server() -> PlexServer:
+    # Only used to build objects: never connected.
+    server = PlexServer.__new__(PlexServer)
+    server._server = server
+    server._baseurl = 'http://127.0.0.1:32400'
+    server._token = None
+    server._session = None
+    return server
+
+
+def read_with_plexapi(data: bytes, server: PlexServer) -> list:
+    sessions = []
+    for episode in server.findItems(ElementTree.fromstring(data), initpath='/status/sessions'):
+        player = episode.players[0]
+        sessions.append((
+            str(episode.sessionKey), str(episode.ratingKey), f'{episode.grandparentTitle} - {episode.title}',
+            int(episode.viewOffset), player.state, player.machineIdentifier, player.address, player.title,
+        ))
+    return sessions
+
+
+def read_lean(data: bytes) -> list:
+    return list(iter_session_elements(BytesIO(data)))
+
+
+def _best_time_ms(f: Callable[[], object]) -> float:
+    best = float('inf')
+    for _ in range(_ROUNDS):
+        started_at = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - started_at)
+    return best * 1000
+
+
+def _peak_kib(f: Callable[[], object]) -> float:
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', default='1,10,100,500')
+    args = parser.parse_args()
+
+    server = _make_server()
+    sizes: List[int] = [int(s) for s in args.sessions.split(',')]
+    print(f'{"sessions":>8} {"plexapi ms":>11} {"lean ms":>9} {"plexapi KiB":>12} {"lean KiB":>10}')
+    for size in sizes:
+        data = make_sessions_xml(size)
+        assert len(read_with_plexapi(data, server)) == len(read_lean(data)) == size
+        plexapi_ms = _best_time_ms(lambda: read_with_plexapi(data, server))
+        lean_ms = _best_time_ms(lambda: read_lean(data))
+        plexapi_kib = _peak_kib(lambda: read_with_plexapi(data, server))
+        lean_kib = _peak_kib(lambda: read_lean(data))
+        print(f'{size:>8} {plexapi_ms:>11.2f} {lean_ms:>9.2f} {plexapi_kib:>12.0f} {lean_kib:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
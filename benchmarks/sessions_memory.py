@@ -0,0 +1,84 @@
+"""Compares the memory held by sessions before and after compacting them.
+
+Builds plexapi episodes out of a fake /status/sessions response, and measures
+what's retained when keeping them around (what sessions used to hold) versus
+keeping the compact session records built from them.
+
+Usage: python -m benchmarks.sessions_memory [--sessions N]
+"""
+
+import argparse
+import gc
+import tracemalloc
+from typing import Callable, List, Tuple
+from xml.etree import ElementTree
+
+from plexapi.video import Episode
+
+from skippex.sessions import EpisodeSession, IntroMarker
+
+
+_VIDEO_XML = '''
+<Video type="episode" sessionKey="{i}" ratingKey="{rating_key}" key="/library/metadata/{rating_key}"
+       grandparentTitle="Some Show" parentTitle="Season 1" title="Episode {i}" index="{i}"
+       parentIndex="1" duration="1320000" viewOffset="{view_offset}" addedAt="1600000000">
+  <Media id="{i}" duration="1320000" bitrate="4000" width="1920" height="1080" videoCodec="h264">
+    <Part id="{i}" key="/library/parts/{i}/file.mkv" duration="1320000" file="/media/show/s01e{i}.mkv">
+      <Stream id="{i}1" streamType="1" codec="h264" index="0" bitrate="3800" />
+      <Stream id="{i}2" streamType="2" codec="aac" index="1" channels="2" language="English" />
+      <Stream id="{i}3" streamType="3" codec="srt" index="2" language="English" />
+    </Part>
+  </Media>
+  <User id="1" thumb="https://plex.tv/users/1/avatar" title="someone" />
+  <Player address="192.168.1.{host}" machineIdentifier="machine-{i}" model="iPhone12,1" platform="iOS"
+          platformVersion="14.3" product="Plex for iOS" profile="iOS" state="playing" title="iPhone {i}"
+          vendor="Apple" version="7.11" local="1" relayed="0" secure="1" userID="1" />
+  <Session id="session-{i}" bandwidth="4000" location="lan" />
+</Video>
+'''
+
+
+def _make_episodes(count: int) -> List[Episode]:
+    episodes = []
+    for i in range(count):
+        xml = _VIDEO_XML.format(i=i, rating_key=1000 + i, view_offset=i * 1000, host=i % 250 + 1)
+        episodes.append(Episode(None, ElementTree.fromstring(xml), initpath='/status/sessions'))
+    return episodes
+
+
+def _fake_intro_marker_of(episode: Episode) -> IntroMarker:
+    # The real thing would reload the episode from the server.
+    return IntroMarker(start=10000, end=60000)
+
+
+def _measure(build: Callable[[], list]) -> Tuple[int, list]:
+    """Returns the bytes retained by the result of build(), and the result."""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    retained = build()
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return after - before, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=1000)
+    args = parser.parse_args()
+
+    plexapi_bytes, _ = _measure(lambda: _make_episodes(args.sessions))
+    compact_bytes, _ = _measure(lambda: [
+        EpisodeSession.from_playable(e, observed_at=0.0, intro_marker_of=_fake_intro_marker_of)
+        for e in _make_episodes(args.sessions)
+    ])
+
+    print(f'Sessions:        {args.sessions}')
+    print(f'plexapi objects: {plexapi_bytes / 1024:10.1f} KiB ({plexapi_bytes / args.sessions:8.0f} B/session)')
+    print(f'compact records: {compact_bytes / 1024:10.1f} KiB ({compact_bytes / args.sessions:8.0f} B/session)')
+    print(f'Ratio:           {plexapi_bytes / compact_bytes:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Simulates hours of playback to measure how late intros get skipped.
+
+Runs the whole pipeline, from notifications to seeks, on a virtual scheduler:
+simulated time only advances when nothing is left to do at the current time,
+so hours of playback across thousands of sessions take seconds, and a given
+seed always gives the same results. Players report their view offset to the
+server with a limited granularity, like actual players do.
+
+Usage: python -m benchmarks.skip_timing [--sessions N] [--hours H] [--seed S]
+"""
+
+import argparse
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from skippex.core import AutoSkipper
+from skippex.scheduling import VirtualScheduler
+from skippex.seekables import Seekable, SeekableProvider, SeekSerializer
+from skippex.sessions import (
+    EpisodeSession,
+    IntroMarker,
+    Session,
+    SessionDiscovery,
+    SessionDispatcher,
+    SessionNotFoundError,
+    SessionProvider,
+)
+
+
+_NOTIFICATION_INTERVAL_SEC = 10  # Like Plex's.
+_EPISODE_DURATION_MS = 22 * 60 * 1000
+
+
+class _Playback:
+    def __init__(self, key: str, scheduler: VirtualScheduler, intro_marker: IntroMarker, granularity_ms: int):
+        self.key = key
+        self.intro_marker = intro_marker
+        self._scheduler = scheduler
+        self._granularity_ms = granularity_ms
+        self._offset_ms = 0
+        self._offset_at = scheduler.now()
+        self.lateness_ms: List[int] = []
+
+    def offset_ms(self) -> int:
+        return self._offset_ms + int((self._scheduler.now() - self._offset_at) * 1000)
+
+    def reported_offset_ms(self) -> int:
+        offset_ms = self.offset_ms()
+        return offset_ms - offset_ms % self._granularity_ms
+
+    def seek(self, offset_ms: int):
+        self.lateness_ms.append(self.offset_ms() - self.intro_marker.start)
+        self._offset_ms = offset_ms
+        self._offset_at = self._scheduler.now()
+
+
+class _SimulatedServer(SessionProvider, SeekableProvider):
+    def __init__(self, scheduler: VirtualScheduler):
+        self._scheduler = scheduler
+        self.playbacks: Dict[str, _Playback] = {}
+
+    def provide(self, session_key: str) -> Session:
+        playback = self.playbacks.get(session_key)
+        if playback is None:
+            raise SessionNotFoundError(session_key)
+        return EpisodeSession(
+            key=session_key,
+            state='playing',
+            rating_key=session_key,
+            title='Some Show - Some Episode',
+            player_id=f'player-{session_key}',
+            player_address='192.168.1.2',
+            player_title='Some Player',
+            view_offset_ms=playback.reported_offset_ms(),
+            observed_at=self._scheduler.now(),
+            intro_marker=playback.intro_marker,
+        )
+
+    def provide_seekable(self, session: Session) -> Seekable:
+        return _SimulatedSeekable(self.playbacks[session.key])
+
+
+class _SimulatedSeekable(Seekable):
+    def __init__(self, playback: _Playback):
+        self._playback = playback
+
+    def seek(self, offset_ms: int):
+        self._playback.seek(offset_ms)
+
+
+class _ImmediateSeekSerializer(SeekSerializer):
+    """Seeks right away, rather than from another thread."""
+
+    def seek(self, player_id, seekable, offset_ms, retry=False, on_done=None) -> bool:
+        seekable.seek(offset_ms)
+        if on_done:
+            on_done('acked')
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--hours', type=float, default=4, help='simulated time over which sessions start')
+    parser.add_argument('--granularity-ms', type=int, default=1000, help='granularity of reported offsets')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    scheduler = VirtualScheduler()
+    server = _SimulatedServer(scheduler)
+    auto_skipper = AutoSkipper(
+        server,
+        seek_serializer=_ImmediateSeekSerializer(),
+        scheduler=scheduler,
+    )
+    discovery = SessionDiscovery(
+        server=None,  # type: ignore
+        provider=server,
+        dispatcher=SessionDispatcher(auto_skipper, clock=scheduler),
+        extrapolator=auto_skipper,
+        scheduler=scheduler,
+    )
+    finished: List[_Playback] = []
+
+    def notify(key: str, state: str):
+        discovery.alert_callback({
+            'type': 'playing',
+            'PlaySessionStateNotification': [{'sessionKey': key, 'state': state}],  # type: ignore
+        })
+
+    def start(key: str):
+        intro_start_ms = rng.randrange(0, 5 * 60 * 1000)
+        intro_marker = IntroMarker(start=intro_start_ms, end=intro_start_ms + rng.randrange(30000, 90000))
+        server.playbacks[key] = _Playback(key, scheduler, intro_marker, args.granularity_ms)
+        # Players don't all report at the same time.
+        scheduler.call_later(rng.uniform(0, _NOTIFICATION_INTERVAL_SEC), lambda: tick(key))
+
+    def tick(key: str):
+        playback = server.playbacks[key]
+        if playback.offset_ms() >= _EPISODE_DURATION_MS:
+            del server.playbacks[key]
+            finished.append(playback)
+            notify(key, 'stopped')
+            return
+        notify(key, 'playing')
+        scheduler.call_later(_NOTIFICATION_INTERVAL_SEC, lambda: tick(key))
+
+    for i in range(args.sessions):
+        key = str(i)
+        scheduler.call_later(rng.uniform(0, args.hours * 3600), lambda key=key: start(key))
+
+    started_at = time.monotonic()
+    scheduler.run_until(args.hours * 3600 + _EPISODE_DURATION_MS / 1000 + 2 * _NOTIFICATION_INTERVAL_SEC)
+    elapsed_sec = time.monotonic() - started_at
+
+    lateness_ms = sorted(ms for p in finished for ms in p.lateness_ms)
+    unskipped = sum(1 for p in finished if not p.lateness_ms)
+    print(f'Simulated:   {scheduler.now() / 3600:.1f}h, {len(finished)} sessions in {elapsed_sec:.2f}s')
+    print(f'Skipped:     {len(lateness_ms)} ({unskipped} sessions unskipped)')
+    if lateness_ms:
+        print(f'Lateness:    mean {statistics.mean(lateness_ms):.0f}ms, '
+              f'p50 {lateness_ms[len(lateness_ms) // 2]}ms, '
+              f'p95 {lateness_ms[int(len(lateness_ms) * 0.95)]}ms, '
+              f'max {lateness_ms[-1]}ms')
+    confirmed = auto_skipper.time_to_confirm_ms.snapshot()
+    if confirmed['count']:
+        print(f"Confirmed:   {confirmed['count']} skips, mean {confirmed['sum'] / confirmed['count']:.0f}ms "
+              f"after the first seek")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Checks that the per-session state doesn't grow over many session lifecycles.
+
+Runs synthetic sessions through the dispatcher and the auto skipper on a fake
+clock: each session is observed before its intro, then in it and skipped,
+then past it, and removed. Some removals are dropped, as happens when the
+WebSocket disconnects, and Plex reuses session keys. The traced memory is
+sampled as it goes, and must stay flat once warmed up.
+
+Tracing memory is slow: a million lifecycles take several minutes.
+
+Usage: python -m benchmarks.soak [--lifecycles N]
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from skippex.core import AutoSkipper
+from skippex.scheduling import VirtualScheduler
+from skippex.seekables import Seekable, SeekableProvider, SeekSerializer
+from skippex.sessions import EpisodeSession, IntroMarker, Session, SessionDispatcher
+
+
+# Not mocks, which would remember all their calls.
+
+class _NoopSeekable(Seekable):
+    def seek(self, offset_ms: int):
+        pass
+
+
+class _NoopSeekableProvider(SeekableProvider):
+    def provide_seekable(self, session: Session) -> Seekable:
+        return _NoopSeekable()
+
+
+class _NoopSeekSerializer(SeekSerializer):
+    def seek(self, player_id, seekable, offset_ms, retry=False, on_done=None) -> bool:
+        return True
+
+
+def _make_session(key: str, rating_key: str, view_offset_ms: int, observed_at: float) -> EpisodeSession:
+    return EpisodeSession(
+        key=key,
+        state='playing',
+        rating_key=rating_key,
+        title='Some Show - Some Episode',
+        player_id=f'player-{int(key) % 20}',
+        player_address='192.168.1.2',
+        player_title='Some Player',
+        view_offset_ms=view_offset_ms,
+        observed_at=observed_at,
+        intro_marker=IntroMarker(start=10000, end=60000),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lifecycles', type=int, default=1000000)
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--dropped-removals', type=float, default=0.1, help='fraction of removals never dispatched')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed growth after warming up')
+    args = parser.parse_args()
+
+    scheduler = VirtualScheduler()
+    # The seeks themselves aren't what's being measured.
+    auto_skipper = AutoSkipper(
+        seekable_provider=_NoopSeekableProvider(),
+        scheduler=scheduler,
+        seek_serializer=_NoopSeekSerializer(),
+    )
+    dispatcher = SessionDispatcher(listener=auto_skipper)
+    drop_every = int(1 / args.dropped_removals) if args.dropped_removals else 0
+    sample_every = max(args.lifecycles // args.samples, 1)
+
+    tracemalloc.start()
+    samples = []
+    for i in range(args.lifecycles):
+        key = str(i % 5000)  # Plex reuses session keys.
+        rating_key = str(i)
+        scheduler.advance(1)
+        dispatcher.dispatch(_make_session(key, rating_key, 5000, scheduler.now()))
+        scheduler.advance(1)
+        dispatcher.dispatch(_make_session(key, rating_key, 10500, scheduler.now()))
+        scheduler.advance(1)
+        dispatcher.dispatch(_make_session(key, rating_key, 61000, scheduler.now()))
+        if not drop_every or i % drop_every:
+            dispatcher.dispatch_removal(key)
+
+        if (i + 1) % sample_every == 0:
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append(current)
+            print(f'{i + 1:>10} lifecycles: {current / 1024:10.1f} KiB, sizes={auto_skipper.sizes()}')
+    tracemalloc.stop()
+
+    # The first half is the warm-up: the bounded state fills up to its cap.
+    warmed_up = samples[len(samples) // 2]
+    growth = (samples[-1] - warmed_up) / warmed_up
+    print(f'Growth after warming up: {growth:.1%}')
+    if growth > args.tolerance:
+        print('FAIL: memory keeps growing')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,83 @@
 import argparse
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing
 import os
 from pathlib import Path
-import shelve
+import queue
+import signal
+import socket
 import sys
 import tempfile
-from typing import Optional
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
 import webbrowser
 
 from pid import PidFile, PidFileError
+from plexapi.exceptions import NotFound
 from plexapi.myplex import MyPlexAccount, MyPlexResource
+from plexapi.server import PlexServer
 import pychromecast
 import xdg
 import zeroconf
 
 from .auth import PlexApplication, PlexAuthClient
+from .config import Config, ConfigError, changed_settings, load_config
+from .control import ControlServer, StatusDict, query_status
 from .core import AutoSkipper
-from .notifications import NotificationListener
+from .notifications import (
+    EventSourceTransport,
+    NotificationContainerDict,
+    NotificationListener,
+    NotificationQueue,
+    NotificationTransport,
+    SessionPoller,
+    TransportUnavailableError,
+    WebSocketTransport,
+)
 from .seekables import (
     ChromecastMonitor,
     ChromecastSeekableProvider,
+    NegativeCachingSeekableProvider,
     PlexSeekableProvider,
-    SeekableProviderChain
+    SeekableProvider,
+    SeekableProviderChain,
 )
+from .instrumentation import RequestCounter
+from .ratelimit import RateLimitedSession, RateLimiter
+from .scheduling import ThreadingScheduler
 from .sessions import SessionDiscovery, SessionDispatcher, SessionProvider
-from .stores import Database
+from .stores import Database, SqliteStore
+from .traces import TraceBuffer
+from .workers import ShardedWorkers
 
 
 # Note: Don't assume that the XDG paths are all different from each other (see
 # Dockerfile).
 
 if os.getenv('SK_DEV', '0') == '1':
-    _DATABASE_PATH = xdg.xdg_data_home() / 'skippex_dev.db'
+    _CONFIG_PATH = xdg.xdg_config_home() / 'skippex_dev.json'
+    _LEGACY_DATABASE_PATH = xdg.xdg_data_home() / 'skippex_dev.db'
+    _DATABASE_PATH = xdg.xdg_data_home() / 'skippex_dev.sqlite3'
     _PID_NAME = 'skippex_dev.pid'
+    _SOCKET_NAME = 'skippex_dev.sock'
+    _TRACES_DIR = xdg.xdg_data_home() / 'skippex_dev_traces'
 else:
-    _DATABASE_PATH = xdg.xdg_data_home() / 'skippex.db'
+    _CONFIG_PATH = xdg.xdg_config_home() / 'skippex.json'
+    _LEGACY_DATABASE_PATH = xdg.xdg_data_home() / 'skippex.db'
+    _DATABASE_PATH = xdg.xdg_data_home() / 'skippex.sqlite3'
     _PID_NAME = 'skippex.pid'
+    _SOCKET_NAME = 'skippex.sock'
+    _TRACES_DIR = xdg.xdg_data_home() / 'skippex_traces'
 
 _APP_NAME = 'Skippex'
 _APP_ARGV0 = __package__
 _PID_DIR = xdg.xdg_runtime_dir() or Path(tempfile.gettempdir())
 _PID_PATH = _PID_DIR / _PID_NAME
+_SOCKET_PATH = _PID_DIR / _SOCKET_NAME
 
 
 EXIT_UNAUTHORIZED = 4
@@ -53,10 +89,81 @@ def cmd_debug_info(args: argparse.Namespace, db: Database, app: PlexApplication)
     from pprint import pprint
 
     print(f'PID path: {_PID_PATH}')
+    print(f'Control socket path: {_SOCKET_PATH}')
+    print(f'Config path: {_CONFIG_PATH}')
     print(f'Database path: {_DATABASE_PATH}')
+    print(f'Traces path: {_TRACES_DIR}')
     print()
     print(f'Database content:')
     pprint(db.content())
+    print()
+    print(f'Recent skips:')
+    pprint(db.skip_history.recent())
+
+
+def _format_ms(ms: int) -> str:
+    minutes, seconds = divmod(ms / 1000, 60)
+    return f'{int(minutes)}:{seconds:06.3f}'
+
+
+def _print_status(status: StatusDict):
+    print(f"Uptime: {status['uptime_sec']:.0f}s")
+    print()
+
+    if 'workers' in status:
+        workers = status['workers']
+        print(f"Workers: {workers['alive']}/{workers['count']} alive, {workers['restarts']} restarted")
+        print(f"Queued notifications: {workers['depths']} ({workers['dropped']} dropped)")
+        print(f"Plex requests (this process): {status['plex_requests']}")
+        return
+
+    print('Sessions:')
+    for s in status['sessions']:
+        marker = s['intro_marker']
+        intro = f'{_format_ms(marker[0])}-{_format_ms(marker[1])}' if marker else 'none'
+        print(
+            f"  {s['key']}: {s['title']} on {s['player']} ({s['state']}) "
+            f"at {_format_ms(s['view_offset_ms'])}, intro {intro}"
+        )
+    print(f"Skipped: {', '.join(status['skipped']) or 'none'}")
+    print(f"Skip states: {status['skip_states']}")
+    print('Pending timers:')
+    for key, left_sec in status['timers'].items():
+        print(f'  {key}: in {left_sec:.3f}s')
+    print()
+
+    print('Plex clients:')
+    for machine_id, title in status['plex_clients'].items():
+        print(f'  {title} ({machine_id})')
+    print('Chromecasts:')
+    for address, name in status['chromecasts'].items():
+        print(f'  {name} ({address})')
+    print()
+
+    print(f"Notification queue: {status['notifications']}")
+    print(f"Session cache: {status['sessions_cache']}")
+    print(f"Failed player lookups cache: {status['seekables_cache']}")
+    print(f"Extrapolation drift: {status['drift']}")
+    latency = status['seek_latency']
+    print(f"Seek latency estimates (ms): {latency['estimates_ms']}")
+    print(f"Recent seek latencies (ms): {latency['recent_ms']}")
+    print(f"Time to confirmed skip (ms): {status['time_to_confirm_ms']}")
+    print(f"State sizes: {status['state_sizes']}")
+    print(f"Plex requests: {status['plex_requests']}")
+    print(f"Plex requests by scope: {status['plex_requests_by_scope']}")
+
+
+def cmd_status(args: argparse.Namespace, db: Database, app: PlexApplication) -> Optional[int]:
+    try:
+        status = query_status(_SOCKET_PATH)
+    except OSError as e:
+        logger.error(f'Could not query the running instance of {_APP_NAME} ({e}). Is it running?')
+        return 1
+    if args.json:
+        print(json.dumps(status, indent=2))
+    else:
+        _print_status(status)
+    return None
 
 
 def cmd_auth(args: argparse.Namespace, db: Database, app: PlexApplication):
@@ -84,7 +191,64 @@ def _find_server(account: MyPlexAccount, server_name: Optional[str]) -> Optional
     return None
 
 
+def _lookup_server(auth_token: str, server_name: Optional[str]) -> Optional[MyPlexResource]:
+    account = MyPlexAccount(token=auth_token)
+    return _find_server(account, server_name)
+
+
+def _race_connections(urls: List[str], token: str, timeout_sec: float) -> Optional[PlexServer]:
+    """Returns the server behind the first URL that answers, if any."""
+    if not urls:
+        return None
+
+    # Don't use the executor as a context manager: we don't want to wait for
+    # the slower connections once we have a winner.
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    try:
+        futures = {executor.submit(PlexServer, url, token, timeout=timeout_sec): url for url in urls}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                server = future.result()
+            except Exception as e:
+                logger.debug(f'Could not connect to {url}: {e}')
+                continue
+            logger.debug(f'Connected to {url}')
+            return server
+    finally:
+        executor.shutdown(wait=False)
+    return None
+
+
+def _connect_server(resource: MyPlexResource, timeout_sec: float = 10) -> PlexServer:
+    """Connects to the first of the resource's addresses that answers.
+
+    LAN and remote addresses are raced against each other, HTTPS first. Plain
+    HTTP is only attempted if none of the HTTPS addresses answered.
+
+    Raises plexapi.exceptions.NotFound if none of the addresses answered.
+    """
+    # Same filtering as MyPlexResource.connect().
+    connections = [c for c in resource.connections if resource.owned or not c.local]
+    https_urls = [c.uri for c in connections]
+    http_urls = [c.httpuri for c in connections]
+
+    for urls in (https_urls, http_urls):
+        server = _race_connections(urls, resource.accessToken, timeout_sec)
+        if server:
+            return server
+    raise NotFound(f'could not connect to any address of server {resource.name}')
+
+
+def _start_chromecast_discovery(cc_listener: pychromecast.discovery.CastListener, zconf: zeroconf.Zeroconf):
+    cc_browser = pychromecast.discovery.start_discovery(cc_listener, zconf)
+    logger.debug('Started Chromecast discovery')
+    return cc_browser
+
+
 def cmd_run(args: argparse.Namespace, db: Database, app: PlexApplication) -> Optional[int]:
+    started_at = time.monotonic()
+
     try:
         auth_token = db.auth_token
     except KeyError:
@@ -94,27 +258,104 @@ def cmd_run(args: argparse.Namespace, db: Database, app: PlexApplication) -> Opt
         )
         return EXIT_UNAUTHORIZED
 
-    logger.info('Verifying token...')
+    try:
+        config = load_config(args.config)
+    except ConfigError as e:
+        logger.error(f'Invalid config: {e}')
+        return 1
+    _reconfigure_logging(debug=args.debug or config.debug)
+    server_name = args.server or config.server
+
+    if args.workers < 1:
+        logger.error('The number of workers must be at least 1.')
+        return 1
+
+    # Verifying the token and looking up the server are independent plex.tv
+    # round trips, so run them concurrently.
+    logger.info('Verifying token and looking up Plex server...')
     auth_client = PlexAuthClient(app)
-    if not auth_client.is_token_valid(auth_token):
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='Startup')
+    token_future = executor.submit(auth_client.is_token_valid, auth_token)
+    resource_future = executor.submit(_lookup_server, auth_token, server_name)
+    executor.shutdown(wait=False)
+
+    if not token_future.result():
         logger.error("Token invalid. Please run the 'auth' command to reauthenticate yourself.")
         return EXIT_UNAUTHORIZED
 
-    logger.info('Connecting to Plex server...')
-    account = MyPlexAccount(token=auth_token)
-    server_resource = _find_server(account, args.server)
-
+    server_resource = resource_future.result()
     if not server_resource:
-        if args.server:
-            logger.error(f"Could not find server '{args.server}' for this account.")
-        else:
-            logger.error(f"Could not find a server associated with this account.")
+        _log_server_not_found(server_name)
         return 1
 
-    # TODO: Ensure we try HTTP only if HTTPS fails.
-    server = server_resource.connect()
+    logger.info('Connecting to Plex server...')
+    try:
+        server = _connect_server(server_resource)
+    except NotFound:
+        logger.error(f"Could not connect to server '{server_resource.name}'.")
+        return 1
+
+    _limit_requests(server, args)
+    if args.workers > 1:
+        return _run_sharded(args, db, server, config, started_at)
+
+    runner = _Runner(args, db, auth_token, server, config)
+    if hasattr(signal, 'SIGUSR1'):  # Not on Windows.
+        signal.signal(signal.SIGUSR1, lambda signum, frame: runner.dump_trace('SIGUSR1'))
+    _reload_on_sighup(runner.reload)
+
+    def status() -> StatusDict:
+        return {'uptime_sec': time.monotonic() - started_at, **runner.status()}
+
+    def on_ready():
+        logger.info(f'Ready (startup took {time.monotonic() - started_at:.2f}s)')
+
+    control_server = _start_control_server(status)
+    try:
+        runner.run(on_ready)
+    finally:
+        if control_server:
+            control_server.close()
+    return None
+
+
+def _log_server_not_found(server_name: Optional[str]):
+    if server_name:
+        logger.error(f"Could not find server '{server_name}' for this account.")
+    else:
+        logger.error(f"Could not find a server associated with this account.")
+
+
+def _limit_requests(server: PlexServer, args: argparse.Namespace):
+    # Workers have their own limiters, so they share the budget between them.
+    rate_per_sec = args.max_requests_per_sec / args.workers
+    if rate_per_sec > 0:
+        server._session = _make_rate_limited_session(rate_per_sec)
+
+
+def _make_rate_limited_session(rate_per_sec: float) -> RateLimitedSession:
+    # Allows short bursts, e.g. to look up a player right after its session.
+    return RateLimitedSession(RateLimiter(rate_per_sec, burst=max(1, int(2 * rate_per_sec))))
+
+
+def _request_stats(server: PlexServer) -> Optional[Dict[str, Any]]:
+    session = server._session
+    return session.limiter.stats() if isinstance(session, RateLimitedSession) else None
+
 
-    # Build the object hierarchy.
+class _Pipeline(NamedTuple):
+    queue: NotificationQueue
+    trace: TraceBuffer
+    status: Callable[[], Dict[str, Any]]
+    # Applies the settings that can change without rebuilding the pipeline.
+    reconfigure: Callable[[Config], None]
+    close: Callable[[], None]
+
+
+def _start_chromecast_monitor(enabled: bool) -> Optional[ChromecastMonitor]:
+    if not enabled:
+        logger.info('Chromecast support disabled')
+        return None
 
     cc_listener = pychromecast.discovery.CastListener()
     zconf = zeroconf.Zeroconf()
@@ -123,83 +364,624 @@ def cmd_run(args: argparse.Namespace, db: Database, app: PlexApplication) -> Opt
     cc_listener.add_callback = cc_monitor.add_callback
     cc_listener.update_callback = cc_monitor.update_callback
     cc_listener.remove_callback = cc_monitor.remove_callback
-    cc_browser = pychromecast.discovery.start_discovery(cc_listener, zconf)
-
-    seekable_provider = SeekableProviderChain([
-        PlexSeekableProvider(server),
-        ChromecastSeekableProvider(cc_monitor),
-    ])
 
-    session_provider = SessionProvider(server)
-    auto_skipper = AutoSkipper(seekable_provider)
-    dispatcher = SessionDispatcher(listener=auto_skipper)
+    # Discovery doesn't block: Chromecasts are discovered in the background
+    # while we connect to the WebSocket.
+    _start_chromecast_discovery(cc_listener, zconf)
+    return cc_monitor
+
+
+def _build_pipeline(
+    server: PlexServer,
+    db: Database,
+    cc_monitor: Optional[ChromecastMonitor],
+    lean_sessions: bool,
+    config: Config,
+) -> _Pipeline:
+    """Builds the object hierarchy handling notifications, and starts it.
+
+    The Chromecast monitor doesn't depend on the server, so it's built
+    separately, to be kept when the pipeline is rebuilt.
+    """
+    # The source of time and timers of the whole pipeline.
+    scheduler = ThreadingScheduler()
+
+    plex_seekable_provider = PlexSeekableProvider(server, player_timeout_sec=config.player_timeout_sec)
+    providers: List[SeekableProvider] = [plex_seekable_provider]
+    if cc_monitor:
+        providers.append(ChromecastSeekableProvider(cc_monitor))
+
+    # Query the providers in parallel, so that Chromecast users don't have to
+    # wait for the Plex server to list its clients.
+    provider_chain = SeekableProviderChain(providers, parallel=len(providers) > 1, clock=scheduler.now)
+    seekable_provider = NegativeCachingSeekableProvider(provider_chain, clock=scheduler.now)
+    plex_seekable_provider.add_change_callback(seekable_provider.invalidate)
+    if cc_monitor:
+        cc_monitor.add_change_callback(seekable_provider.invalidate)
+
+    # Dumped when a skip is missed or late, or on demand with SIGUSR1.
+    trace = TraceBuffer(dump_dir=_TRACES_DIR)
+
+    # Counts what each notification and timer tick costs the server.
+    request_counter = RequestCounter()
+    request_counter.install(server._session)
+
+    session_provider = SessionProvider(
+        server,
+        intro_markers=db.intro_markers,
+        clock=scheduler.now,
+        lean=lean_sessions,
+    )
+    auto_skipper = AutoSkipper(
+        seekable_provider,
+        skip_history=db.skip_history,
+        trace=trace,
+        scheduler=scheduler,
+    )
+    dispatcher = SessionDispatcher(
+        listener=auto_skipper,
+        removal_timeout_sec=config.removal_timeout_sec,
+        clock=scheduler.now,
+    )
 
     discovery = SessionDiscovery(
         server=server,
         provider=session_provider,
         dispatcher=dispatcher,
         extrapolator=auto_skipper,
+        trace=trace,
+        scheduler=scheduler,
+        request_counter=request_counter,
     )
 
-    notif_listener = NotificationListener(server, discovery.alert_callback)
-    logger.info('Ready')
-    notif_listener.run_forever()
+    # Process the notifications from other threads, so that receiving them
+    # never waits on processing them.
+    notif_queue = NotificationQueue(discovery.alert_callback)
+    notif_queue.start()
+
+    def status() -> Dict[str, Any]:
+        # Called from another thread: this only reads a consistent enough view
+        # of the state, without taking the locks of the components.
+        skipper_status: Dict[str, Any] = auto_skipper.status()
+        return {
+            'sessions': skipper_status['sessions'],
+            'skipped': skipper_status['skipped'],
+            'skip_states': skipper_status['skip_states'],
+            'time_to_confirm_ms': skipper_status['time_to_confirm_ms'],
+            'timers': discovery.pending_timers(),
+            'plex_clients': plex_seekable_provider.known_clients(),
+            'chromecasts': cc_monitor.known_chromecasts() if cc_monitor else {},
+            'notifications': notif_queue.stats(),
+            'sessions_cache': session_provider.stats(),
+            'seekables_cache': seekable_provider.stats(),
+            'drift': skipper_status['drift'],
+            'seek_latency': skipper_status['seek_latency'],
+            'state_sizes': {**auto_skipper.sizes(), **discovery.sizes()},
+            'plex_requests': _request_stats(server),
+            'plex_requests_by_scope': request_counter.stats(),
+        }
+
+    def reconfigure(config: Config):
+        dispatcher.set_removal_timeout_sec(config.removal_timeout_sec)
+        plex_seekable_provider.set_player_timeout_sec(config.player_timeout_sec)
+
+    def close():
+        notif_queue.close()
+        discovery.close()
+        auto_skipper.close()
+        provider_chain.close()
+
+    return _Pipeline(queue=notif_queue, trace=trace, status=status, reconfigure=reconfigure, close=close)
+
+
+class _Listener:
+    """Listens for notifications, or polls the sessions, until closed."""
+
+    def __init__(
+        self,
+        server: PlexServer,
+        callback: Callable[[NotificationContainerDict], None],
+        db: Database,
+        poll: bool,
+        transport: str,
+        on_open: Optional[Callable[[], None]] = None,
+    ):
+        self._poller = SessionPoller(server, callback, intro_markers=db.intro_markers, on_open=on_open)
+        self._notif_listener: Optional[NotificationListener] = None
+        if not poll:
+            transports: List[NotificationTransport] = []
+            if transport in ('auto', 'websocket'):
+                transports.append(WebSocketTransport(server))
+            if transport in ('auto', 'eventsource'):
+                transports.append(EventSourceTransport(server))
+            self._notif_listener = NotificationListener(transports, callback, on_open=on_open)
+        self._closed = False
+
+    def run(self):
+        if self._notif_listener is None:
+            logger.info('Polling sessions instead of listening for notifications')
+        else:
+            try:
+                self._notif_listener.run_forever()
+                return
+            except TransportUnavailableError:
+                if self._closed:
+                    return
+                logger.warning('Could not listen for notifications, falling back to polling sessions', exc_info=True)
+        self._poller.run_forever()
+
+    def close(self):
+        """Makes run() return. Can be called from any thread."""
+        self._closed = True
+        self._poller.close()
+        if self._notif_listener:
+            self._notif_listener.close()
+
+
+class _Runner:
+    """Runs the pipeline, reconfiguring it when the config file is reloaded.
+
+    Switching servers rebuilds the pipeline, but keeps what doesn't depend on
+    the server, e.g. the connections to the Chromecasts.
+    """
+
+    def __init__(
+        self,
+        args: argparse.Namespace,
+        db: Database,
+        auth_token: str,
+        server: PlexServer,
+        config: Config,
+    ):
+        self._args = args
+        self._db = db
+        self._auth_token = auth_token
+        self._config = config
+        self._cc_monitor = _start_chromecast_monitor(args.chromecast)
+        # Held while reloading, and while replacing the pipeline.
+        self._lock = threading.Lock()
+        self._server = server
+        self._pipeline = self._build_pipeline(server)
+        self._listener: Optional[_Listener] = None
+        # Set on reload when the listener has to be restarted on that server.
+        self._next_server: Optional[PlexServer] = None
+
+    def _build_pipeline(self, server: PlexServer) -> _Pipeline:
+        return _build_pipeline(server, self._db, self._cc_monitor, self._args.lean_sessions, self._config)
+
+    def status(self) -> Dict[str, Any]:
+        return self._pipeline.status()
+
+    def dump_trace(self, reason: str):
+        self._pipeline.trace.dump(reason, force=True, background=True)
+
+    def run(self, on_ready: Callable[[], None]):
+        """Listens until the server stops answering."""
+        on_open: Optional[Callable[[], None]] = on_ready
+        while True:
+            with self._lock:
+                listener = self._listener = _Listener(
+                    self._server,
+                    self._pipeline.queue.put,
+                    self._db,
+                    poll=self._args.poll,
+                    transport=self._args.transport,
+                    on_open=on_open,
+                )
+            on_open = None
+            listener.run()
+
+            with self._lock:
+                server, self._next_server = self._next_server, None
+                if server is None:
+                    return
+                previous = self._switch_pipeline(server)
+            previous.close()
+            logger.info(f'Switched to server {server.friendlyName}')
+
+    def _switch_pipeline(self, server: PlexServer) -> _Pipeline:
+        """Called with the lock held. Returns the previous pipeline to close."""
+        previous = self._pipeline
+        self._server = server
+        self._pipeline = self._build_pipeline(server)
+        return previous
+
+    def reload(self):
+        previous = self._reload()
+        if previous:
+            previous.close()
+            logger.info(f'Switched to server {self._server.friendlyName}')
+
+    def _reload(self) -> Optional[_Pipeline]:
+        """Returns the previous pipeline if it was replaced right away."""
+        with self._lock:
+            config = _reload_config(self._args.config, self._config, debug=self._args.debug)
+            if config is None:
+                return None
+            self._pipeline.reconfigure(config)
+
+            previous, self._config = self._config, config
+            if previous.server == config.server:
+                return None
+            if self._args.server:
+                logger.warning(f"Not switching servers: '{self._args.server}' was given on the command line")
+                return None
+
+            logger.info('Looking up the new Plex server...')
+            try:
+                server = self._connect(config.server)
+            except NotFound:
+                _log_server_not_found(config.server)
+                # Try again on the next reload.
+                self._config = config._replace(server=previous.server)
+                return None
+            if server.machineIdentifier == self._server.machineIdentifier:
+                return None
+            if self._listener is None:
+                # run() hasn't started listening yet, and will on this server.
+                return self._switch_pipeline(server)
+            self._next_server = server
+            self._listener.close()
+            return None
+
+    def _connect(self, server_name: Optional[str]) -> PlexServer:
+        resource = _lookup_server(self._auth_token, server_name)
+        if not resource:
+            raise NotFound(f'no server named {server_name}')
+        server = _connect_server(resource)
+        _limit_requests(server, self._args)
+        return server
+
+
+def _reload_config(path: Path, current: Config, debug: bool) -> Optional[Config]:
+    """Reads the config file again and applies the logging settings.
+
+    Debug logging stays on if it was enabled on the command line. Returns None
+    if the file is invalid, in which case nothing changes.
+    """
+    try:
+        config = load_config(path)
+    except ConfigError as e:
+        logger.error(f'Could not reload the config: {e}')
+        return None
+    changed = changed_settings(current, config)
+    logger.info(f"Reloaded the config ({', '.join(sorted(changed)) or 'no'} changes)")
+    _reconfigure_logging(debug=debug or config.debug)
+    return config
+
+
+def _reload_on_sighup(reload: Callable[[], None]):
+    if hasattr(signal, 'SIGHUP'):  # Not on Windows.
+        # Reloading can block, e.g. to connect to another server.
+        def on_sighup(signum, frame):
+            threading.Thread(target=reload, name='Reload', daemon=True).start()
+        signal.signal(signal.SIGHUP, on_sighup)
+
+
+def _start_control_server(status: Callable[[], StatusDict]) -> Optional[ControlServer]:
+    if not hasattr(socket, 'AF_UNIX'):  # Not on Windows.
+        return None
+    control_server = ControlServer(_SOCKET_PATH, status)
+    try:
+        control_server.start()
+    except OSError:
+        logger.warning(f"Could not listen on {_SOCKET_PATH}, the 'status' command won't work", exc_info=True)
+        return None
+    return control_server
+
+
+def _run_sharded(
+    args: argparse.Namespace,
+    db: Database,
+    server: PlexServer,
+    config: Config,
+    started_at: float,
+) -> Optional[int]:
+    # Sessions are independent from each other, so each worker gets to handle
+    # its share of them with its own interpreter, and its own GIL.
+    logger.info(f'Handling sessions with {args.workers} worker processes')
+    workers = ShardedWorkers(
+        args.workers,
+        _run_worker,
+        args=(
+            server._baseurl,
+            server._token,
+            args.max_requests_per_sec / args.workers,
+            args.chromecast,
+            args.lean_sessions,
+            args.config,
+            args.debug,
+            args.log_format == 'json',
+        ),
+    )
+    workers.start()
+
+    def forward_signal(signum, frame):
+        for pid in workers.pids():
+            os.kill(pid, signum)
+
+    if hasattr(signal, 'SIGUSR1'):  # Not on Windows.
+        signal.signal(signal.SIGUSR1, forward_signal)
+
+    # The workers reload the config themselves.
+    current = config
+
+    def reload():
+        nonlocal current
+        new_config = _reload_config(args.config, current, debug=args.debug)
+        if new_config is None:
+            return
+        if new_config.server != current.server:
+            logger.warning('Switching servers requires a restart when running several workers')
+        current = new_config
+
+    if hasattr(signal, 'SIGHUP'):  # Not on Windows.
+        def on_sighup(signum, frame):
+            forward_signal(signum, frame)
+            threading.Thread(target=reload, name='Reload', daemon=True).start()
+        signal.signal(signal.SIGHUP, on_sighup)
+
+    def status() -> StatusDict:
+        return {
+            'uptime_sec': time.monotonic() - started_at,
+            'workers': workers.stats(),
+            'plex_requests': _request_stats(server),
+        }
+
+    def on_ready():
+        logger.info(f'Ready (startup took {time.monotonic() - started_at:.2f}s)')
+
+    control_server = _start_control_server(status)
+    try:
+        _Listener(server, workers.put, db, poll=args.poll, transport=args.transport, on_open=on_ready).run()
+    finally:
+        workers.close()
+        if control_server:
+            control_server.close()
+    return None
 
 
-def _main():
-    db = Database(shelve.open(str(_DATABASE_PATH)))
-    app = PlexApplication(name=_APP_NAME, identifier=db.app_id)
+def _run_worker(
+    index: int,
+    alerts: 'multiprocessing.Queue[Optional[NotificationContainerDict]]',
+    baseurl: str,
+    token: str,
+    rate_per_sec: float,
+    chromecast: bool,
+    lean_sessions: bool,
+    config_path: Path,
+    debug: bool,
+    json_lines: bool,
+):
+    # The parent stops the workers once interrupted itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threading.current_thread().name = f'Worker-{index}'
+    log_listener = _setup_logging(debug=debug, json_lines=json_lines)
+    log_listener.start()
+
+    # The intro markers are shared through the database, which the parent
+    # process and the other workers also read from and write to.
+    store = SqliteStore.open(_DATABASE_PATH)
+    try:
+        # The parent already validated the config, but it may have changed
+        # since, in which case the defaults are good enough until the reload.
+        try:
+            config = load_config(config_path)
+        except ConfigError:
+            config = Config()
+        _reconfigure_logging(debug=debug or config.debug)
+
+        db = Database(store, intro_markers=store.intro_markers, skip_history=store.skip_history)
+        session = _make_rate_limited_session(rate_per_sec) if rate_per_sec > 0 else None
+        server = PlexServer(baseurl, token, session=session)
+        # Each worker discovers the Chromecasts on its own, rather than sharing
+        # the lookups with the others: connections to them are sockets owned
+        # by the process that seeks, and forwarding seeks to a single process
+        # would serialize the workers again. This costs a zeroconf browser per
+        # worker, while connections are only opened to the players of the
+        # worker's own sessions, and closed once idle.
+        cc_monitor = _start_chromecast_monitor(chromecast)
+        pipeline = _build_pipeline(server, db, cc_monitor, lean_sessions, config)
+        if hasattr(signal, 'SIGUSR1'):  # Not on Windows.
+            signal.signal(
+                signal.SIGUSR1,
+                lambda signum, frame: pipeline.trace.dump('SIGUSR1', force=True, background=True),
+            )
+
+        def reload():
+            nonlocal config
+            new_config = _reload_config(config_path, config, debug=debug)
+            if new_config is not None:
+                pipeline.reconfigure(new_config)
+                config = new_config
+        _reload_on_sighup(reload)
+
+        for alert in iter(alerts.get, None):
+            pipeline.queue.put(alert)
+    finally:
+        store.close()
+        _stop_logging(log_listener)
+
+
+class _JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueues records as is, so that they're formatted by the listener.
+
+    The base implementation formats the message on the logging thread, which
+    is exactly what we want to avoid. Records are only ever consumed in this
+    process, so they don't need to be made picklable either. Note the logged
+    arguments must then not be mutated after the fact.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+# Where the listener writes the records, reconfigured when debug logging is
+# toggled by reloading the config.
+_log_handler: Optional[logging.Handler] = None
+
+
+def _setup_logging(debug: bool, json_lines: bool) -> QueueListener:
+    """Routes logging through a queue to a listener, which has to be started.
+
+    Formatting and writing the records thus happen on the listener's thread.
+    """
+    global _log_handler
+    handler = logging.StreamHandler()
+    if json_lines:
+        handler.setFormatter(_JsonLinesFormatter())
+    _log_handler = handler
+    _reconfigure_logging(debug)
+
+    log_queue: 'queue.Queue[logging.LogRecord]' = queue.Queue()
+    logging.root.addHandler(_DeferredQueueHandler(log_queue))
+    return QueueListener(log_queue, handler)
+
+
+def _reconfigure_logging(debug: bool):
+    if debug:
+        log_level = logging.DEBUG
+        log_format = '%(asctime)s - %(threadName)s - %(name)s - %(funcName)s - %(levelname)s - %(message)s'
+        log_datefmt = None  # Use the default.
+    else:
+        log_level = logging.INFO
+        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        log_datefmt = '%Y-%m-%d %H:%M:%S'  # No milliseconds.
 
+    # Disable logging from third-party packages, unless debugging.
+    logger_name: str
+    logger_inst: logging.Logger
+    for logger_name, logger_inst in logging.root.manager.loggerDict.items():  # type: ignore
+        if isinstance(logger_inst, logging.PlaceHolder):
+            continue
+        if not logger_name.startswith(__package__):
+            if not any(isinstance(h, logging.NullHandler) for h in logger_inst.handlers):
+                logger_inst.addHandler(logging.NullHandler())
+            logger_inst.propagate = debug
+
+    if _log_handler and not isinstance(_log_handler.formatter, _JsonLinesFormatter):
+        _log_handler.setFormatter(logging.Formatter(log_format, log_datefmt))
+    logging.root.setLevel(log_level)
+
+
+def _stop_logging(listener: QueueListener):
+    """Flushes the queue and logs synchronously from then on."""
+    listener.stop()
+    for handler in list(logging.root.handlers):
+        if isinstance(handler, _DeferredQueueHandler):
+            logging.root.removeHandler(handler)
+    for handler in listener.handlers:
+        logging.root.addHandler(handler)
+
+
+def _main():
     parser = argparse.ArgumentParser(_APP_ARGV0, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--debug', help='enable debug logging', action='store_true')
+    parser.add_argument('--log-format', help='format of the log lines', choices=['text', 'json'], default='text')
 
-    subparsers = parser.add_subparsers(title='subcommands', metavar='{auth,run}')
+    subparsers = parser.add_subparsers(title='subcommands', metavar='{auth,run,status}')
     subparsers.required = True
 
     parser_auth = subparsers.add_parser('auth', help='authorize this application to access your Plex account')
-    parser_auth.set_defaults(func=partial(cmd_auth, db=db, app=app))
+    parser_auth.set_defaults(func=cmd_auth)
 
     parser_debug_info = subparsers.add_parser('debug-info')
-    parser_debug_info.set_defaults(func=partial(cmd_debug_info, db=db, app=app))
+    parser_debug_info.set_defaults(func=cmd_debug_info)
+
+    parser_status = subparsers.add_parser('status', help='show what the running instance is doing')
+    parser_status.set_defaults(func=cmd_status)
+    parser_status.add_argument('--json', help='print the raw status as JSON', action='store_true')
 
     parser_run = subparsers.add_parser('run', help='monitor your shows and automatically skip intros')
-    parser_run.set_defaults(func=partial(cmd_run, db=db, app=app))
+    parser_run.set_defaults(func=cmd_run)
     parser_run.add_argument('--server', help='name of your server (default: the first server Skippex finds)')
+    parser_run.add_argument(
+        '--config',
+        help='settings file, reloaded on SIGHUP (see the README)',
+        type=Path,
+        default=_CONFIG_PATH,
+    )
+    parser_run.add_argument(
+        '--poll',
+        help='poll sessions instead of listening for notifications',
+        action='store_true',
+    )
+    parser_run.add_argument(
+        '--transport',
+        help='how to listen for notifications (auto tries the WebSocket, then the event stream, e.g. if a proxy '
+             'blocks WebSockets, then falls back to polling)',
+        choices=['auto', 'websocket', 'eventsource'],
+        default='auto',
+    )
+    parser_run.add_argument(
+        '--no-chromecast',
+        help="don't discover Chromecasts (only Plex players will be seeked)",
+        dest='chromecast',
+        action='store_false',
+    )
+    parser_run.add_argument(
+        '--lean-sessions',
+        help='parse only the needed fields of sessions, rather than going through plexapi (uses less CPU)',
+        action='store_true',
+    )
+    parser_run.add_argument(
+        '--max-requests-per-sec',
+        help='limit on the rate of requests to the Plex server, with bursts up to twice that (0 for no limit)',
+        type=float,
+        default=20,
+    )
+    parser_run.add_argument(
+        '--workers',
+        help='number of processes handling the sessions (for servers with many concurrent sessions)',
+        type=int,
+        default=1,
+    )
 
     args = parser.parse_args()
 
-    if args.debug:
-        log_level = logging.DEBUG
-        log_format = '%(asctime)s - %(threadName)s - %(name)s - %(funcName)s - %(levelname)s - %(message)s'
-        log_datefmt = None  # Use the default.
-    else:
-        log_level = logging.INFO
-        log_format = '%(asctime)s - %(levelname)s - %(message)s'
-        log_datefmt = '%Y-%m-%d %H:%M:%S'  # No milliseconds.
+    log_listener = _setup_logging(debug=args.debug, json_lines=args.log_format == 'json')
+    log_listener.start()
+    try:
+        _run_command(args)
+    finally:
+        _stop_logging(log_listener)
 
-        # Disable logging from third-party packages.
-        logger_name: str
-        logger_inst: logging.Logger
-        for logger_name, logger_inst in logging.root.manager.loggerDict.items():  # type: ignore
-            if isinstance(logger_inst, logging.PlaceHolder):
-                continue
-            if not logger_name.startswith(__package__):
-                logger_inst.addHandler(logging.NullHandler())
-                logger_inst.propagate = False
 
-    logging.basicConfig(
-        level=log_level,
-        format=log_format,
-        datefmt=log_datefmt,
-    )
+def _run_command(args: argparse.Namespace):
+    # The database can be shared between processes, but there can only be one
+    # instance of the run command at a time.
+    store = SqliteStore.open(_DATABASE_PATH, legacy_shelf_path=_LEGACY_DATABASE_PATH)
+    try:
+        db = Database(store, intro_markers=store.intro_markers, skip_history=store.skip_history)
+        app = PlexApplication(name=_APP_NAME, identifier=db.app_id)
+        if args.func is cmd_run:
+            with PidFile(piddir=_PID_DIR, pidname=_PID_NAME):
+                exit_code = args.func(args, db, app)
+        else:
+            exit_code = args.func(args, db, app)
+    finally:
+        store.close()
 
-    sys.exit(args.func(args))
+    sys.exit(exit_code)
 
 
 def main():
     try:
-        with PidFile(piddir=_PID_DIR, pidname=_PID_NAME):
-            _main()
+        _main()
     except PidFileError:
         logger.error(
             f'Another instance of {_APP_NAME} is already running.\n'
@@ -0,0 +1,57 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Set
+
+
+class ConfigError(Exception):
+    pass
+
+
+class Config(NamedTuple):
+    """Settings read from the config file, which can be reloaded at runtime."""
+
+    # Name of the server to connect to, None for the first one found.
+    server: Optional[str] = None
+    debug: bool = False
+    # How long a session can go without notifications before it's removed.
+    removal_timeout_sec: float = 20
+    # How long to wait for Plex players to answer seeks.
+    player_timeout_sec: float = 5
+
+
+def load_config(path: Path) -> Config:
+    """Reads the JSON config file, if any. Missing settings get their default.
+
+    Raises ConfigError if the file is invalid.
+    """
+    try:
+        with path.open() as f:
+            content = json.load(f)
+    except FileNotFoundError:
+        return Config()
+    except (OSError, ValueError) as e:
+        raise ConfigError(f'could not read {path}: {e}') from e
+
+    if not isinstance(content, dict):
+        raise ConfigError(f'{path} must contain a JSON object')
+    unknown = content.keys() - Config._fields
+    if unknown:
+        raise ConfigError(f'unknown settings in {path}: {", ".join(sorted(unknown))}')
+
+    settings: Dict[str, Any] = {}
+    for name, value in content.items():
+        default = Config._field_defaults[name]
+        if name == 'server':
+            valid = value is None or isinstance(value, str)
+        elif isinstance(default, bool):
+            valid = isinstance(value, bool)
+        else:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+        if not valid:
+            raise ConfigError(f'invalid value for {name} in {path}: {value!r}')
+        settings[name] = value
+    return Config(**settings)
+
+
+def changed_settings(old: Config, new: Config) -> Set[str]:
+    return {name for name in Config._fields if getattr(old, name) != getattr(new, name)}
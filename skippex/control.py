@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import socketserver
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+StatusDict = Dict[str, Any]
+
+
+class ControlServer:
+    """Answers status queries from other processes over a Unix domain socket.
+
+    Each connection gets a single JSON document, built by calling status from
+    the connection's thread, after which it's closed.
+    """
+
+    def __init__(self, path: Path, status: Callable[[], StatusDict]):
+        self.path = path
+        self._status = status
+        self._server: Optional[socketserver.BaseServer] = None
+
+    def start(self):
+        # There can only be one instance running (see the PID file), so the
+        # socket can only be left over from an instance that crashed.
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+        status = self._status
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    response = json.dumps(status())
+                except Exception:
+                    logger.exception('Could not build the status')
+                    response = json.dumps({'error': 'could not build the status'})
+                self.wfile.write(response.encode() + b'\n')
+
+        server = socketserver.ThreadingUnixStreamServer(str(self.path), Handler)
+        server.daemon_threads = True
+        os.chmod(str(self.path), 0o600)  # Only for the user running Skippex.
+        self._server = server
+
+        thread = threading.Thread(target=server.serve_forever, name='ControlServer', daemon=True)
+        thread.start()
+        logger.debug('Listening for status queries on %s', self.path)
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def query_status(path: Path, timeout_sec: float = 5) -> StatusDict:
+    """Raises OSError if no instance is listening on the socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout_sec)
+        sock.connect(str(path))
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks))
@@ -1,23 +1,464 @@
-from dataclasses import replace
 import logging
-from typing import Set, Tuple, cast
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional, Set, Tuple, cast
 
-from .seekables import SeekableNotFoundError, SeekableProvider
+from typing_extensions import Literal
+
+from .expiring import ExpiringDict
+from .instrumentation import Histogram
+from .ratelimit import Priority, prioritized
+from .scheduling import ScheduledCall, Scheduler, ThreadingScheduler
+from .seekables import Seekable, SeekableNotFoundError, SeekableProvider, SeekSerializer
 from .sessions import (
     EpisodeSession,
     Session,
     SessionExtrapolator,
+    SessionKey,
     SessionListener,
 )
+from .stores import SkipHistory, SkipRecord
+from .traces import TraceBuffer
 
 
 logger = logging.getLogger(__name__)
 
+PlayerId = str
+# Plex reuses session keys, so state about a session is kept by session key and
+# ratingKey: a reused key then doesn't inherit the state of the previous media.
+StateKey = Tuple[SessionKey, str]
+
+
+def _state_key(session: Session) -> StateKey:
+    return session.key, session.rating_key
+
+
+class _PendingSeek(NamedTuple):
+    player_id: PlayerId
+    target_ms: int
+    sent_at: float  # Monotonic, in seconds.
+
+
+class _Skip:
+    """A skip, from sending its seek until the seek is confirmed or given up on."""
+
+    __slots__ = ('session', 'seekable', 'target_ms', 'first_sent_at', 'sent_at', 'deadline_at', 'attempts',
+                 'state', 'timer')
+
+    def __init__(self, session: 'EpisodeSession', seekable: Seekable, target_ms: int, sent_at: float):
+        self.session = session
+        self.seekable = seekable
+        self.target_ms = target_ms
+        self.first_sent_at = sent_at
+        # Of the latest attempt. All times are monotonic, in seconds.
+        self.sent_at = sent_at
+        self.deadline_at = sent_at
+        self.attempts = 1
+        self.state: Literal['pending', 'confirmed', 'failed'] = 'pending'
+        self.timer: Optional[ScheduledCall] = None
+
+    def cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+
+class SeekLatencyEstimator:
+    """Keeps a rolling estimate of the seek latency of each player.
+
+    The latency of a seek is the time between sending the command and the
+    player actually seeking. It's learned from the first session observed past
+    the seek target: since playback resumed at the target, the time spent
+    playing past it is subtracted from the time elapsed since sending the seek.
+    """
+
+    def __init__(
+        self,
+        smoothing: float = 0.3,
+        max_latency_ms: int = 5000,
+        pending_timeout_sec: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._smoothing = smoothing
+        self._max_latency_ms = max_latency_ms
+        self._pending_timeout_sec = pending_timeout_sec
+        self._clock = clock
+        self._estimates_ms: Dict[PlayerId, float] = {}
+        # Seeks whose session is never observed again are forgotten.
+        self._pending: ExpiringDict[SessionKey, _PendingSeek] = ExpiringDict(
+            ttl_sec=pending_timeout_sec, max_size=1000, clock=clock,
+        )
+        self._recent_ms: Deque[int] = deque(maxlen=20)
+
+    def estimate_ms(self, player_id: PlayerId) -> int:
+        """Returns the estimated seek latency of the player, 0 if unknown."""
+        return int(self._estimates_ms.get(player_id, 0))
+
+    def on_seek_sent(self, session_key: SessionKey, player_id: PlayerId, target_ms: int):
+        self._pending[session_key] = _PendingSeek(player_id, target_ms, self._clock())
+
+    def on_offset_observed(
+        self,
+        session_key: SessionKey,
+        view_offset_ms: int,
+        observed_at: Optional[float] = None,
+    ) -> Optional[int]:
+        """Returns the measured latency if this observation completed a seek."""
+        pending = self._pending.get(session_key)
+        if not pending:
+            return None
+
+        if observed_at is None:
+            observed_at = self._clock()
+        elapsed_ms = (observed_at - pending.sent_at) * 1000
+        if elapsed_ms < 0:
+            # Observed before the seek was even sent.
+            return None
+
+        if view_offset_ms < pending.target_ms:
+            # The seek hasn't happened yet, or it never will.
+            if elapsed_ms > self._pending_timeout_sec * 1000:
+                self._pending.pop(session_key, None)
+            return None
+
+        self._pending.pop(session_key, None)
+        played_since_seek_ms = view_offset_ms - pending.target_ms
+        latency_ms = int(min(max(elapsed_ms - played_since_seek_ms, 0), self._max_latency_ms))
+
+        self._recent_ms.append(latency_ms)
+        previous = self._estimates_ms.get(pending.player_id)
+        if previous is None:
+            self._estimates_ms[pending.player_id] = latency_ms
+        else:
+            self._estimates_ms[pending.player_id] = (
+                self._smoothing * latency_ms + (1 - self._smoothing) * previous
+            )
+        logger.debug(
+            'Measured seek latency of %sms for player %s (estimate is now %sms)',
+            latency_ms, pending.player_id, self.estimate_ms(pending.player_id),
+        )
+        return latency_ms
+
+    def discard(self, session_key: SessionKey):
+        self._pending.pop(session_key, None)
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'estimates_ms': {p: int(ms) for p, ms in list(self._estimates_ms.items())},
+            'recent_ms': list(self._recent_ms),
+        }
+
+
+class DriftStats:
+    """Statistics on the error of extrapolated view offsets.
+
+    The drift of an observation is the reported view offset minus the offset
+    extrapolated from the previous observation, at the same point in time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0
+        self.total_abs_ms = 0
+        self.max_abs_ms = 0
+        self.last_ms = 0
+
+    def record(self, drift_ms: int):
+        self.count += 1
+        self.total_ms += drift_ms
+        self.total_abs_ms += abs(drift_ms)
+        self.max_abs_ms = max(self.max_abs_ms, abs(drift_ms))
+        self.last_ms = drift_ms
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else 0,
+            'mean_abs_ms': self.total_abs_ms / self.count if self.count else 0,
+            'max_abs_ms': self.max_abs_ms,
+            'last_ms': self.last_ms,
+        }
+
 
 class AutoSkipper(SessionListener, SessionExtrapolator):
-    def __init__(self, seekable_provider: SeekableProvider):
-        self._skipped: Set[Session] = set()
+    def __init__(
+        self,
+        seekable_provider: SeekableProvider,
+        latency_estimator: Optional[SeekLatencyEstimator] = None,
+        skip_history: Optional[SkipHistory] = None,
+        seek_serializer: Optional[SeekSerializer] = None,
+        trace: Optional[TraceBuffer] = None,
+        late_skip_threshold_ms: int = 2000,
+        state_ttl_sec: float = 6 * 3600,
+        max_sessions: int = 1000,
+        extrapolation_step_ms: int = 1000,
+        scheduler: Optional[Scheduler] = None,
+        confirm_timeout_ms: int = 12000,
+        confirm_tolerance_ms: int = 1000,
+        max_seek_attempts: int = 3,
+        prewarm_lead_ms: int = 10000,
+    ):
+        # The source of time, and of the timers, of everything below.
+        self._scheduler = scheduler or ThreadingScheduler()
+        clock = self._scheduler.now
+
+        # Keys of the sessions the dispatcher tracks, i.e. that it hasn't
+        # removed yet. It removes the sessions it stops hearing about, so this
+        # is as large as the actual concurrency.
+        self._live: Set[SessionKey] = set()
+
+        # The state below is cleaned up on session removal, but removals can
+        # be missed (e.g. while the WebSocket is down), so it's also bounded:
+        # past max_sessions, the state of sessions already removed is evicted.
+        # That of live sessions never is, lest they get skipped again.
+        def make_state() -> ExpiringDict:
+            return ExpiringDict(
+                ttl_sec=state_ttl_sec, max_size=max_sessions, clock=clock, pinned=self._is_live,
+            )
+
+        # Values are the sessions that were skipped.
+        self._skipped: ExpiringDict[StateKey, Session] = make_state()
+        # Sessions for which we already reported that we couldn't skip.
+        self._unskippable: ExpiringDict[StateKey, bool] = make_state()
         self._sp = seekable_provider
+        self._seeker = seek_serializer or SeekSerializer(clock=clock)
+        self._skip_history = skip_history
+        self._latency = latency_estimator or SeekLatencyEstimator(clock=clock)
+        self._clock = clock
+        self._extrapolation_step_ms = extrapolation_step_ms
+        self._trace = trace or TraceBuffer()
+        # Skips that happen later than this past the point where we'd have
+        # wanted to seek trigger a trace dump.
+        self._late_skip_threshold_ms = late_skip_threshold_ms
+        # Sessions observed playing before the point where we'd seek, i.e. for
+        # which a late skip is on us.
+        self._approached: ExpiringDict[StateKey, bool] = make_state()
+
+        # Latest observed session for each key, to measure the drift of the
+        # offsets we extrapolate from it.
+        self._anchors: ExpiringDict[StateKey, EpisodeSession] = make_state()
+        self.drift_stats = DriftStats()
+
+        # A seek is confirmed once the session is observed past its target.
+        # Unconfirmed seeks are retried past a deadline, which is checked on
+        # observations, and with a timer. Notifications come every 10
+        # seconds, so the deadline defaults to a bit more.
+        self._skips: ExpiringDict[StateKey, _Skip] = make_state()
+        self._skip_lock = threading.Lock()
+        self._confirm_timeout_ms = confirm_timeout_ms
+        self._confirm_tolerance_ms = confirm_tolerance_ms
+        self._max_seek_attempts = max_seek_attempts
+        self.time_to_confirm_ms = Histogram([250, 500, 1000, 2000, 5000, 10000, 20000, 30000])
+
+        # Seekables resolved and prewarmed in the background, this long before
+        # the seek, so that the seek doesn't wait on player lookups or
+        # connections. 0 disables prewarming. Entries expire quickly since a
+        # seekable can go stale (e.g. the Chromecast disconnecting).
+        self._prewarm_lead_ms = prewarm_lead_ms
+        self._prewarmed: ExpiringDict[StateKey, Future] = ExpiringDict(
+            ttl_sec=2 * prewarm_lead_ms / 1000, max_size=max_sessions, clock=clock, pinned=self._is_live,
+        )
+        self._prewarm_executor: Optional[ThreadPoolExecutor] = None
+        if prewarm_lead_ms > 0:
+            self._prewarm_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='Prewarm')
+
+    def close(self):
+        """Stops the prewarming threads, e.g. before being replaced."""
+        if self._prewarm_executor:
+            self._prewarm_executor.shutdown(wait=False)
+
+    def _record_drift(self, session: EpisodeSession):
+        anchor = self._anchors.get(_state_key(session))
+        if anchor and anchor.state == 'playing' and session.observed_at > anchor.observed_at:
+            predicted_ms = anchor.current_view_offset_ms(session.observed_at)
+            drift_ms = session.view_offset_ms - predicted_ms
+            self.drift_stats.record(drift_ms)
+            logger.debug('Session %s: extrapolation drift of %sms', session.key, drift_ms)
+        if not anchor or session.observed_at > anchor.observed_at:
+            self._anchors[_state_key(session)] = session
+
+    def _check_missed_skip(self, session: EpisodeSession):
+        """Dumps the trace if the session played through its intro unskipped.
+
+        Only counts if the session was observed before the intro and should
+        have been playing it since, rather than e.g. manually seeked past it.
+        """
+        anchor = self._anchors.get(_state_key(session))
+        intro_marker = session.intro_marker
+        if (
+            anchor is None
+            or intro_marker is None
+            or anchor.state != 'playing'
+            or _state_key(session) in self._skipped
+            or _state_key(session) in self._unskippable
+            or session.observed_at <= anchor.observed_at
+        ):
+            return
+        seek_at_ms = intro_marker.start - self._seek_lead_ms(session)
+        if (
+            anchor.view_offset_ms < seek_at_ms
+            and anchor.current_view_offset_ms(session.observed_at) >= seek_at_ms
+            and session.view_offset_ms >= intro_marker.end
+        ):
+            logger.warning('Session %s: missed the intro', session.key)
+            self._trace.record(session.key, 'skip_missed')
+            self._trace.dump(f'missed skip for session {session.key}', background=True)
+
+    def _start_confirmation(self, session: EpisodeSession, seekable: Seekable, target_ms: int):
+        key = _state_key(session)
+        skip = _Skip(session, seekable, target_ms, self._clock())
+        with self._skip_lock:
+            previous = self._skips.get(key)
+            if previous:
+                previous.cancel_timer()
+            self._skips[key] = skip
+            self._schedule_deadline(key, skip)
+
+    def _schedule_deadline(self, key: StateKey, skip: _Skip):
+        """Called with the skip lock held, when a seek of the skip was sent."""
+        # Slower players get more time.
+        timeout_ms = self._confirm_timeout_ms + 2 * self._latency.estimate_ms(skip.session.player_id)
+        skip.deadline_at = skip.sent_at + timeout_ms / 1000
+        attempt = skip.attempts
+        skip.timer = self._scheduler.call_later(
+            skip.deadline_at - self._clock(),
+            lambda: self._on_confirm_deadline(key, skip, attempt),
+        )
+
+    def _observe_skip(self, session: EpisodeSession):
+        """Confirms the session's pending skip, or retries it if it's overdue."""
+        key = _state_key(session)
+        with self._skip_lock:
+            skip = self._skips.get(key)
+            if skip is None or skip.state != 'pending' or session.observed_at < skip.sent_at:
+                return
+            if session.view_offset_ms >= skip.target_ms - self._confirm_tolerance_ms:
+                self._confirm_skip(key, skip, session.observed_at)
+                return
+            if session.observed_at < skip.deadline_at:
+                return
+            retry = self._next_attempt(key, skip)
+        if retry:
+            # We're on the session discovery's path: don't hold it up with
+            # player lookups.
+            self._scheduler.call_later(0, lambda: self._retry_skip(key, skip))
+
+    def _on_confirm_deadline(self, key: StateKey, skip: _Skip, attempt: int):
+        # Some players tell where they're at, e.g. Chromecasts.
+        offset_ms = skip.seekable.offset_ms()
+        with self._skip_lock:
+            if self._skips.get(key) is not skip or skip.state != 'pending' or skip.attempts != attempt:
+                return
+            skip.timer = None
+            if offset_ms is not None and offset_ms >= skip.target_ms - self._confirm_tolerance_ms:
+                self._confirm_skip(key, skip, self._clock())
+                return
+            retry = self._next_attempt(key, skip)
+        if retry:
+            self._retry_skip(key, skip)
+
+    def _confirm_skip(self, key: StateKey, skip: _Skip, confirmed_at: float):
+        """Called with the skip lock held."""
+        skip.cancel_timer()
+        skip.state = 'confirmed'
+        elapsed_ms = max((confirmed_at - skip.first_sent_at) * 1000, 0)
+        self.time_to_confirm_ms.observe(elapsed_ms)
+        self._trace.record(key[0], 'skip_confirmed', '%.0fms' % elapsed_ms)
+        logger.debug('Session %s: skip confirmed after %.0fms (%s attempts)', key[0], elapsed_ms, skip.attempts)
+
+    def _next_attempt(self, key: StateKey, skip: _Skip) -> bool:
+        """Called with the skip lock held, once the skip is overdue.
+
+        Returns whether to retry it, or marks it as failed.
+        """
+        skip.cancel_timer()
+        if skip.attempts >= self._max_seek_attempts:
+            skip.state = 'failed'
+            logger.warning('Session %s: could not confirm the skip after %s attempts', key[0], skip.attempts)
+            self._trace.record(key[0], 'skip_failed')
+            self._trace.dump(f'failed skip for session {key[0]}', background=True)
+            return False
+        skip.attempts += 1
+        # Set now, so that observations don't trigger the retry again.
+        skip.sent_at = self._clock()
+        skip.deadline_at = float('inf')
+        return True
+
+    def _trace_seek_outcome(self, session_key: str) -> Callable[[str], None]:
+        # Seeks are only queued by the serializer, whose thread reports back
+        # whether the player answered.
+        def on_done(outcome: str):
+            self._trace.record(session_key, f'seek_{outcome}')
+        return on_done
+
+    def _retry_skip(self, key: StateKey, skip: _Skip):
+        session = skip.session
+        try:
+            seekable = self._sp.provide_alternate_seekable(session, skip.seekable)
+        except SeekableNotFoundError as e:
+            logger.debug('Session %s: no alternate way to seek (%r), retrying the same', session.key, e)
+            seekable = skip.seekable
+
+        logger.info(
+            'Session %s: skip not confirmed, seeking again (attempt %s of %s)',
+            session.key, skip.attempts, self._max_seek_attempts,
+        )
+        self._trace.record(session.key, 'seek_retried', f'attempt {skip.attempts}')
+        self._seeker.seek(
+            session.player_id, seekable, skip.target_ms, retry=True, on_done=self._trace_seek_outcome(session.key),
+        )
+        self._latency.on_seek_sent(session.key, session.player_id, skip.target_ms)
+
+        with self._skip_lock:
+            skip.seekable = seekable
+            if self._skips.get(key) is skip and skip.state == 'pending':
+                self._schedule_deadline(key, skip)
+
+    def _maybe_prewarm(self, session: EpisodeSession, view_offset_ms: int, seek_at_ms: int):
+        if not self._prewarm_executor or view_offset_ms < seek_at_ms - self._prewarm_lead_ms:
+            return
+        key = _state_key(session)
+        if key in self._prewarmed or key in self._unskippable:
+            return
+        logger.debug('Session %s: prewarming seekable', session.key)
+        self._trace.record(session.key, 'prewarm')
+        self._prewarmed[key] = self._prewarm_executor.submit(self._prewarm, session)
+
+    def _prewarm(self, session: EpisodeSession) -> Seekable:
+        # Not urgent: seeks and session fetches go first.
+        with prioritized(Priority.BACKGROUND):
+            seekable = self._sp.provide_seekable(session)
+            try:
+                seekable.prewarm()
+            except Exception as e:
+                logger.debug('Session %s: could not prewarm %s: %r', session.key, seekable, e)
+        return seekable
+
+    def _take_seekable(self, session: EpisodeSession) -> Seekable:
+        """Returns the prewarmed seekable for the session, or provides one."""
+        future = self._prewarmed.pop(_state_key(session), None)
+        if future is not None:
+            if not future.done():
+                # Never wait on it: it runs at background priority, and this
+                # runs under the discovery lock.
+                logger.debug('Session %s: prewarming not done in time', session.key)
+                future.cancel()
+            else:
+                try:
+                    return future.result()
+                except Exception as e:
+                    # Try again, the player may have shown up since.
+                    logger.debug('Session %s: prewarming failed: %r', session.key, e)
+        return self._sp.provide_seekable(session)
+
+    def _seek_lead_ms(self, session: EpisodeSession) -> int:
+        """How early to seek so that the player seeks right at the intro."""
+        return self._latency.estimate_ms(session.player_id)
 
     def trigger_extrapolation(self, session: Session, listener_accepted: bool) -> bool:
         # Note it's only useful to do this when the state is 'playing':
@@ -33,72 +474,190 @@ class AutoSkipper(SessionListener, SessionExtrapolator):
             return False
 
         session = cast(EpisodeSession, session)  # Safe because listener_accepted.
-        intro_marker = session.intro_marker()
+        intro_marker = session.intro_marker
 
-        if session.view_offset_ms >= intro_marker.end:
+        if session.current_view_offset_ms(self._clock()) >= intro_marker.end:
             logger.debug('No extrapolation: beyond intro')
             return False
 
         # The listener accepted the session, and it may have skipped the intro.
         # In that case, we don't wanna extrapolate the session.
-        return session not in self._skipped
+        return _state_key(session) not in self._skipped
 
     def extrapolate(self, session: Session) -> Tuple[Session, int]:
         session = cast(EpisodeSession, session)  # Safe thanks to trigger_extrapolation().
-        delay_ms = 1000
-        new_view_offset_ms = session.view_offset_ms + delay_ms
-        return replace(session, view_offset_ms=new_view_offset_ms), delay_ms
+        delay_ms = self._extrapolation_step_ms
+
+        # Land exactly on the point where we'd seek if it falls within this
+        # step, rather than up to a whole step later.
+        view_offset_ms = session.current_view_offset_ms(self._clock())
+        seek_at_ms = session.intro_marker.start - self._seek_lead_ms(session)
+        if view_offset_ms < seek_at_ms < view_offset_ms + delay_ms:
+            delay_ms = seek_at_ms - view_offset_ms
+
+        # The session carries its anchor, from which the view offset will be
+        # computed again once dispatched, so there's nothing to update.
+        return session, delay_ms
+
+    def _is_live(self, key: StateKey) -> bool:
+        return key[0] in self._live
 
     def accept_session(self, session: Session) -> bool:
+        # Every dispatched session gets removed eventually.
+        self._live.add(session.key)
+        reason = self._rejection_reason(session)
+        if reason:
+            logger.debug('Ignored; %s', reason)
+            self._trace.record(session.key, 'reject', reason)
+            return False
+        self._trace.record(session.key, 'accept')
+        return True
+
+    def _rejection_reason(self, session: Session) -> Optional[str]:
         if not isinstance(session, EpisodeSession):
             # Only TV shows have intro markers, other media don't interest us.
-            logger.debug('Ignored; not an episode')
-            return False
+            return 'not an episode'
 
-        if session in self._skipped:
-            logger.debug('Ignored; already skipped during this session')
-            return False
+        self._check_missed_skip(session)
+        self._record_drift(session)
+        # Only sessions fetched from the server make it here once skipped (we
+        # don't extrapolate them), so this sees the actual post-seek offsets.
+        self._latency.on_offset_observed(session.key, session.view_offset_ms, session.observed_at)
+        self._observe_skip(session)
+
+        if _state_key(session) in self._skipped:
+            return 'already skipped during this session'
 
         if session.state != 'playing':
-            logger.debug(f'Ignored; state is "{session.state}" instead of "playing"')
-            return False
+            return f'state is "{session.state}" instead of "playing"'
 
-        if not session.playable.hasIntroMarker:
-            logger.debug(f'Ignored; has no intro marker')
-            return False
+        if session.intro_marker is None:
+            return 'has no intro marker'
 
-        return True
+        if session.view_offset_ms < session.intro_marker.start - self._seek_lead_ms(session):
+            self._approached[_state_key(session)] = True
+        return None
 
     def on_session_activity(self, session: Session):
         session = cast(EpisodeSession, session)  # Safe thanks to accept_session().
-        logger.debug(f'session_activity: {session}')
+        logger.debug('session_activity: %s', session)
+
+        intro_marker = session.intro_marker
+        view_offset_ms = session.current_view_offset_ms(self._clock())
 
-        intro_marker = session.intro_marker()
-        view_offset_ms = session.view_offset_ms
+        logger.debug('session.key=%s', session.key)
+        logger.debug('view_offset_ms=%s', view_offset_ms)
+        logger.debug('intro_marker=%s', intro_marker)
 
-        logger.debug(f'session.key={session.key}')
-        logger.debug(f'session.view_offset_ms={session.view_offset_ms}')
-        logger.debug(f'intro_marker={intro_marker}')
+        # Seek ahead of the intro by the player's seek latency so that the skip
+        # appears instantaneous.
+        seek_lead_ms = self._seek_lead_ms(session)
+        logger.debug('seek_lead_ms=%s', seek_lead_ms)
 
-        if intro_marker.start <= view_offset_ms < intro_marker.end:
+        seek_at_ms = intro_marker.start - seek_lead_ms
+        if seek_at_ms <= view_offset_ms < intro_marker.end:
             try:
-                seekable = self._sp.provide_seekable(session)
+                seekable = self._take_seekable(session)
             except SeekableNotFoundError as e:
+                if _state_key(session) in self._unskippable:
+                    logger.debug('Cannot skip intro for session %s: %r', session.key, e)
+                    return
+                self._unskippable[_state_key(session)] = True
                 if e.has_plex_player_not_found():
                     logger.error(
                         'Plex player not found for session; ensure "advertise '
                         'as player" is enabled'
                     )
-                logger.exception(f'Cannot skip intro for session {session.key}')
+                logger.exception('Cannot skip intro for session %s', session.key)
                 return
 
-            seekable.seek(intro_marker.end)
-            self._skipped.add(session)
-            logger.info(f'Session {session.key}: skipped intro (seeked from {view_offset_ms} to {intro_marker.end})')
+            self._trace.record(session.key, 'seek_sent', f'{view_offset_ms}->{intro_marker.end}')
+            sent = self._seeker.seek(
+                session.player_id, seekable, intro_marker.end, on_done=self._trace_seek_outcome(session.key),
+            )
+            self._trace.record(session.key, 'seek_queued' if sent else 'seek_suppressed')
+            if not sent:
+                # We just sent that very seek (e.g. before the session got
+                # removed and added back), so it's as good as skipped.
+                logger.debug('Session %s: suppressed duplicate seek to %s', session.key, intro_marker.end)
+                self._skipped[_state_key(session)] = session
+                return
+
+            self._latency.on_seek_sent(session.key, session.player_id, intro_marker.end)
+            self._skipped[_state_key(session)] = session
+            self._start_confirmation(session, seekable, intro_marker.end)
+            if self._skip_history:
+                self._skip_history.record(SkipRecord(
+                    session_key=session.key,
+                    rating_key=session.rating_key,
+                    player_id=session.player_id,
+                    from_ms=view_offset_ms,
+                    to_ms=intro_marker.end,
+                    skipped_at=time.time(),
+                ))
+            logger.info(
+                'Session %s: skipped intro (seeked from %s to %s, %sms ahead)',
+                session.key, view_offset_ms, intro_marker.end, seek_lead_ms,
+            )
+
+            late_ms = view_offset_ms - seek_at_ms
+            if late_ms > self._late_skip_threshold_ms and _state_key(session) in self._approached:
+                logger.warning('Session %s: skipped intro %sms late', session.key, late_ms)
+                self._trace.dump(f'late skip for session {session.key} ({late_ms}ms)', background=True)
         else:
-            logger.debug(f'Session {session.key}: did not skip (not viewing intro)')
+            logger.debug('Session %s: did not skip (not viewing intro)', session.key)
+            if view_offset_ms < seek_at_ms:
+                self._maybe_prewarm(session, view_offset_ms, seek_at_ms)
 
         logger.debug('-----')
 
+    def sizes(self) -> Dict[str, int]:
+        """Returns the number of entries in each piece of per-session state."""
+        return {
+            'skipped': len(self._skipped),
+            'unskippable': len(self._unskippable),
+            'approached': len(self._approached),
+            'anchors': len(self._anchors),
+            'pending_seeks': self._latency.pending_count(),
+            'skips': len(self._skips),
+            'prewarmed': len(self._prewarmed),
+            'live': len(self._live),
+        }
+
+    def status(self) -> Dict[str, Any]:
+        """Returns a JSON-serializable view of the tracked sessions."""
+        now = self._clock()
+        sessions = []
+        for session in list(self._anchors.values()):
+            intro_marker = session.intro_marker
+            sessions.append({
+                'key': session.key,
+                'title': session.title,
+                'player': session.player_title,
+                'state': session.state,
+                'view_offset_ms': session.current_view_offset_ms(now),
+                'intro_marker': list(intro_marker) if intro_marker else None,
+            })
+        return {
+            'sessions': sessions,
+            'skipped': sorted(s.key for s in self._skipped.values()),
+            'skip_states': {skip.session.key: skip.state for skip in self._skips.values()},
+            'time_to_confirm_ms': self.time_to_confirm_ms.snapshot(),
+            'drift': self.drift_stats.snapshot(),
+            'seek_latency': self._latency.stats(),
+        }
+
     def on_session_removal(self, session: Session):
-        self._skipped.discard(session)
+        self._live.discard(session.key)
+        key = _state_key(session)
+        self._skipped.pop(key, None)
+        self._unskippable.pop(key, None)
+        self._latency.discard(session.key)
+        self._anchors.pop(key, None)
+        self._approached.pop(key, None)
+        self._prewarmed.pop(key, None)
+        with self._skip_lock:
+            skip = self._skips.pop(key, None)
+            if skip:
+                skip.cancel_timer()
+        logger.debug('Extrapolation drift stats: %s', self.drift_stats.snapshot())
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Iterator, List, MutableMapping, Optional, Tuple, TypeVar
+
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+_MISSING = object()
+
+
+class ExpiringDict(MutableMapping[K, V]):
+    """Dict whose entries expire ttl_sec after they were last set.
+
+    It also holds at most max_size entries, evicting the least recently set
+    ones first. This bounds state that's normally cleaned up by some event, in
+    case that event never comes. Entries for which pinned(key) is True are
+    never evicted that way, only expired: the dict can then hold more.
+    """
+
+    def __init__(
+        self,
+        ttl_sec: float,
+        max_size: int,
+        clock: Callable[[], float] = time.monotonic,
+        pinned: Optional[Callable[[K], bool]] = None,
+    ):
+        self._ttl_sec = ttl_sec
+        self._max_size = max_size
+        self._clock = clock
+        self._pinned = pinned
+        self._lock = threading.Lock()
+        # Ordered by expiration time, since they all share the same TTL.
+        self._data: 'OrderedDict[K, Tuple[V, float]]' = OrderedDict()
+
+    def _evict_expired(self, now: float):
+        while self._data:
+            key, (_, expires_at) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+
+    def __getitem__(self, key: K) -> V:
+        with self._lock:
+            value, expires_at = self._data[key]
+            if expires_at <= self._clock():
+                raise KeyError(key)
+            return value
+
+    # Overridden because the mixin implementations go through __getitem__, and
+    # raising KeyError is slow for what's mostly lookups of missing keys.
+
+    def get(self, key: K, default: Any = None) -> Optional[V]:  # type: ignore
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= self._clock():
+                return default
+            return entry[0]
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key, _MISSING) is not _MISSING  # type: ignore
+
+    def __setitem__(self, key: K, value: V):
+        with self._lock:
+            now = self._clock()
+            self._evict_expired(now)
+            self._data.pop(key, None)
+            self._data[key] = (value, now + self._ttl_sec)
+            while len(self._data) > self._max_size and self._evict_oldest():
+                pass
+
+    def _evict_oldest(self) -> bool:
+        """Returns False if all the entries are pinned."""
+        if self._pinned is None:
+            self._data.popitem(last=False)
+            return True
+        for key in self._data:
+            if not self._pinned(key):
+                del self._data[key]
+                return True
+        return False
+
+    def __delitem__(self, key: K):
+        with self._lock:
+            del self._data[key]
+
+    def __iter__(self) -> Iterator[K]:
+        with self._lock:
+            self._evict_expired(self._clock())
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_expired(self._clock())
+            return len(self._data)
+
+    def items(self) -> List[Tuple[K, V]]:  # type: ignore
+        """Returns a snapshot of the entries, safe to use from another thread."""
+        with self._lock:
+            self._evict_expired(self._clock())
+            return [(k, v) for k, (v, _) in self._data.items()]
+
+    def values(self) -> List[V]:  # type: ignore
+        return [v for _, v in self.items()]
@@ -0,0 +1,101 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+from typing import Any, Dict, Iterator, List, Sequence
+
+import requests
+
+
+class _ScopeStats:
+    __slots__ = ('count', 'requests', 'max_requests')
+
+    def __init__(self):
+        self.count = 0
+        self.requests = 0
+        self.max_requests = 0
+
+
+class RequestCounter:
+    """Counts the HTTP requests made while handling something.
+
+    Requests are attributed to the scope the requesting thread is in, e.g. the
+    notification it's handling. That tells what each notification or timer
+    tick costs the server, including requests plexapi makes behind our back.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._scopes: Dict[str, _ScopeStats] = {}
+        self.unscoped = 0
+
+    def install(self, session: requests.Session):
+        """Counts the requests made through the session from now on."""
+        session.hooks['response'].append(self._on_response)
+
+    def _on_response(self, response: requests.Response, *args, **kwargs):
+        count = getattr(self._local, 'count', None)
+        if count is None:
+            with self._lock:
+                self.unscoped += 1
+        else:
+            self._local.count = count + 1
+
+    @contextmanager
+    def scope(self, name: str) -> Iterator[None]:
+        """Attributes the requests this thread makes in the block to name.
+
+        Scopes don't nest: the innermost one wins.
+        """
+        previous = getattr(self._local, 'count', None)
+        self._local.count = 0
+        try:
+            yield
+        finally:
+            count = self._local.count
+            self._local.count = previous
+            with self._lock:
+                stats = self._scopes.get(name)
+                if stats is None:
+                    stats = self._scopes[name] = _ScopeStats()
+                stats.count += 1
+                stats.requests += count
+                stats.max_requests = max(stats.max_requests, count)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = {
+                name: {
+                    'count': s.count,
+                    'requests': s.requests,
+                    'max_requests': s.max_requests,
+                    'requests_per_scope': round(s.requests / s.count, 3) if s.count else 0,
+                }
+                for name, s in self._scopes.items()
+            }
+            result['unscoped'] = self.unscoped
+            return result
+
+
+class Histogram:
+    """Counts observations in buckets, each with an inclusive upper bound."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self._bounds: List[float] = sorted(bounds)
+        self._lock = threading.Lock()
+        # The last bucket is for values above all the bounds.
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect_left(self._bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = {f'<={bound:g}': count for bound, count in zip(self._bounds, self._counts)}
+            buckets['+inf'] = self._counts[-1]
+            return {'buckets': buckets, 'count': self.count, 'sum': self.sum}
@@ -1,12 +1,25 @@
+from abc import ABC, abstractmethod
+from collections import deque
 import inspect
 import json
-from typing import Any, Callable, Dict
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 from urllib.parse import urlparse, urlunparse
+from xml.etree.ElementTree import Element
 
 from plexapi.server import PlexServer
+import requests
 from typing_extensions import Literal, TypedDict
 from websocket import WebSocketApp
 
+from .parsing import SessionElement, session_element_of
+from .stores import IntroMarkerStore
+
+
+logger = logging.getLogger(__name__)
+
 
 class NotificationContainerDict(TypedDict):
     """Type of the underlying dictionary sent in each WebSocket frame.
@@ -37,6 +50,15 @@ class PlaybackNotification(TypedDict):
     state: Literal['buffering', 'playing', 'paused', 'stopped']
 
 
+class PolledPlaybackNotification(PlaybackNotification, total=False):
+    """Notification synthesized by SessionPoller, with the session it polled,
+    so that it doesn't have to be fetched again.
+    """
+
+    element: SessionElement
+    observedAt: float  # Monotonic.
+
+
 class _MessageDict(TypedDict):
     """The format of each WebSocket frame emitted by Plex once parsed."""
     NotificationContainer: NotificationContainerDict
@@ -52,31 +74,520 @@ class LoudWebSocketApp(WebSocketApp):
                 callback(self, *args)
 
 
-class NotificationListener:
+class _Shard:
+    def __init__(self):
+        self.pending: Deque[NotificationContainerDict] = deque()
+        self.cond = threading.Condition()
+
+
+class NotificationQueue:
+    """Bounded queue between receiving notifications and processing them.
+
+    Notifications are sharded by session key across the workers, so that those
+    of a given session are processed in order. When a shard is full, only the
+    latest notification of the incoming session is kept; if that's not enough,
+    the oldest pending notification is dropped.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[NotificationContainerDict], None],
+        workers: int = 4,
+        max_size: int = 256,
+    ):
+        self._callback = callback
+        self._shards = [_Shard() for _ in range(workers)]
+        self._max_shard_size = max(1, max_size // workers)
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+        # Metrics.
+        self.max_depth = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        return sum(len(shard.pending) for shard in self._shards)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
+
+    def start(self):
+        for i, shard in enumerate(self._shards):
+            thread = threading.Thread(
+                target=self._work,
+                args=(shard,),
+                name=f'NotificationWorker-{i}',
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self):
+        """Stops the workers once done with the pending notifications."""
+        self._closed = True
+        for shard in self._shards:
+            with shard.cond:
+                shard.cond.notify_all()
+
+    def put(self, container: NotificationContainerDict):
+        """Enqueues the notifications of the container, one by one.
+
+        Only 'playing' containers are processed, the others are dropped here
+        rather than taking room from them.
+        """
+        if container['type'] != 'playing':
+            return
+        for notification in container['PlaySessionStateNotification']:  # type: ignore
+            self._put(str(notification['sessionKey']), NotificationContainerDict(  # type: ignore
+                type='playing',
+                size=1,
+                PlaySessionStateNotification=[notification],
+            ))
+
+    def _put(self, session_key: str, container: NotificationContainerDict):
+        shard = self._shards[hash(session_key) % len(self._shards)]
+        with shard.cond:
+            if len(shard.pending) >= self._max_shard_size:
+                self._make_room(shard, session_key)
+            shard.pending.append(container)
+            self.max_depth = max(self.max_depth, self.depth)
+            shard.cond.notify()
+
+    def _make_room(self, shard: _Shard, session_key: str):
+        kept = deque(c for c in shard.pending if _session_key_of(c) != session_key)
+        coalesced = len(shard.pending) - len(kept)
+        if coalesced:
+            shard.pending = kept
+            self.coalesced += coalesced
+            logger.debug('Notification queue full, coalesced %s for session key %s', coalesced, session_key)
+            return
+        dropped = shard.pending.popleft()
+        self.dropped += 1
+        logger.warning('Notification queue full, dropped notification %s', dropped)
+
+    def _work(self, shard: _Shard):
+        while True:
+            with shard.cond:
+                while not shard.pending and not self._closed:
+                    shard.cond.wait()
+                if not shard.pending:
+                    return
+                container = shard.pending.popleft()
+            try:
+                self._callback(container)
+            except Exception:
+                logger.exception('Could not process notification %s', container)
+
+
+def _session_key_of(container: NotificationContainerDict) -> str:
+    return str(container['PlaySessionStateNotification'][0]['sessionKey'])  # type: ignore
+
+
+class TransportUnavailableError(Exception):
+    """Raised by a NotificationTransport when it could not connect."""
+    pass
+
+
+class NotificationTransport(ABC):
+    """Connection over which the server pushes its notifications."""
+
+    name: str
+
+    @abstractmethod
+    def run_forever(
+        self,
+        on_open: Callable[[], None],
+        on_container: Callable[[NotificationContainerDict], None],
+    ):
+        """Receives notifications until closed, or disconnected by the server.
+
+        Raises TransportUnavailableError if the connection could not be opened.
+        """
+        pass
+
+    @abstractmethod
+    def close(self):
+        """Makes run_forever() return. Can be called from any thread."""
+        pass
+
+
+class WebSocketTransport(NotificationTransport):
     """Cleaner implementation of plexapi.alert.AlertListener.
 
     By default, it uses an implementation of websocket.WebSocketApp that doesn't
     silence exceptions. It also doesn't needlessly spawn a new thread.
     """
 
-    def __init__(self, server: PlexServer, callback: Callable[[NotificationContainerDict], None]):
+    name = 'websocket'
+
+    def __init__(self, server: PlexServer):
         self._server = server
-        self._callback = callback
+        self._opened = False
+        self._closed = False
+        self._ws_app: Optional[WebSocketApp] = None
+        self._on_open_callback: Optional[Callable[[], None]] = None
+        self._on_container: Optional[Callable[[NotificationContainerDict], None]] = None
 
-    def _get_ws_url(self) -> str:
-        endpoint = '/:/websockets/notifications'
-        http_parse = urlparse(self._server.url(endpoint, includeToken=True))
-        return urlunparse(http_parse._replace(scheme='ws'))
+    def url(self) -> str:
+        """The WebSocket URL, encrypted iff the server's URL is."""
+        http_url = urlparse(self._server.url('/:/websockets/notifications', includeToken=True))
+        scheme = 'wss' if http_url.scheme == 'https' else 'ws'
+        return urlunparse(http_url._replace(scheme=scheme))
 
-    def run_forever(self):
-        """Listens on the WebSocket and blocks indefinitely."""
-        ws_url = self._get_ws_url()
-        ws_app = LoudWebSocketApp(ws_url, on_message=self._on_message, on_error=self._on_error)
-        ws_app.run_forever()
+    def run_forever(
+        self,
+        on_open: Callable[[], None],
+        on_container: Callable[[NotificationContainerDict], None],
+    ):
+        self._on_open_callback = on_open
+        self._on_container = on_container
+        self._ws_app = LoudWebSocketApp(
+            self.url(),
+            on_open=self._on_open,
+            on_message=self._on_message,
+            on_error=self._on_error,
+        )
+        if not self._closed:
+            self._ws_app.run_forever()
+
+    def close(self):
+        self._closed = True
+        if self._ws_app:
+            self._ws_app.close()
+
+    def _on_open(self):
+        self._opened = True
+        assert self._on_open_callback
+        self._on_open_callback()
 
     def _on_message(self, message: str):
         msg_dict: _MessageDict = json.loads(message)
-        self._callback(msg_dict['NotificationContainer'])
+        assert self._on_container
+        self._on_container(msg_dict['NotificationContainer'])
 
     def _on_error(self, e: Exception):
+        if self._closed:
+            # Closing the socket from another thread fails the pending read.
+            return
+        if not self._opened and not isinstance(e, (KeyboardInterrupt, SystemExit)):
+            raise TransportUnavailableError(f'could not open the WebSocket: {e}') from e
         raise e
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[Tuple[str, str]]:
+    """Parses a stream of Server-Sent Events into (event, data) pairs.
+
+    Chunks can split lines anywhere. Only the event and data fields are read.
+    """
+    buffer = b''
+    event = ''
+    data: List[str] = []
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for raw_line in lines:
+            line = raw_line.rstrip(b'\r').decode('utf-8')
+            if not line:
+                # A blank line dispatches the event.
+                if data:
+                    yield event or 'message', '\n'.join(data)
+                event = ''
+                data = []
+                continue
+            field, _, value = line.partition(':')
+            if value.startswith(' '):
+                value = value[1:]
+            if field == 'event':
+                event = value
+            elif field == 'data':
+                data.append(value)
+            # Other fields, and comments (empty field), are ignored.
+
+
+def _container_of_event(event: str, data: str) -> Optional[NotificationContainerDict]:
+    payload: Dict[str, Any] = json.loads(data)
+    if 'NotificationContainer' in payload:
+        return payload['NotificationContainer']
+    # Events hold a single notification, keyed by its kind, e.g.
+    # {"PlaySessionStateNotification": {...}} for 'playing' events.
+    for kind, notification in payload.items():
+        notifications = notification if isinstance(notification, list) else [notification]
+        return NotificationContainerDict(  # type: ignore
+            type=event,
+            size=len(notifications),
+            **{kind: notifications},
+        )
+    return None
+
+
+class EventSourceTransport(NotificationTransport):
+    """Receives the notifications as Server-Sent Events.
+
+    The stream is a plain HTTP response, read through the server's session,
+    i.e. its connection pool and, if any, rate limiter. It gets through
+    proxies that don't handle WebSockets.
+    """
+
+    name = 'eventsource'
+
+    _PATH = '/:/eventsource/notifications?filters=playing'
+
+    def __init__(self, server: PlexServer, connect_timeout_sec: float = 10):
+        self._server = server
+        self._connect_timeout_sec = connect_timeout_sec
+        self._closed = False
+        self._response: Optional[requests.Response] = None
+
+    def run_forever(
+        self,
+        on_open: Callable[[], None],
+        on_container: Callable[[NotificationContainerDict], None],
+    ):
+        try:
+            response = self._server._session.get(
+                self._server.url(self._PATH),
+                headers=self._server._headers(Accept='text/event-stream'),
+                stream=True,
+                # No read timeout: the stream can stay silent for long.
+                timeout=(self._connect_timeout_sec, None),
+            )
+        except requests.RequestException as e:
+            raise TransportUnavailableError(f'could not open the event stream: {e}') from e
+        self._response = response
+        try:
+            if not response.ok or not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                raise TransportUnavailableError(
+                    f'could not open the event stream: {response.status_code} {response.reason}'
+                )
+            if self._closed:
+                return
+            on_open()
+            # Read events as soon as they come. That's chunk by chunk if the
+            # response is chunked, otherwise byte by byte.
+            chunk_size = None if response.raw.chunked else 1
+            for event, data in iter_sse_events(response.iter_content(chunk_size)):
+                container = _container_of_event(event, data)
+                if container is not None:
+                    on_container(container)
+        except (requests.RequestException, OSError, AttributeError, ValueError):
+            if self._closed:
+                # Closing the response from another thread fails the read.
+                return
+            raise
+        finally:
+            response.close()
+
+    def close(self):
+        self._closed = True
+        if self._response is not None:
+            self._response.close()
+
+
+class NotificationListener:
+    """Listens for notifications over the first transport that connects.
+
+    Transports are tried in order, e.g. the WebSocket first, then the event
+    stream if a proxy blocks WebSockets.
+    """
+
+    def __init__(
+        self,
+        transports: Sequence[NotificationTransport],
+        callback: Callable[[NotificationContainerDict], None],
+        on_open: Optional[Callable[[], None]] = None,
+    ):
+        self._transports = transports
+        self._callback = callback
+        self._on_open_callback = on_open
+        self._closed = False
+        self._current: Optional[NotificationTransport] = None
+
+    def run_forever(self):
+        """Blocks until closed, or disconnected by the server.
+
+        Raises TransportUnavailableError if none of the transports connected.
+        """
+        errors = []
+        for transport in self._transports:
+            if self._closed:
+                return
+            self._current = transport
+            try:
+                transport.run_forever(self._on_open, self._callback)
+                return
+            except TransportUnavailableError as e:
+                logger.info('Could not listen for notifications over %s: %s', transport.name, e)
+                errors.append(e)
+        raise TransportUnavailableError('; '.join(str(e) for e in errors))
+
+    def close(self):
+        """Makes run_forever() return. Can be called from any thread."""
+        self._closed = True
+        if self._current:
+            self._current.close()
+
+    def _on_open(self):
+        assert self._current
+        logger.debug('Listening for notifications over %s', self._current.name)
+        if self._on_open_callback:
+            self._on_open_callback()
+
+
+class _PolledSession(NamedTuple):
+    notification: PlaybackNotification
+    polled_at: float  # Monotonic.
+    notified_at: float  # Monotonic.
+
+
+class SessionPoller:
+    """Fallback for NotificationListener when WebSockets are unavailable.
+
+    Polls the sessions and diffs successive snapshots to synthesize the
+    notifications the WebSocket would have sent. The polling interval adapts to
+    what's playing: slow when nothing is, fast when a session is approaching
+    its intro marker (as found in intro_markers, if known).
+    """
+
+    def __init__(
+        self,
+        server: PlexServer,
+        callback: Callable[[NotificationContainerDict], None],
+        intro_markers: Optional[IntroMarkerStore] = None,
+        on_open: Optional[Callable[[], None]] = None,
+        idle_interval_sec: float = 10,
+        active_interval_sec: float = 5,
+        near_intro_interval_sec: float = 1,
+        heartbeat_sec: float = 10,
+        seek_tolerance_ms: int = 3000,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self._server = server
+        self._callback = callback
+        self._intro_markers: IntroMarkerStore = {} if intro_markers is None else intro_markers
+        self._on_open_callback = on_open
+        self._idle_interval_sec = idle_interval_sec
+        self._active_interval_sec = active_interval_sec
+        self._near_intro_interval_sec = near_intro_interval_sec
+        # Like the WebSocket, notify about every session periodically even if
+        # nothing changed, so that the dispatcher doesn't deem it inactive.
+        self._heartbeat_sec = heartbeat_sec
+        self._seek_tolerance_ms = seek_tolerance_ms
+        self._clock = clock
+        self._sleep = sleep
+        self._sessions: Dict[str, _PolledSession] = {}
+        self._closed = False
+
+    def run_forever(self):
+        """Polls the sessions and blocks until closed."""
+        opened = False
+        while not self._closed:
+            try:
+                self.poll()
+            except requests.RequestException as e:
+                logger.warning('Could not poll the sessions: %s', e)
+                interval_sec = self._idle_interval_sec
+            else:
+                interval_sec = self._next_interval_sec()
+                if not opened:
+                    opened = True
+                    if self._on_open_callback:
+                        self._on_open_callback()
+            self._sleep(interval_sec)
+
+    def close(self):
+        """Makes run_forever() return after the current interval."""
+        self._closed = True
+
+    def poll(self):
+        """Fetches the sessions once and notifies about what changed."""
+        requested_at = self._clock()
+        container = self._server.query('/status/sessions')
+        now = self._clock()
+        # The server read the view offsets at some point during the request,
+        # so assume it was halfway through.
+        observed_at = (requested_at + now) / 2
+
+        seen = set()
+        for elem in container:
+            notification = self._make_notification(elem, observed_at)
+            if notification is None:
+                continue
+            key = notification['sessionKey']
+            seen.add(key)
+
+            previous = self._sessions.get(key)
+            if previous is None or self._has_changed(previous, notification, now):
+                self._notify(notification)
+                self._sessions[key] = _PolledSession(notification, now, now)
+            else:
+                self._sessions[key] = previous._replace(notification=notification, polled_at=now)
+
+        for key in set(self._sessions) - seen:
+            stopped = self._sessions.pop(key).notification
+            self._notify(PlaybackNotification(**{**stopped, 'state': 'stopped'}))  # type: ignore
+
+    def _has_changed(self, previous: _PolledSession, notification: PlaybackNotification, now: float) -> bool:
+        if now - previous.notified_at >= self._heartbeat_sec:
+            return True
+        if notification['state'] != previous.notification['state']:
+            return True
+
+        # Detect seeks: the offset should have moved along with the time if
+        # playing, and not at all otherwise.
+        expected_ms = previous.notification['viewOffset']
+        if notification['state'] == 'playing':
+            expected_ms += int((now - previous.polled_at) * 1000)
+        return abs(notification['viewOffset'] - expected_ms) > self._seek_tolerance_ms
+
+    def _next_interval_sec(self) -> float:
+        if not self._sessions:
+            return self._idle_interval_sec
+        for polled in self._sessions.values():
+            if self._is_near_intro(polled.notification):
+                return self._near_intro_interval_sec
+        return self._active_interval_sec
+
+    def _is_near_intro(self, notification: PlaybackNotification) -> bool:
+        if notification['state'] != 'playing':
+            return False
+        marker = self._intro_markers.get(notification['ratingKey'])
+        if marker is None:
+            return False
+        start_ms, end_ms = marker
+        lookahead_ms = int(self._active_interval_sec * 1000) * 2
+        return start_ms - lookahead_ms <= notification['viewOffset'] < end_ms
+
+    def _notify(self, notification: PlaybackNotification):
+        logger.debug('Synthesized notification: %s', notification)
+        self._callback(NotificationContainerDict(  # type: ignore
+            type='playing',
+            size=1,
+            PlaySessionStateNotification=[notification],
+        ))
+
+    @staticmethod
+    def _make_notification(elem: Element, observed_at: float) -> Optional[PolledPlaybackNotification]:
+        session_key = elem.attrib.get('sessionKey')
+        session_elem = session_element_of(elem)
+        if session_key is None or session_elem is None:
+            return None
+        return PolledPlaybackNotification(
+            sessionKey=session_key,
+            guid=elem.attrib.get('guid', ''),
+            ratingKey=elem.attrib.get('ratingKey', ''),
+            url='',
+            key=elem.attrib.get('key', ''),
+            viewOffset=int(elem.attrib.get('viewOffset', 0)),
+            playQueueItemID=int(elem.attrib.get('playQueueItemID', -1)),
+            state=session_elem.state or 'playing',  # type: ignore
+            element=session_elem,
+            observedAt=observed_at,
+        )
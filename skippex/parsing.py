@@ -0,0 +1,88 @@
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+from xml.etree.ElementTree import Element, iterparse
+
+
+class SessionElement(NamedTuple):
+    """Fields of a /status/sessions item that sessions are made of."""
+
+    session_key: str
+    rating_key: str
+    type: str
+    title: str
+    grandparent_title: str
+    view_offset_ms: int
+    state: str
+    player_id: str
+    player_address: str
+    player_title: str
+    # None if the item had no markers at all, which doesn't mean the media has
+    # none: the server doesn't always include them.
+    markers: Optional[Tuple[Tuple[str, int, int], ...]]
+
+
+def _markers_of(items: Element) -> Optional[Tuple[Tuple[str, int, int], ...]]:
+    markers = items.findall('Marker')
+    if not markers:
+        return None
+    return tuple(
+        (m.get('type', ''), int(m.get('startTimeOffset', 0)), int(m.get('endTimeOffset', 0)))
+        for m in markers
+    )
+
+
+def iter_session_elements(source: BinaryIO) -> Iterator[SessionElement]:
+    """Parses a /status/sessions response as it's read.
+
+    Only the needed fields are extracted, and every item is discarded once
+    parsed, so that memory doesn't grow with the number of sessions. Items
+    without a player are skipped.
+    """
+    depth = 0
+    root: Optional[Element] = None
+    for event, elem in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth != 1:
+            continue
+        # A direct child of the MediaContainer, i.e. a session item.
+        session_elem = session_element_of(elem)
+        if session_elem is not None:
+            yield session_elem
+        assert root is not None
+        root.clear()
+
+
+def session_element_of(elem: Element) -> Optional[SessionElement]:
+    """Extracts a /status/sessions item. Returns None if it has no player."""
+    player = elem.find('Player')
+    if player is None:
+        return None
+    return SessionElement(
+        session_key=elem.get('sessionKey', ''),
+        rating_key=elem.get('ratingKey', ''),
+        type=elem.get('type', ''),
+        title=elem.get('title', ''),
+        grandparent_title=elem.get('grandparentTitle', ''),
+        view_offset_ms=int(elem.get('viewOffset', 0)),
+        state=player.get('state', ''),
+        player_id=player.get('machineIdentifier', ''),
+        player_address=player.get('address', ''),
+        player_title=player.get('title', ''),
+        markers=_markers_of(elem),
+    )
+
+
+def read_intro_marker_element(source: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Parses the intro marker out of a metadata response with markers.
+
+    Returns None if the media has no intro marker.
+    """
+    for _, elem in iterparse(source):
+        if elem.tag == 'Marker' and elem.get('type') == 'intro':
+            return int(elem.get('startTimeOffset', 0)), int(elem.get('endTimeOffset', 0))
+    return None
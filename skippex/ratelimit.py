@@ -0,0 +1,154 @@
+from collections import deque
+from contextlib import contextmanager
+from enum import IntEnum
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Priorities of requests, from highest to lowest."""
+
+    SEEK = 0
+    SESSIONS = 1
+    DEFAULT = 2
+    BACKGROUND = 3
+
+
+class RateLimiter:
+    """Token bucket shared by requests of different priorities.
+
+    Holds up to burst tokens, refilled at rate_per_sec. Each request takes a
+    token, waiting for one if needed. Waiting requests get tokens in order of
+    priority, so that e.g. a seek never waits behind a backlog of lookups.
+    """
+
+    # Over which the recent request rate is computed.
+    _RATE_WINDOW_SEC = 60
+
+    def __init__(self, rate_per_sec: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self._rate_per_sec = rate_per_sec
+        self._burst = burst
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self._waiting: List[int] = [0] * len(Priority)
+
+        self._recent: Deque[float] = deque()
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_sec = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self._rate_per_sec)
+        self._refilled_at = now
+
+    def _forget_old_requests(self, now: float):
+        window_start = now - self._RATE_WINDOW_SEC
+        while self._recent and self._recent[0] < window_start:
+            self._recent.popleft()
+
+    def acquire(self, priority: Priority = Priority.DEFAULT) -> float:
+        """Takes a token, and returns how long it had to wait for it in seconds."""
+        with self._cond:
+            started_at = self._clock()
+            waited = False
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = self._clock()
+                    self._refill(now)
+                    preceded = any(self._waiting[:priority])
+                    if self._tokens >= 1 and not preceded:
+                        self._tokens -= 1
+                        break
+                    # Waiting requests of higher priority notify when they're
+                    # done, but the bucket refilling doesn't.
+                    self._cond.wait(max(1 - self._tokens, 0) / self._rate_per_sec or None)
+                    waited = True
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+            waited_sec = now - started_at if waited else 0.0
+            self.requests += 1
+            self._recent.append(now)
+            self._forget_old_requests(now)
+            if waited_sec > 0:
+                self.throttled += 1
+                self.throttled_sec += waited_sec
+        if waited_sec > 0:
+            logger.debug('Throttled request (priority %s) for %.3fs', priority.name, waited_sec)
+        return waited_sec
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._forget_old_requests(self._clock())
+            return {
+                'requests': self.requests,
+                'requests_per_sec': len(self._recent) / self._RATE_WINDOW_SEC,
+                'throttled': self.throttled,
+                'throttled_sec': round(self.throttled_sec, 3),
+            }
+
+
+_local = threading.local()
+
+
+@contextmanager
+def prioritized(priority: Optional[Priority]) -> Iterator[None]:
+    """Overrides the priority of the requests made by this thread.
+
+    None removes the override, if any.
+    """
+    previous = current_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority() -> Optional[Priority]:
+    """Returns the priority override of this thread, if any.
+
+    Overrides are thread-local: code handing work over to other threads must
+    pass it along.
+    """
+    return getattr(_local, 'priority', None)
+
+
+def priority_of(url: str) -> Priority:
+    override = current_priority()
+    if override is not None:
+        return override
+    path = urlparse(url).path
+    if path.startswith('/player/'):
+        return Priority.SEEK
+    if path.startswith('/status/sessions'):
+        return Priority.SESSIONS
+    return Priority.DEFAULT
+
+
+class RateLimitedSession(requests.Session):
+    """Session whose every request goes through the rate limiter.
+
+    Setting it as the session of a PlexServer covers the requests of plexapi
+    objects built from the server too, since they share its session.
+    """
+
+    def __init__(self, limiter: RateLimiter):
+        super().__init__()
+        self.limiter = limiter
+
+    def request(self, method: str, url: str, *args, **kwargs) -> requests.Response:  # type: ignore
+        self.limiter.acquire(priority_of(url))
+        return super().request(method, url, *args, **kwargs)
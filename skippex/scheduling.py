@@ -0,0 +1,135 @@
+from abc import ABC, abstractmethod
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, List, Tuple
+
+
+class ScheduledCall(ABC):
+    @property
+    @abstractmethod
+    def due_at(self) -> float:
+        """When the call is due, on the scheduler's clock."""
+        pass
+
+    @property
+    @abstractmethod
+    def done(self) -> bool:
+        """Whether the call returned or was cancelled."""
+        pass
+
+    @abstractmethod
+    def cancel(self):
+        """Prevents the call if it hasn't started yet."""
+        pass
+
+
+class Scheduler(ABC):
+    """Source of monotonic time, and of calls scheduled on it."""
+
+    @abstractmethod
+    def now(self) -> float:
+        """Returns the current monotonic time in seconds."""
+        pass
+
+    @abstractmethod
+    def call_later(self, delay_sec: float, callback: Callable[[], None]) -> ScheduledCall:
+        pass
+
+
+class _TimerCall(ScheduledCall):
+    def __init__(self, timer: threading.Timer, due_at: float):
+        self._timer = timer
+        self._due_at = due_at
+
+    @property
+    def due_at(self) -> float:
+        return self._due_at
+
+    @property
+    def done(self) -> bool:
+        # Only set once the function returned, or if cancelled.
+        return self._timer.finished.is_set()
+
+    def cancel(self):
+        self._timer.cancel()
+
+
+class ThreadingScheduler(Scheduler):
+    """Real time, with every call made from its own timer thread."""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def call_later(self, delay_sec: float, callback: Callable[[], None]) -> ScheduledCall:
+        due_at = self.now() + delay_sec
+        timer = threading.Timer(delay_sec, callback)
+        timer.daemon = True
+        timer.start()
+        return _TimerCall(timer, due_at)
+
+
+class _VirtualCall(ScheduledCall):
+    def __init__(self, due_at: float, callback: Callable[[], None]):
+        self._due_at = due_at
+        self.callback = callback
+        self.cancelled = False
+        self.ran = False
+
+    @property
+    def due_at(self) -> float:
+        return self._due_at
+
+    @property
+    def done(self) -> bool:
+        return self.cancelled or self.ran
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualScheduler(Scheduler):
+    """Time that only moves forward when advanced, for simulations and tests.
+
+    Scheduled calls are made from the thread advancing the time, in the order
+    of their due time, and in the order they were scheduled for equal times.
+    Hours of simulated time thus pass in however long the calls take. It can
+    also be called, so it can be passed where a clock is expected.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._counter = itertools.count()
+        self._queue: List[Tuple[float, int, _VirtualCall]] = []
+
+    def now(self) -> float:
+        return self._now
+
+    def __call__(self) -> float:
+        return self._now
+
+    def call_later(self, delay_sec: float, callback: Callable[[], None]) -> ScheduledCall:
+        call = _VirtualCall(self._now + max(delay_sec, 0), callback)
+        heapq.heappush(self._queue, (call.due_at, next(self._counter), call))
+        return call
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for _, _, call in self._queue if not call.cancelled)
+
+    def advance(self, delta_sec: float):
+        """Moves time forward, making the calls that fall due on the way."""
+        self.run_until(self._now + delta_sec)
+
+    def run_until(self, deadline: float):
+        while self._queue and self._queue[0][0] <= deadline:
+            due_at, _, call = heapq.heappop(self._queue)
+            if call.cancelled:
+                continue
+            self._now = max(self._now, due_at)
+            try:
+                call.callback()
+            finally:
+                call.ran = True
+        self._now = max(self._now, deadline)
@@ -1,7 +1,9 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import logging
 import threading
-from typing import Dict, List, Tuple
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 from uuid import UUID
 
@@ -13,6 +15,8 @@ import requests
 from wrapt.decorators import synchronized
 from zeroconf import Zeroconf
 
+from .ratelimit import Priority, current_priority, prioritized
+from .scheduling import ScheduledCall, Scheduler, ThreadingScheduler
 from .sessions import Session
 
 
@@ -28,6 +32,18 @@ def _removesuffix(s: str, suffix: str) -> str:
 class Seekable(ABC):
     @abstractmethod
     def seek(self, offset_ms: int):
+        """May block until the player responds, see SeekSerializer."""
+        pass
+
+    def offset_ms(self) -> Optional[int]:
+        """Returns the player's current view offset, None if it can't tell.
+
+        Must not block.
+        """
+        return None
+
+    def prewarm(self):
+        """Gets ready to seek, e.g. by connecting to the player. May block."""
         pass
 
 
@@ -74,48 +90,51 @@ class SeekablePlexClient(Seekable):
             **kwargs
         )
 
+    def prewarm(self):
+        # Opens a keep-alive connection to the player in the shared session.
+        try:
+            self._client.connect(timeout=self._timeout_sec)
+        except Exception as e:
+            logger.debug('Could not prewarm the connection to %s: %r', self._client, e)
+
     def seek(self, offset_ms: int):
-        """Sends the seeking command in a non-blocking fashion.
+        """Sends the seeking command and waits for the response.
 
         When tested against an iPhone client (iOS 14.3, Plex for iOS 7.11, Plex
         Media Server 1.21.1.3830), the seeking command takes a long time (over
         15 seconds) to issue a response, even though the client successfully
-        seeks in less than a second. Therefore, we send the seeking command in
-        a new thread and we only log what happens.
+        seeks in less than a second. Therefore, we only wait for the timeout set
+        on this instance, past which requests.Timeout is raised even though the
+        seek may have happened.
         """
-        def _seek():
-            def log_timeout_warning():
-                # About "Advertise as player": If the user disables that setting
-                # while Skippex is running, seeking will timeout (and not
-                # happen), even though PlexSeekableProvider found the client.
-                logger.warning(
-                    f'Seeking command timed out for {self._client}, but '
-                    f'seeking might still have happened. If not, please ensure '
-                    f'that the "Advertise as player" setting is enabled for '
-                    f'your client.'
-                )
-
-            try:
-                # HACK: We add a suffix to mtype to signal to the patched method
-                # to use the timeout set on this instance. This is the only way
-                # we have to "pass a message" to PlexClient.query() from this
-                # call.
-                self._client.seekTo(offset_ms, mtype=DEFAULT_MTYPE+self._TIMEOUT_SUFFIX)
-            except requests.Timeout:
+        def log_timeout_warning():
+            # About "Advertise as player": If the user disables that setting
+            # while Skippex is running, seeking will timeout (and not
+            # happen), even though PlexSeekableProvider found the client.
+            logger.warning(
+                'Seeking command timed out for %s, but seeking might still '
+                'have happened. If not, please ensure that the "Advertise as '
+                'player" setting is enabled for your client.',
+                self._client,
+            )
+
+        logger.debug('Sending seeking command to %s', self._client)
+        try:
+            # HACK: We add a suffix to mtype to signal to the patched method
+            # to use the timeout set on this instance. This is the only way
+            # we have to "pass a message" to PlexClient.query() from this
+            # call.
+            self._client.seekTo(offset_ms, mtype=DEFAULT_MTYPE+self._TIMEOUT_SUFFIX)
+        except requests.Timeout:
+            log_timeout_warning()
+            raise
+        except requests.ConnectionError as e:
+            # See https://github.com/psf/requests/issues/5430.
+            if 'timed out' in str(e):
                 log_timeout_warning()
-            except requests.ConnectionError as e:
-                # See https://github.com/psf/requests/issues/5430.
-                if 'timed out' in str(e):
-                    log_timeout_warning()
-                raise
-            except Exception:
-                logger.exception(f'Seeking failed for {self._client}')
-            else:
-                logger.debug(f'Seeking succeeded for {self._client}')
-
-        thread = threading.Thread(target=_seek, daemon=True)
-        thread.start()
-        logger.debug(f'Sent seeking command to {self._client}')
+            raise
+        else:
+            logger.debug('Seeking succeeded for %s', self._client)
 
 
 class SeekableChromecastAdapter(Seekable):
@@ -125,6 +144,125 @@ class SeekableChromecastAdapter(Seekable):
     def seek(self, offset_ms: int):
         self._plex_ctrl.seek(offset_ms / 1000)
 
+    def prewarm(self):
+        # The Chromecast is connected by now. Request its media status, which
+        # offset_ms() then reads.
+        self._plex_ctrl.update_status()
+
+    def offset_ms(self) -> Optional[int]:
+        # From the latest media status the Chromecast pushed, extrapolated.
+        current_time = self._plex_ctrl.status.adjusted_current_time
+        return None if current_time is None else int(current_time * 1000)
+
+
+# Called with 'acked', 'timed_out', 'failed' or 'superseded' once a seek is done
+# with.
+SeekCallback = Callable[[str], None]
+
+
+class _PlayerSeeks:
+    def __init__(self):
+        self.in_flight = False
+        self.waiting: Optional[Tuple[Seekable, int, Optional[SeekCallback]]] = None
+        self.last_target_ms: Optional[int] = None
+        self.last_requested_at = 0.0
+
+
+class SeekSerializer:
+    """Sends seeks from background threads, at most one at a time per player.
+
+    A seek requested while another one is in flight for the same player waits
+    for it to complete, superseding any seek that was already waiting. Seeks to
+    the same target as the previous one for the same player are suppressed for
+    duplicate_window_sec.
+    """
+
+    def __init__(self, duplicate_window_sec: float = 10, clock: Callable[[], float] = time.monotonic):
+        self._duplicate_window_sec = duplicate_window_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._players: Dict[str, _PlayerSeeks] = {}
+
+    def seek(
+        self,
+        player_id: str,
+        seekable: Seekable,
+        offset_ms: int,
+        retry: bool = False,
+        on_done: Optional[SeekCallback] = None,
+    ) -> bool:
+        """Queues the seek. Returns False if it was suppressed as a duplicate.
+
+        Retries of a seek that didn't happen are never suppressed. on_done is
+        called from the sending thread once the player answered, or not.
+        """
+        with self._lock:
+            now = self._clock()
+            self._forget_idle_players(now)
+            player = self._players.setdefault(player_id, _PlayerSeeks())
+
+            if (
+                not retry
+                and player.last_target_ms == offset_ms
+                and now - player.last_requested_at < self._duplicate_window_sec
+            ):
+                logger.debug('Suppressed duplicate seek to %s for player %s', offset_ms, player_id)
+                return False
+            player.last_target_ms = offset_ms
+            player.last_requested_at = now
+
+            superseded: Optional[SeekCallback] = None
+            in_flight = player.in_flight
+            if in_flight:
+                if player.waiting:
+                    logger.debug('Superseded seek to %s for player %s', player.waiting[1], player_id)
+                    superseded = player.waiting[2]
+                player.waiting = (seekable, offset_ms, on_done)
+            else:
+                player.in_flight = True
+
+        if in_flight:
+            if superseded:
+                superseded('superseded')
+            return True
+
+        thread = threading.Thread(
+            target=self._send,
+            args=(player_id, seekable, offset_ms, on_done),
+            name=f'Seek-{player_id}',
+            daemon=True,
+        )
+        thread.start()
+        return True
+
+    def _send(self, player_id: str, seekable: Seekable, offset_ms: int, on_done: Optional[SeekCallback]):
+        while True:
+            try:
+                seekable.seek(offset_ms)
+            except requests.Timeout:
+                # Already warned about by the seekable.
+                outcome = 'timed_out'
+            except Exception:
+                logger.exception('Seeking failed for player %s', player_id)
+                outcome = 'failed'
+            else:
+                outcome = 'acked'
+            if on_done:
+                on_done(outcome)
+
+            with self._lock:
+                player = self._players[player_id]
+                if player.waiting is None:
+                    player.in_flight = False
+                    return
+                seekable, offset_ms, on_done = player.waiting
+                player.waiting = None
+
+    def _forget_idle_players(self, now: float):
+        for player_id, player in list(self._players.items()):
+            if not player.in_flight and now - player.last_requested_at >= self._duplicate_window_sec:
+                del self._players[player_id]
+
 
 class SeekableNotFoundError(Exception):
     def has_plex_player_not_found(self) -> bool:
@@ -153,73 +291,437 @@ class SeekableProvider(ABC):
         """Raises SeekableNotFoundError if no Seekable could be found."""
         pass
 
+    def provide_alternate_seekable(self, session: Session, failed: Seekable) -> Seekable:
+        """Provides a Seekable to use instead of one whose seek didn't happen.
+
+        By default, this looks up a new one, e.g. with a fresh connection.
+        Raises SeekableNotFoundError if no Seekable could be found.
+        """
+        return self.provide_seekable(session)
+
 
 class SeekableProviderChain(SeekableProvider):
-    def __init__(self, providers: List[SeekableProvider]):
+    """Provides the Seekable of the first provider that finds one.
+
+    By default, the providers are tried one after the other. In parallel mode,
+    they're all queried at once and the first to find a Seekable wins, unless
+    a provider that comes before it in the list also finds one within
+    tiebreak_sec. The other results are ignored.
+    """
+
+    def __init__(
+        self,
+        providers: List[SeekableProvider],
+        parallel: bool = False,
+        tiebreak_sec: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
         self._providers = providers
+        self._parallel = parallel
+        self._tiebreak_sec = tiebreak_sec
+        self._clock = clock
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if parallel:
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(providers),
+                thread_name_prefix='SeekableProvider',
+            )
+
+    def close(self):
+        """Stops the threads of parallel mode, e.g. before being replaced."""
+        if self._executor:
+            self._executor.shutdown(wait=False)
 
     def provide_seekable(self, session: Session) -> Seekable:
+        if self._parallel:
+            return self._provide_seekable_parallel(session)
+
         exceptions = []
         for provider in self._providers:
             try:
-                return provider.provide_seekable(session)
+                return _timed_provide_seekable(provider, session, self._clock)
             except SeekableNotFoundError as e:
                 exceptions.append(e)
         else:
             raise SeekableNotFoundErrorChain(exceptions)
 
+    def _provide_seekable_parallel(
+        self,
+        session: Session,
+        wanted: Callable[[Seekable], bool] = lambda seekable: True,
+    ) -> Seekable:
+        """Seekables that aren't wanted only win if no provider finds one that is."""
+        assert self._executor
+        # The lookups run on the executor's threads: carry over the priority
+        # of this one's requests.
+        priority = current_priority()
+        futures = [
+            self._executor.submit(_timed_provide_seekable, p, session, self._clock, priority)
+            for p in self._providers
+        ]
+        pending = set(futures)
+        best: Optional[int] = None
+        deadline: Optional[float] = None
+
+        while pending:
+            timeout = None if deadline is None else max(0, deadline - self._clock())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break  # Tiebreak is over.
+            for future in done:
+                if future.exception() is None and wanted(future.result()):
+                    i = futures.index(future)
+                    best = i if best is None else min(best, i)
+            if best is not None:
+                if deadline is None:
+                    deadline = self._clock() + self._tiebreak_sec
+                if not any(f in pending for f in futures[:best]):
+                    break  # No provider with a higher priority can win.
+
+        for future in pending:
+            future.cancel()
+
+        if best is not None:
+            return futures[best].result()
+
+        # Everything completed.
+        exceptions = []
+        for future in futures:
+            try:
+                return future.result()
+            except SeekableNotFoundError as e:
+                exceptions.append(e)
+        raise SeekableNotFoundErrorChain(exceptions)
+
+    def provide_alternate_seekable(self, session: Session, failed: Seekable) -> Seekable:
+        """Prefers the Seekable of another provider than the failed one's."""
+        if self._parallel:
+            return self._provide_seekable_parallel(session, lambda seekable: type(seekable) is not type(failed))
+
+        exceptions = []
+        fallback: Optional[Seekable] = None
+        for provider in self._providers:
+            try:
+                seekable = _timed_provide_seekable(provider, session, self._clock)
+            except SeekableNotFoundError as e:
+                exceptions.append(e)
+                continue
+            if type(seekable) is not type(failed):
+                return seekable
+            fallback = fallback or seekable
+        if fallback:
+            return fallback
+        raise SeekableNotFoundErrorChain(exceptions)
+
+
+def _timed_provide_seekable(
+    provider: SeekableProvider,
+    session: Session,
+    clock: Callable[[], float],
+    priority: Optional[Priority] = None,
+) -> Seekable:
+    """Priority overrides that of this thread's requests, if given."""
+    started_at = clock()
+    outcome = 'not found'
+    try:
+        with prioritized(priority if priority is not None else current_priority()):
+            seekable = provider.provide_seekable(session)
+        outcome = 'found'
+        return seekable
+    finally:
+        elapsed_ms = (clock() - started_at) * 1000
+        logger.debug(
+            '%s lookup for session %s took %.0fms (%s)',
+            provider.__class__.__name__, session.key, elapsed_ms, outcome,
+        )
+
+
+class _FailedLookup(NamedTuple):
+    error: SeekableNotFoundError
+    failures: int
+    retry_at: float  # Monotonic.
+
+
+class CachedSeekableNotFoundError(SeekableNotFoundError):
+    """Raised instead of looking up a player that recently couldn't be found."""
+
+    def __init__(self, cause: SeekableNotFoundError, *args: object):
+        super().__init__(cause, *args)
+        self.cause = cause
+
+    def has_plex_player_not_found(self) -> bool:
+        return self.cause.has_plex_player_not_found()
+
+
+class NegativeCachingSeekableProvider(SeekableProvider):
+    """Remembers the players for which no Seekable could be found.
+
+    Those aren't looked up again until their backoff expires, which doubles
+    with every failure. The whole cache should be invalidated whenever the
+    players that can be found may have changed.
+    """
+
+    def __init__(
+        self,
+        provider: SeekableProvider,
+        initial_backoff_sec: float = 10,
+        max_backoff_sec: float = 600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._provider = provider
+        self._initial_backoff_sec = initial_backoff_sec
+        self._max_backoff_sec = max_backoff_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures: Dict[str, _FailedLookup] = {}
+        self.hits = 0  # Lookups answered from the cache.
+        self.misses = 0
+
+    def provide_seekable(self, session: Session) -> Seekable:
+        with self._lock:
+            failed = self._failures.get(session.player_id)
+        if failed and self._clock() < failed.retry_at:
+            self.hits += 1
+            raise CachedSeekableNotFoundError(failed.error)
+        self.misses += 1
+
+        try:
+            seekable = self._provider.provide_seekable(session)
+        except SeekableNotFoundError as e:
+            failures = failed.failures + 1 if failed else 1
+            backoff_sec = min(self._initial_backoff_sec * 2 ** (failures - 1), self._max_backoff_sec)
+            with self._lock:
+                self._failures[session.player_id] = _FailedLookup(e, failures, self._clock() + backoff_sec)
+            logger.debug('Will not look up player %s again for %ss', session.player_id, backoff_sec)
+            raise
+
+        with self._lock:
+            self._failures.pop(session.player_id, None)
+        return seekable
+
+    def provide_alternate_seekable(self, session: Session, failed: Seekable) -> Seekable:
+        # The player was just found, so the cache has nothing to say.
+        return self._provider.provide_alternate_seekable(session, failed)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            failed_players = len(self._failures)
+        return {'hits': self.hits, 'misses': self.misses, 'failed_players': failed_players}
+
+    def invalidate(self):
+        with self._lock:
+            if self._failures:
+                logger.debug('Invalidated failed lookups for players %s', list(self._failures))
+            self._failures.clear()
+
 
 class PlexSeekableProvider(SeekableProvider):
-    def __init__(self, server: PlexServer):
+    def __init__(self, server: PlexServer, player_timeout_sec: float = 5):
         self._server = server
+        self._player_timeout_sec = player_timeout_sec
+        # Maps the machine IDs of the clients to their titles.
+        self._clients: Optional[Dict[str, str]] = None
+        self._change_callbacks: List[Callable[[], None]] = []
+
+    def add_change_callback(self, callback: Callable[[], None]):
+        """The callback is called when the list of clients changes."""
+        self._change_callbacks.append(callback)
+
+    def set_player_timeout_sec(self, player_timeout_sec: float):
+        """Applies to the seekables provided from now on."""
+        self._player_timeout_sec = player_timeout_sec
 
     def provide_seekable(self, session: Session) -> Seekable:
-        sess_machine_id = session.player.machineIdentifier
+        sess_machine_id = session.player_id
         # NOTE: Have to "advertise as player" in order to be considered a client by Plex.
-        client: PlexClient
-        for client in self._server.clients():
+        clients: List[PlexClient] = self._server.clients()
+
+        known = {c.machineIdentifier: c.title for c in clients}
+        if self._clients is not None and known.keys() != self._clients.keys():
+            for callback in self._change_callbacks:
+                callback()
+        self._clients = known
+
+        for client in clients:
             if client.machineIdentifier == sess_machine_id:
-                return SeekablePlexClient(client)
+                return SeekablePlexClient(client, timeout_sec=self._player_timeout_sec)
         raise PlexPlayerNotFoundError(f'could not find Plex player with machine ID {sess_machine_id}')
 
+    def known_clients(self) -> Dict[str, str]:
+        """Returns the titles of the clients last listed, by machine ID."""
+        return dict(self._clients or {})
+
 
 class ChromecastNotFoundError(Exception):
     pass
 
 
+class _ChromecastConnection:
+    def __init__(self, chromecast: pychromecast.Chromecast, last_used_at: float):
+        self.chromecast = chromecast
+        self.last_used_at = last_used_at
+
+
 class ChromecastMonitor:
+    """Keeps track of the Chromecasts discovered on the network.
+
+    Discovering a Chromecast doesn't connect to it: that only happens once a
+    session is played on it, and the connection is closed after being unused
+    for idle_timeout_sec. Most cast devices on a network are never seeked.
+    """
+
     # The callbacks are called from a thread different from the main thread.
 
-    def __init__(self, listener: pychromecast.CastListener, zconf: Zeroconf):
+    def __init__(
+        self,
+        listener: pychromecast.CastListener,
+        zconf: Zeroconf,
+        idle_timeout_sec: float = 300,
+        connect_timeout_sec: float = 10,
+        scheduler: Optional[Scheduler] = None,
+    ):
         self._listener = listener
         self._zconf = zconf
-        self._chromecasts: Dict[UUID, pychromecast.Chromecast] = {}
+        self._idle_timeout_sec = idle_timeout_sec
+        self._connect_timeout_sec = connect_timeout_sec
+        self._scheduler = scheduler or ThreadingScheduler()
+        self._clock = self._scheduler.now
+        # Maps the discovered Chromecasts to their address and name.
+        self._discovered: Dict[UUID, Tuple[str, str]] = {}
+        self._by_address: Dict[str, UUID] = {}
+        self._connections: Dict[UUID, _ChromecastConnection] = {}
+        # Connections being opened, which callers for the same Chromecast wait
+        # on rather than opening their own.
+        self._connecting: Dict[UUID, Future] = {}
+        self._idle_timer: Optional[ScheduledCall] = None
+        self._change_callbacks: List[Callable[[], None]] = []
+
+    def add_change_callback(self, callback: Callable[[], None]):
+        """The callback is called when a Chromecast is added or removed."""
+        self._change_callbacks.append(callback)
+
+    def _notify_change(self):
+        for callback in self._change_callbacks:
+            callback()
 
-    @synchronized
     def get_chromecast_by_ip(self, ip: str) -> pychromecast.Chromecast:
-        for cc in self._chromecasts.values():
-            if cc.socket_client.host == ip:
-                return cc
-        logging.debug(f'Discovered Chromecasts: {self._chromecasts}')
-        raise ChromecastNotFoundError(f'could not find Chromecast with address {ip}')
+        """Returns the Chromecast at the address, connecting to it if needed.
+
+        Raises ChromecastNotFoundError if no Chromecast was discovered at that
+        address, or if it couldn't be connected to.
+
+        Connecting happens without holding the lock, so that it doesn't hold up
+        the lookups of other Chromecasts, nor discovery.
+        """
+        with synchronized(self):
+            uuid = self._by_address.get(ip)
+            if uuid is None:
+                logger.debug('Discovered Chromecasts: %s', self._discovered)
+                raise ChromecastNotFoundError(f'could not find Chromecast with address {ip}')
+
+            connection = self._connections.get(uuid)
+            if connection is not None:
+                connection.last_used_at = self._clock()
+                return connection.chromecast
+
+            pending = self._connecting.get(uuid)
+            if pending is None:
+                pending = self._connecting[uuid] = Future()
+                service = self._listener.services[uuid]
+                connecting = True
+            else:
+                connecting = False
+
+        if not connecting:
+            return pending.result()
+
+        try:
+            chromecast = self._connect(service)
+            with synchronized(self):
+                if self._connecting.get(uuid) is not pending:
+                    # Forgotten or moved in the meantime.
+                    chromecast.disconnect(blocking=False)
+                    raise ChromecastNotFoundError(f'Chromecast {chromecast} went away while connecting')
+                del self._connecting[uuid]
+                self._connections[uuid] = _ChromecastConnection(chromecast, self._clock())
+                self._schedule_idle_check()
+        except Exception as e:
+            with synchronized(self):
+                if self._connecting.get(uuid) is pending:
+                    del self._connecting[uuid]
+            pending.set_exception(e)
+            raise
+        pending.set_result(chromecast)
+        return chromecast
+
+    def _connect(self, service) -> pychromecast.Chromecast:
+        chromecast = pychromecast.get_chromecast_from_service(service, self._zconf)
+        chromecast.wait(timeout=self._connect_timeout_sec)
+        if not chromecast.socket_client.is_connected:
+            chromecast.disconnect(blocking=False)
+            raise ChromecastNotFoundError(f'could not connect to Chromecast {chromecast}')
+        logger.debug('Connected to Chromecast: %s', chromecast)
+        return chromecast
+
+    def _set_discovered(self, uuid: UUID, host: str, friendly_name: str):
+        self._forget_discovered(uuid)
+        self._discovered[uuid] = (host, friendly_name)
+        self._by_address[host] = uuid
+
+    def _forget_discovered(self, uuid: UUID) -> Optional[Tuple[str, str]]:
+        discovered = self._discovered.pop(uuid, None)
+        if discovered and self._by_address.get(discovered[0]) == uuid:
+            del self._by_address[discovered[0]]
+        return discovered
+
+    def _disconnect(self, uuid: UUID):
+        # A connection being opened is dropped once open.
+        self._connecting.pop(uuid, None)
+        connection = self._connections.pop(uuid, None)
+        if connection:
+            connection.chromecast.disconnect(blocking=False)
+            logger.debug('Disconnected from Chromecast: %s', connection.chromecast)
+
+    def _schedule_idle_check(self):
+        if self._idle_timer is None and self._connections:
+            self._idle_timer = self._scheduler.call_later(self._idle_timeout_sec, self.close_idle_connections)
+
+    @synchronized
+    def close_idle_connections(self):
+        self._idle_timer = None
+        now = self._clock()
+        for uuid, connection in list(self._connections.items()):
+            if now - connection.last_used_at >= self._idle_timeout_sec:
+                self._disconnect(uuid)
+        self._schedule_idle_check()
+
+    @synchronized
+    def known_chromecasts(self) -> Dict[str, str]:
+        """Returns the names of the discovered Chromecasts, by address."""
+        return dict(self._discovered.values())
 
     @synchronized
     def add_callback(self, uuid: UUID, name: str):
-        service = self._listener.services[uuid]
-        chromecast = pychromecast.get_chromecast_from_service(service, self._zconf)
-        chromecast.wait()
-        self._chromecasts[uuid] = chromecast
-        logger.debug(f'Discovered new Chromecast: {chromecast}')
+        _, _, _, friendly_name, host, _ = self._listener.services[uuid]
+        self._set_discovered(uuid, host, friendly_name)
+        logger.debug('Discovered new Chromecast: %s (%s)', friendly_name, host)
+        self._notify_change()
 
     @synchronized
     def update_callback(self, uuid: UUID, name: str):
-        # No-op.
-        pass
+        _, _, _, friendly_name, host, _ = self._listener.services[uuid]
+        if self._discovered.get(uuid) != (host, friendly_name):
+            # It moved: connect again to its new address next time.
+            self._disconnect(uuid)
+            self._set_discovered(uuid, host, friendly_name)
+            self._notify_change()
 
     @synchronized
     def remove_callback(self, uuid: UUID, name: str, service):
-        chromecast = self._chromecasts.pop(uuid)
-        logger.debug(f'Removed discovered Chromecast: {chromecast}')
+        discovered = self._forget_discovered(uuid)
+        self._disconnect(uuid)
+        logger.debug('Removed discovered Chromecast: %s', discovered)
+        self._notify_change()
 
 
 class ChromecastSeekableProvider(SeekableProvider):
@@ -228,10 +730,10 @@ class ChromecastSeekableProvider(SeekableProvider):
 
     def provide_seekable(self, session: Session) -> Seekable:
         try:
-            chromecast = self._monitor.get_chromecast_by_ip(session.player.address)
+            chromecast = self._monitor.get_chromecast_by_ip(session.player_address)
         except ChromecastNotFoundError as e:
             raise SeekableNotFoundError(
-                f'could not find Chromecast with address {session.player.address}'
+                f'could not find Chromecast with address {session.player_address}'
             ) from e
 
         plex_ctrl = PlexController()
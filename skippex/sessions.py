@@ -1,18 +1,25 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import datetime, timedelta
 import logging
 import threading
-from typing import Dict, NamedTuple, Optional, Tuple
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional, Tuple, cast
 
-from plexapi.base import Playable
-from plexapi.client import PlexClient
+import plexapi
+from plexapi.base import PlexObject, Playable
+from plexapi.exceptions import BadRequest, NotFound, Unauthorized
 from plexapi.server import PlexServer
 from plexapi.video import Episode
 from typing_extensions import Literal
-from wrapt import synchronized
 
-from .notifications import NotificationContainerDict, PlaybackNotification
+from .expiring import ExpiringDict
+from .instrumentation import RequestCounter
+from .notifications import NotificationContainerDict, PlaybackNotification, PolledPlaybackNotification
+from .parsing import SessionElement, iter_session_elements, read_intro_marker_element
+from .scheduling import ScheduledCall, Scheduler, ThreadingScheduler
+from .stores import IntroMarkerStore
+from .traces import TraceBuffer
 
 
 logger = logging.getLogger(__name__)
@@ -20,21 +27,41 @@ logger = logging.getLogger(__name__)
 SessionKey = str
 
 
+class IntroMarker(NamedTuple):
+    # In milliseconds.
+    start: int
+    end: int
+
+
 @dataclass(frozen=True, eq=False)
 class Session:
-    key: str
+    """Compact record of a playback session.
+
+    Only holds what the pipeline needs, rather than the plexapi objects the
+    session was built from, which are heavy and keep their XML data alive.
+    """
+
+    __slots__ = ('key', 'state', 'rating_key', 'title', 'player_id', 'player_address', 'player_title')
+
+    key: SessionKey
     state: Literal['buffering', 'playing', 'paused', 'stopped']
-    playable: Playable
-    player: PlexClient
+    rating_key: str
+    title: str
+    player_id: str  # The player's machineIdentifier.
+    player_address: str
+    player_title: str
 
     @classmethod
     def from_playable(cls, playable: Playable) -> 'Session':
-        player = playable.players[0]
+        player = _peek(playable, 'players')[0]
         return cls(
-            key=str(playable.sessionKey),
+            key=str(_peek(playable, 'sessionKey')),
             state=player.state,
-            playable=playable,
-            player=player,
+            rating_key=str(_peek(playable, 'ratingKey')),
+            title=_peek(playable, 'title'),
+            player_id=player.machineIdentifier,
+            player_address=player.address,
+            player_title=player.title,
         )
 
     def __hash__(self):
@@ -44,44 +71,165 @@ class Session:
         return isinstance(other, self.__class__) and self.key == other.key
 
 
-class IntroMarker(NamedTuple):
-    # In milliseconds.
-    start: int
-    end: int
+def _peek(obj: PlexObject, attr: str) -> Any:
+    """Reads the attribute as it was loaded.
+
+    Reading an attribute that's None or empty on a partial plexapi object
+    reloads the object otherwise, which is a full metadata request each time.
+    """
+    return vars(obj).get(attr)
+
+
+def read_intro_marker(episode: Episode) -> Optional[IntroMarker]:
+    """Reads the intro marker of the episode.
+
+    Sessions usually don't include markers, in which case this makes a single
+    request for them, rather than reloading the whole episode.
+    """
+    markers = _peek(episode, 'markers')
+    if markers:
+        return next((IntroMarker(start=m.start, end=m.end) for m in markers if m.type == 'intro'), None)
+
+    data = episode._server.query(f"/library/metadata/{_peek(episode, 'ratingKey')}?includeMarkers=1")
+    return next((
+        IntroMarker(start=int(elem.get('startTimeOffset')), end=int(elem.get('endTimeOffset')))
+        for elem in data.iter('Marker')
+        if elem.get('type') == 'intro'
+    ), None)
 
 
 @dataclass(frozen=True, eq=False)
 class EpisodeSession(Session):
-    playable: Episode
+    __slots__ = ('view_offset_ms', 'observed_at', 'intro_marker')
+
+    # The view offset reported by the server, and the monotonic time at which
+    # it was reported. Together they form the anchor from which the current
+    # view offset is computed.
     view_offset_ms: int
+    observed_at: float
+    intro_marker: Optional[IntroMarker]
 
     @classmethod
-    def from_playable(cls, episode: Episode) -> 'EpisodeSession':
+    def from_playable(
+        cls,
+        episode: Episode,
+        observed_at: Optional[float] = None,
+        intro_marker_of: Callable[[Episode], Optional[IntroMarker]] = read_intro_marker,
+    ) -> 'EpisodeSession':
         assert not episode.isFullObject()  # Probably dangerous wrt viewOffset otherwise.
-        player = episode.players[0]
+        player = _peek(episode, 'players')[0]
+        key = str(_peek(episode, 'sessionKey'))
+        view_offset_ms = int(_peek(episode, 'viewOffset'))
+        title = f"{_peek(episode, 'grandparentTitle')} - {_peek(episode, 'title')}"
 
         return cls(
-            key=str(episode.sessionKey),
+            key=key,
             state=player.state,
-            playable=episode,
-            player=player,
-            view_offset_ms=int(episode.viewOffset),
+            rating_key=str(_peek(episode, 'ratingKey')),
+            title=title,
+            player_id=player.machineIdentifier,
+            player_address=player.address,
+            player_title=player.title,
+            view_offset_ms=view_offset_ms,
+            observed_at=time.monotonic() if observed_at is None else observed_at,
+            # Last, in case this reloads the episode.
+            intro_marker=intro_marker_of(episode),
         )
 
-    def intro_marker(self) -> Optional[IntroMarker]:
-        if not self.playable.hasIntroMarker:
-            return None
-        internal = next(m for m in self.playable.markers if m.type == 'intro')
-        return IntroMarker(start=internal.start, end=internal.end)
+    def current_view_offset_ms(self, now: Optional[float] = None) -> int:
+        """Extrapolates the view offset at the specified monotonic time.
+
+        Assumes playback went on uninterrupted since the observation if the
+        session is playing, and that it didn't move otherwise.
+        """
+        if self.state != 'playing':
+            return self.view_offset_ms
+        if now is None:
+            now = time.monotonic()
+        return self.view_offset_ms + int((now - self.observed_at) * 1000)
 
 
 class SessionFactory:
-    @classmethod
-    def make(cls, playable: Playable) -> Session:
+    def __init__(
+        self,
+        intro_markers: Optional[IntroMarkerStore] = None,
+        clock: Callable[[], float] = time.monotonic,
+        cache_ttl_sec: float = 3600,
+        max_cached: int = 10000,
+    ):
+        # Markers belong to the media rather than the session, and reading them
+        # costs a metadata request, so only do it once per ratingKey. Without a
+        # store, they're cached in memory, where media without markers may get
+        # some once analyzed by the server: like the store, entries expire.
+        if intro_markers is None:
+            intro_markers = ExpiringDict(ttl_sec=cache_ttl_sec, max_size=max_cached, clock=clock)
+        self._intro_markers: IntroMarkerStore = intro_markers
+        self.intro_marker_hits = 0
+        self.intro_marker_misses = 0
+
+    def _cached_intro_marker(
+        self,
+        rating_key: str,
+        read: Callable[[], Optional[IntroMarker]],
+    ) -> Optional[IntroMarker]:
+        try:
+            cached = self._intro_markers[rating_key]
+        except KeyError:
+            self.intro_marker_misses += 1
+            intro_marker = read()
+            self._intro_markers[rating_key] = intro_marker
+            return intro_marker
+        self.intro_marker_hits += 1
+        return None if cached is None else IntroMarker(*cached)
+
+    def _intro_marker_of(self, episode: Episode) -> Optional[IntroMarker]:
+        return self._cached_intro_marker(str(_peek(episode, 'ratingKey')), lambda: read_intro_marker(episode))
+
+    def make(self, playable: Playable, observed_at: Optional[float] = None) -> Session:
         if isinstance(playable, Episode):
-            return EpisodeSession.from_playable(playable)
+            return EpisodeSession.from_playable(playable, observed_at, self._intro_marker_of)
         return Session.from_playable(playable)
 
+    def make_from_element(
+        self,
+        elem: SessionElement,
+        observed_at: float,
+        read_intro_marker: Callable[[str], Optional[IntroMarker]],
+    ) -> Session:
+        """Makes a session from a parsed /status/sessions item.
+
+        read_intro_marker(rating_key) is called on cache misses, unless the
+        item came with its markers.
+        """
+        if elem.type != 'episode':
+            return Session(
+                key=elem.session_key,
+                state=elem.state,  # type: ignore
+                rating_key=elem.rating_key,
+                title=elem.title,
+                player_id=elem.player_id,
+                player_address=elem.player_address,
+                player_title=elem.player_title,
+            )
+
+        def read() -> Optional[IntroMarker]:
+            if elem.markers is None:
+                return read_intro_marker(elem.rating_key)
+            return next((IntroMarker(start, end) for t, start, end in elem.markers if t == 'intro'), None)
+
+        return EpisodeSession(
+            key=elem.session_key,
+            state=elem.state,  # type: ignore
+            rating_key=elem.rating_key,
+            title=f'{elem.grandparent_title} - {elem.title}',
+            player_id=elem.player_id,
+            player_address=elem.player_address,
+            player_title=elem.player_title,
+            view_offset_ms=elem.view_offset_ms,
+            observed_at=observed_at,
+            intro_marker=self._cached_intro_marker(elem.rating_key, read),
+        )
+
 
 class SessionListener(ABC):
     def accept_session(self, session: Session) -> bool:
@@ -107,31 +255,42 @@ class SessionExtrapolator(ABC):
     @abstractmethod
     def extrapolate(self, session: Session) -> Tuple[Session, int]:
         """
-        Returns the extrapolated session and the extrapolation delay in ms.
-        Called iff trigger_extrapolation(session) returns True.
+        Returns the session to dispatch after the extrapolation delay, and that
+        delay in ms. Called iff trigger_extrapolation(session) returns True.
         """
         pass
 
 
 class SessionDispatcher:
-    def __init__(self, listener: SessionListener, removal_timeout_sec: int = 20):
+    def __init__(
+        self,
+        listener: SessionListener,
+        removal_timeout_sec: float = 20,
+        clock: Callable[[], float] = time.monotonic,
+    ):
         # Plex's session WebSocket announces every 10 second, so we
         # conservatively set the default removal_timeout_sec to 20 seconds.
         self._listener = listener
         self._removal_timeout_sec = removal_timeout_sec
+        self._clock = clock
         # Sessions to track and potentially remove after a period of
-        # removal_timeout_sec with no dispatching attempt.
-        self._last_active: Dict[Session, datetime] = {}
+        # removal_timeout_sec with no dispatching attempt, with the time of
+        # that attempt. Ordered from least to most recently active.
+        self._last_active: Dict[SessionKey, Tuple[Session, float]] = {}
+
+    def set_removal_timeout_sec(self, removal_timeout_sec: float):
+        """Applies to the sessions already tracked too."""
+        self._removal_timeout_sec = removal_timeout_sec
 
     def dispatch(self, session: Session) -> bool:
         """
         Dispatches the session if listener.accept_session(session) is True.
         Returns the result of that call.
         """
-        if isinstance(session, EpisodeSession) and session not in self._last_active:
+        if isinstance(session, EpisodeSession) and session.key not in self._last_active:
             logger.info(
-                f'New session {session.key}: {session.player} is playing {session.playable} '
-                f'(intro marker = {session.playable.hasIntroMarker})'
+                'New session %s: %s is playing %s (intro marker = %s)',
+                session.key, session.player_title, session.title, session.intro_marker is not None,
             )
 
         accepted = False
@@ -139,30 +298,36 @@ class SessionDispatcher:
             accepted = True
             self._listener.on_session_activity(session)
 
-        now = datetime.now()
-        self._last_active[session] = now
+        now = self._clock()
+        # Re-insert to move the session to the end. This also keeps the latest
+        # session object, which the listener gets on removal.
+        self._last_active.pop(session.key, None)
+        self._last_active[session.key] = (session, now)
 
         # Remove sessions that we haven't seen in the last removal_timeout_sec
         # period, in case dispatch_removal() wasn't called for some reason.
-        timeout_ago = now - timedelta(seconds=self._removal_timeout_sec)
-        for s, last_active in list(self._last_active.items()):
-            if last_active <= timeout_ago:
-                self._dispatch_removal(s)
+        # Only the expired sessions, which come first, have to be looked at.
+        timeout_ago = now - self._removal_timeout_sec
+        while self._last_active:
+            s, last_active = next(iter(self._last_active.values()))
+            if last_active > timeout_ago:
+                break
+            self._dispatch_removal(s)
 
         return accepted
 
     def _dispatch_removal(self, session: Session):
         if isinstance(session, EpisodeSession):
-            logger.info(f'Session {session.key} ended: {session.player} stopped playing {session.playable}')
+            logger.info('Session %s ended: %s stopped playing %s', session.key, session.player_title, session.title)
         self._listener.on_session_removal(session)
-        del self._last_active[session]
+        del self._last_active[session.key]
 
     def dispatch_removal(self, removed_key: SessionKey) -> bool:
-        for s in list(self._last_active.keys()):
-            if s.key == removed_key:
-                self._dispatch_removal(s)
-                return True
-        return False
+        tracked = self._last_active.get(removed_key)
+        if tracked is None:
+            return False
+        self._dispatch_removal(tracked[0])
+        return True
 
 
 class SessionNotFoundError(Exception):
@@ -171,17 +336,100 @@ class SessionNotFoundError(Exception):
 
 
 class SessionProvider:
-    def __init__(self, server: PlexServer):
+    """Provides sessions from the server.
+
+    With lean=True, sessions are parsed straight from the server's XML rather
+    than through plexapi, which builds full object graphs (media, parts,
+    streams, users...) for every session on every request.
+    """
+
+    def __init__(
+        self,
+        server: PlexServer,
+        intro_markers: Optional[IntroMarkerStore] = None,
+        clock: Callable[[], float] = time.monotonic,
+        lean: bool = False,
+    ):
         self._server = server
+        self._factory = SessionFactory(intro_markers, clock=clock)
+        self._clock = clock
+        self._lean = lean
 
     def provide(self, session_key: str) -> Session:
         """Raises SessionNotFoundError when the session could not be found."""
+        if self._lean:
+            return self._provide_lean(session_key)
+
+        requested_at = self._clock()
         sessions = self._server.sessions()
+        # The server read the view offsets at some point during the request,
+        # so assume it was halfway through.
+        observed_at = (requested_at + self._clock()) / 2
+
         playable: Playable
         for playable in sessions:
-            if str(playable.sessionKey) == session_key:
-                return SessionFactory.make(playable)
-        raise SessionNotFoundError(f'could not find session key {session_key} among {sessions}')
+            if str(_peek(playable, 'sessionKey')) == session_key:
+                return self._factory.make(playable, observed_at)
+        # Not the sessions themselves, whose repr may reload them.
+        keys = [str(_peek(p, 'sessionKey')) for p in sessions]
+        raise SessionNotFoundError(f'could not find session key {session_key} among {keys}')
+
+    def provide_polled(self, elem: SessionElement, observed_at: float) -> Session:
+        """Makes the session from an item the caller already fetched."""
+        return self._factory.make_from_element(elem, observed_at, self._read_intro_marker)
+
+    def _provide_lean(self, session_key: str) -> Session:
+        requested_at = self._clock()
+        with _stream(self._server, '/status/sessions') as source:
+            found = next((e for e in iter_session_elements(source) if e.session_key == session_key), None)
+        # Same as above, though this also counts the parsing until the session.
+        observed_at = (requested_at + self._clock()) / 2
+
+        if found is None:
+            raise SessionNotFoundError(f'could not find session key {session_key}')
+        return self._factory.make_from_element(found, observed_at, self._read_intro_marker)
+
+    def _read_intro_marker(self, rating_key: str) -> Optional[IntroMarker]:
+        with _stream(self._server, f'/library/metadata/{rating_key}?includeMarkers=1') as source:
+            marker = read_intro_marker_element(source)
+        return None if marker is None else IntroMarker(*marker)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'intro_marker_hits': self._factory.intro_marker_hits,
+            'intro_marker_misses': self._factory.intro_marker_misses,
+        }
+
+
+@contextmanager
+def _stream(server: PlexServer, path: str) -> Iterator[BinaryIO]:
+    """Yields the body of the server's response, as it's received.
+
+    Raises the same exceptions as PlexServer.query().
+    """
+    response = server._session.get(
+        server.url(path),
+        headers=server._headers(),
+        timeout=plexapi.TIMEOUT,
+        stream=True,
+    )
+    try:
+        if response.status_code != 200:
+            message = f'({response.status_code}) {response.url}'
+            if response.status_code == 401:
+                raise Unauthorized(message)
+            elif response.status_code == 404:
+                raise NotFound(message)
+            raise BadRequest(message)
+        # Let urllib3 decompress the body, if needed.
+        response.raw.decode_content = True
+        yield response.raw
+        # The caller may stop reading early. Read the rest of the body, or
+        # closing the response would drop the pooled keep-alive connection.
+        for _ in iter(lambda: response.raw.read(65536), b''):
+            pass
+    finally:
+        response.close()
 
 
 class SessionDiscovery:
@@ -191,58 +439,120 @@ class SessionDiscovery:
         provider: SessionProvider,
         dispatcher: SessionDispatcher,
         extrapolator: SessionExtrapolator,
+        trace: Optional[TraceBuffer] = None,
+        max_timers: int = 1000,
+        scheduler: Optional[Scheduler] = None,
+        request_counter: Optional[RequestCounter] = None,
     ):
         self._server = server
         self._provider = provider
         self._dispatcher = dispatcher
         self._extrapolator = extrapolator
+        self._trace = trace or TraceBuffer()
+        self._request_counter = request_counter or RequestCounter()
+        self._scheduler = scheduler or ThreadingScheduler()
+        # Reentrant, since timers may be called back from the thread that
+        # scheduled them (see VirtualScheduler).
+        self._lock = threading.RLock()
 
         # To avoid leaks, preserve the following invariant:
         # timer in dict <=> timer alive,
         # where alive = started and not (done executing or cancelled).
-        self._timers: Dict[SessionKey, threading.Timer] = {}
+        self._timers: Dict[SessionKey, ScheduledCall] = {}
+        # In case the invariant breaks anyway, the number of timers is capped:
+        # past that, dead timers are pruned, then the oldest ones cancelled.
+        self._max_timers = max_timers
 
-    @synchronized
     def alert_callback(self, alert: NotificationContainerDict):
+        """Handles the alert.
+
+        Can be called from several threads at once, as long as the alerts of a
+        given session are handled in order.
+        """
         if alert['type'] == 'playing':
             # Never seen a case where the alert doesn't contain exactly one
             # notification, but let's loop over the list out of caution.
             for notification in alert['PlaySessionStateNotification']:  # type: ignore
-                self._handle_notification(notification)
+                with self._request_counter.scope('notification'):
+                    self._handle_notification(notification)
+
+    def _prune_timers(self):
+        for key, timer in list(self._timers.items()):
+            if timer.done:
+                logger.warning('Pruned dead timer for session key %s', key)
+                del self._timers[key]
+        while len(self._timers) > self._max_timers:
+            # Dicts are ordered, so this is the oldest timer.
+            key = next(iter(self._timers))
+            logger.warning('Too many timers, cancelled the one for session key %s', key)
+            self._timers.pop(key).cancel()
+
+    def sizes(self) -> Dict[str, int]:
+        return {'timers': len(self._timers)}
+
+    def close(self):
+        """Cancels the pending timers, e.g. before being replaced."""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+
+    def pending_timers(self) -> Dict[SessionKey, float]:
+        """Returns the time left until the pending timers in seconds, by session key."""
+        now = self._scheduler.now()
+        return {key: max(timer.due_at - now, 0) for key, timer in list(self._timers.items())}
 
-    @synchronized
     def _dispatch_and_schedule_extrapolated(self, session: Session):
         """Dispatches the specified session and potentially extrapolates it."""
-        accepted = self._dispatcher.dispatch(session)
-
-        # Preserve the timers invariant: this thread will die if this session
-        # doesn't trigger an extrapolation. Note there won't be a dict entry
-        # if this function wasn't called as part of a timer, so popping nothing
-        # is fine.
-        self._timers.pop(session.key, None)
-
-        if not self._extrapolator.trigger_extrapolation(session, accepted):
-            logger.debug(f'Will not extrapolate session {session}')
-            return
-
-        assert session.key not in self._timers
-        new_session, delay_ms = self._extrapolator.extrapolate(session)
-        delay_sec = delay_ms / 1000
-        new_timer = threading.Timer(
-            delay_sec,
-            self._dispatch_and_schedule_extrapolated,
-            args=(new_session,),
-        )
-        new_timer.daemon = True
-        new_timer.start()
-        self._timers[new_session.key] = new_timer
+        with self._lock:
+            self._trace.record(session.key, 'dispatch', session.state)
+            accepted = self._dispatcher.dispatch(session)
+
+            # Preserve the timers invariant: this timer will die if this
+            # session doesn't trigger an extrapolation. Note there won't be a
+            # dict entry if this function wasn't called as part of a timer, so
+            # popping nothing is fine.
+            self._timers.pop(session.key, None)
+
+            if not self._extrapolator.trigger_extrapolation(session, accepted):
+                logger.debug('Will not extrapolate session %s', session)
+                return
 
-        logger.debug(
-            f'Timer (delay={delay_sec:.3f}s) started for extrapolated session '
-            f'{new_session} (original: {session})'
-        )
+            assert session.key not in self._timers
+            new_session, delay_ms = self._extrapolator.extrapolate(session)
+            delay_sec = delay_ms / 1000
+
+            def on_timer():
+                self._on_timer(new_session, new_timer)
+
+            new_timer = self._scheduler.call_later(delay_sec, on_timer)
+            self._timers[new_session.key] = new_timer
+            if len(self._timers) > self._max_timers:
+                self._prune_timers()
+            self._trace.record(new_session.key, 'timer_scheduled', '%.3fs' % delay_sec)
+
+            logger.debug(
+                'Timer (delay=%.3fs) started for extrapolated session %s (original: %s)',
+                delay_sec, new_session, session,
+            )
+
+    def _on_timer(self, session: Session, timer: ScheduledCall):
+        with self._request_counter.scope('tick'), self._lock:
+            if self._timers.get(session.key) is not timer:
+                # A notification came in for this session while we were
+                # waiting for the lock, which superseded this timer.
+                logger.debug('Ignored superseded timer for session key %s', session.key)
+                return
+            self._trace.record(session.key, 'timer_fired')
+            self._dispatch_and_schedule_extrapolated(session)
+
+    def _provide(self, notification: PlaybackNotification) -> Session:
+        # Polled notifications come with the session, no need to fetch it again.
+        if 'element' in notification:
+            polled = cast(PolledPlaybackNotification, notification)
+            return self._provider.provide_polled(polled['element'], polled['observedAt'])
+        return self._provider.provide(str(notification['sessionKey']))
 
-    @synchronized
     def _handle_notification(self, notification: PlaybackNotification):
         # Dispatch regular notifications and simulate the rest while extrapoling
         # viewOffset using a timer. When a regular notification comes in, we
@@ -251,30 +561,37 @@ class SessionDiscovery:
 
         # Ensure this is a string because I don't trust the Plex API.
         session_key = str(notification['sessionKey'])
+        self._trace.record(session_key, 'notification', notification['state'])
         logger.debug(
-            f'Incoming notification for session key {session_key} '
-            f'(state = {notification["state"]})'
+            'Incoming notification for session key %s (state = %s)',
+            session_key, notification['state'],
         )
 
-        # Incoming regular notification, stop the active timer if any. And even
-        # though we might recreate one on the spot, let's also remove the dict
-        # entry to prevent any leak.
-        old_timer = self._timers.pop(session_key, None)
-        if old_timer:
-            old_timer.cancel()
-            logger.debug(f'Cancelled timer for session key {session_key}')
-        else:
-            logger.debug(f'No existing timer for session key {session_key}')
-
-        if notification['state'] == 'stopped':
-            # The HTTP API won't contain the session anymore, so just dispatch
-            # the removal and return.
-            self._dispatcher.dispatch_removal(session_key)
-            return
+        with self._lock:
+            # Incoming regular notification, stop the active timer if any. And
+            # even though we might recreate one on the spot, let's also remove
+            # the dict entry to prevent any leak.
+            old_timer = self._timers.pop(session_key, None)
+            if old_timer:
+                old_timer.cancel()
+                self._trace.record(session_key, 'timer_cancelled')
+                logger.debug('Cancelled timer for session key %s', session_key)
+            else:
+                logger.debug('No existing timer for session key %s', session_key)
+
+            if notification['state'] == 'stopped':
+                # The HTTP API won't contain the session anymore, so just
+                # dispatch the removal and return.
+                self._dispatcher.dispatch_removal(session_key)
+                return
 
+        # Fetch the session without holding the lock, so that other sessions
+        # can be handled in the meantime.
+        self._trace.record(session_key, 'provide_start')
         try:
-            session = self._provider.provide(session_key)
+            session = self._provide(notification)
         except SessionNotFoundError:
+            self._trace.record(session_key, 'provide_end', 'not found')
             if notification['state'] == 'paused':
                 # Plex is a little weird and sometimes sends a session
                 # on the WebSocket even though the HTTP API doesn't
@@ -286,7 +603,7 @@ class SessionDiscovery:
                 # state. Anyway this is an icky situation and we'll get
                 # notified if playback starts anyway, so just return
                 # here.
-                logger.debug(f"No session found for 'paused' notification")
+                logger.debug("No session found for 'paused' notification")
                 return
             elif notification['state'] == 'buffering':
                 # Encountered this issue with an iPhone client that would buffer
@@ -295,8 +612,9 @@ class SessionDiscovery:
                 # session, until the first 'playing' notification. Not a huge
                 # deal anyway as long as we get our 'playing' notification, so
                 # let's just warn here.
-                logger.warning(f"No session found for 'buffering' notification")
+                logger.warning("No session found for 'buffering' notification")
                 return
             raise
+        self._trace.record(session_key, 'provide_end')
 
         self._dispatch_and_schedule_extrapolated(session)
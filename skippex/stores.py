@@ -1,8 +1,30 @@
-from typing import Dict, List, MutableMapping, Tuple, Union
+import dbm
+import json
+import logging
+from pathlib import Path
+import queue
+import shelve
+import sqlite3
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from uuid import uuid4
 
 
+logger = logging.getLogger(__name__)
+
 # Only allow storing built-in types because other objects are tricky to
 # (de)serialize when their structure changes.
 DatabaseValue = Union[
@@ -14,10 +36,44 @@ DatabaseValue = Union[
 
 DatabaseStore = MutableMapping[str, DatabaseValue]
 
+# Maps a ratingKey to the (start, end) of its intro marker in ms, or to None if
+# the media has no intro marker.
+IntroMarkerStore = MutableMapping[str, Optional[Tuple[int, int]]]
+
+
+class SkipRecord(NamedTuple):
+    session_key: str
+    rating_key: str
+    player_id: str
+    from_ms: int
+    to_ms: int
+    skipped_at: float  # Unix time.
+
+
+class SkipHistory:
+    """In-memory history of the skips, mostly useful for testing."""
+
+    def __init__(self):
+        self._records: List[SkipRecord] = []
+
+    def record(self, skip: SkipRecord):
+        self._records.append(skip)
+
+    def recent(self, limit: int = 20) -> List[SkipRecord]:
+        """Returns the latest skips, most recent first."""
+        return self._records[-limit:][::-1]
+
 
 class Database:
-    def __init__(self, store: DatabaseStore):
+    def __init__(
+        self,
+        store: DatabaseStore,
+        intro_markers: Optional[IntroMarkerStore] = None,
+        skip_history: Optional[SkipHistory] = None,
+    ):
         self._store = store
+        self.intro_markers: IntroMarkerStore = {} if intro_markers is None else intro_markers
+        self.skip_history = SkipHistory() if skip_history is None else skip_history
 
     @property
     def app_id(self) -> str:
@@ -35,3 +91,294 @@ class Database:
 
     def content(self) -> DatabaseStore:
         return dict(self._store.items())
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS intro_markers (
+    rating_key TEXT PRIMARY KEY,
+    start_ms INTEGER,  -- NULL if the media has no intro marker.
+    end_ms INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS skips (
+    id INTEGER PRIMARY KEY,
+    session_key TEXT NOT NULL,
+    rating_key TEXT NOT NULL,
+    player_id TEXT NOT NULL,
+    from_ms INTEGER NOT NULL,
+    to_ms INTEGER NOT NULL,
+    skipped_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS skips_skipped_at ON skips (skipped_at);
+'''
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    # Autocommit mode: we manage transactions ourselves.
+    conn = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+    # WAL lets readers and a writer, from this process or another, work
+    # concurrently. And with it, synchronous=NORMAL only syncs to disk when
+    # checkpointing rather than on every commit.
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    return conn
+
+
+class _BatchWriter:
+    """Applies writes from a background thread, several per transaction.
+
+    Callers only enqueue statements, so they never wait on the disk. Writes
+    aren't visible to readers until the batch they're in is committed.
+    """
+
+    def __init__(self, path: Path, flush_interval_sec: float = 1, max_batch_size: int = 500):
+        self._path = path
+        self._flush_interval_sec = flush_interval_sec
+        self._max_batch_size = max_batch_size
+        # Items are either (sql, params, on_commit) tuples, or events to set
+        # once all the previous statements are committed.
+        self._queue: 'queue.Queue[Any]' = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='DatabaseWriter', daemon=True)
+        self._thread.start()
+
+    def execute(self, sql: str, params: Tuple = (), on_commit: Optional[Callable[[], None]] = None):
+        """on_commit is called from the writer thread once the statement's batch
+        is done with, even if it couldn't be committed.
+        """
+        self._queue.put((sql, params, on_commit))
+
+    def flush(self):
+        """Blocks until all the statements enqueued so far are committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        conn = _connect(self._path)
+        try:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self._flush_interval_sec
+                while batch[-1] is not None and len(batch) < self._max_batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0 or isinstance(batch[-1], threading.Event):
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                self._commit(conn, batch)
+                if batch[-1] is None:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Any]):
+        statements = [item for item in batch if isinstance(item, tuple)]
+        if statements:
+            try:
+                conn.execute('BEGIN')
+                for sql, params, _ in statements:
+                    conn.execute(sql, params)
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                logger.exception(f'Could not write a batch of {len(statements)} statements')
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+        for _, _, on_commit in statements:
+            if on_commit:
+                on_commit()
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+
+
+class SqliteIntroMarkerStore(IntroMarkerStore):
+    """Intro markers cache backed by SQLite, with batched writes.
+
+    Media without intro markers may get some once analyzed by the server, so
+    those entries expire after negative_ttl_sec.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock, writer: _BatchWriter,
+                 negative_ttl_sec: float = 3600):
+        self._conn = conn
+        self._lock = lock
+        self._writer = writer
+        self._negative_ttl_sec = negative_ttl_sec
+        # Written entries, visible until the writer commits them. Past that,
+        # reads go to the database, which other workers may write to as well.
+        self._pending: Dict[str, Tuple[Optional[Tuple[int, int]], float]] = {}
+        self._pending_lock = threading.Lock()
+
+    def _get(self, rating_key: str) -> Tuple[Optional[Tuple[int, int]], float]:
+        with self._pending_lock:
+            pending = self._pending.get(rating_key)
+        if pending is not None:
+            return pending
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT start_ms, end_ms, updated_at FROM intro_markers WHERE rating_key = ?',
+                (rating_key,),
+            ).fetchone()
+        if row is None:
+            raise KeyError(rating_key)
+        start_ms, end_ms, updated_at = row
+        marker = None if start_ms is None else (start_ms, end_ms)
+        return marker, updated_at
+
+    def __getitem__(self, rating_key: str) -> Optional[Tuple[int, int]]:
+        marker, updated_at = self._get(rating_key)
+        if marker is None and time.time() - updated_at > self._negative_ttl_sec:
+            raise KeyError(rating_key)
+        return marker
+
+    def __setitem__(self, rating_key: str, marker: Optional[Tuple[int, int]]):
+        updated_at = time.time()
+        with self._pending_lock:
+            self._pending[rating_key] = (marker, updated_at)
+        start_ms, end_ms = marker if marker is not None else (None, None)
+        self._writer.execute(
+            'INSERT OR REPLACE INTO intro_markers (rating_key, start_ms, end_ms, updated_at) VALUES (?, ?, ?, ?)',
+            (rating_key, start_ms, end_ms, updated_at),
+            on_commit=lambda: self._forget_pending(rating_key, updated_at),
+        )
+
+    def _forget_pending(self, rating_key: str, updated_at: float):
+        with self._pending_lock:
+            pending = self._pending.get(rating_key)
+            # Unless it was written again since.
+            if pending is not None and pending[1] == updated_at:
+                del self._pending[rating_key]
+
+    def __delitem__(self, rating_key: str):
+        with self._pending_lock:
+            self._pending.pop(rating_key, None)
+        self._writer.execute('DELETE FROM intro_markers WHERE rating_key = ?', (rating_key,))
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute('SELECT rating_key FROM intro_markers').fetchall()
+        with self._pending_lock:
+            pending = set(self._pending)
+        return iter({row[0] for row in rows} | pending)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SqliteSkipHistory(SkipHistory):
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock, writer: _BatchWriter):
+        self._conn = conn
+        self._lock = lock
+        self._writer = writer
+
+    def record(self, skip: SkipRecord):
+        self._writer.execute(
+            'INSERT INTO skips (session_key, rating_key, player_id, from_ms, to_ms, skipped_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            tuple(skip),
+        )
+
+    def recent(self, limit: int = 20) -> List[SkipRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT session_key, rating_key, player_id, from_ms, to_ms, skipped_at '
+                'FROM skips ORDER BY skipped_at DESC LIMIT ?',
+                (limit,),
+            ).fetchall()
+        return [SkipRecord(*row) for row in rows]
+
+
+class SqliteStore(DatabaseStore):
+    """Key-value store backed by SQLite in WAL mode.
+
+    Unlike a shelf, it can be used by several processes at the same time. It
+    also holds the tables for high-volume data, which are written in batches
+    from a background thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = _connect(path)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._writer = _BatchWriter(path)
+        self.intro_markers = SqliteIntroMarkerStore(self._conn, self._lock, self._writer)
+        self.skip_history = SqliteSkipHistory(self._conn, self._lock, self._writer)
+
+    @classmethod
+    def open(cls, path: Path, legacy_shelf_path: Optional[Path] = None) -> 'SqliteStore':
+        """Opens the store, migrating the legacy shelf if it's being created."""
+        migrate = (
+            legacy_shelf_path is not None
+            and not path.exists()
+            and bool(dbm.whichdb(str(legacy_shelf_path)))
+        )
+        store = cls(path)
+        if migrate:
+            with shelve.open(str(legacy_shelf_path), flag='r') as shelf:
+                store.update_many(dict(shelf.items()))
+            logger.info(f'Migrated database {legacy_shelf_path} to {path}')
+        return store
+
+    def update_many(self, items: Dict[str, DatabaseValue]):
+        """Like update(), but in a single transaction."""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)',
+                    [(k, json.dumps(v)) for k, v in items.items()],
+                )
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def flush(self):
+        """Blocks until all the batched writes are committed."""
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+        with self._lock:
+            self._conn.close()
+
+    def __getitem__(self, key: str) -> DatabaseValue:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key: str, value: DatabaseValue):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute('SELECT key FROM kv').fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM kv').fetchone()[0]
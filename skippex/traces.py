@@ -0,0 +1,108 @@
+from collections import deque
+import itertools
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Deque, List, NamedTuple, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class TraceEvent(NamedTuple):
+    at: float  # Monotonic, in seconds.
+    session_key: str
+    kind: str
+    detail: Optional[str] = None
+
+
+class TraceBuffer:
+    """Fixed-size in-memory record of what happened to each session.
+
+    Recording an event is cheap enough to be done unconditionally, unlike
+    debug logging. The events can then be dumped to a file after the fact, e.g.
+    to find out why an intro was skipped late.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 10000,
+        dump_dir: Optional[Path] = None,
+        min_dump_interval_sec: float = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        # Appending to a bounded deque is atomic, so no lock is needed.
+        self._events: Deque[TraceEvent] = deque(maxlen=capacity)
+        self._dump_dir = dump_dir
+        self._min_dump_interval_sec = min_dump_interval_sec
+        self._clock = clock
+        self._last_dump_at: Optional[float] = None
+        self._dump_lock = threading.Lock()
+        # Tells apart the dumps made in the same second.
+        self._dump_counter = itertools.count()
+
+    def record(self, session_key: str, kind: str, detail: Optional[str] = None):
+        self._events.append(TraceEvent(self._clock(), session_key, kind, detail))
+
+    def events(self, session_key: Optional[str] = None) -> List[TraceEvent]:
+        """Returns the recorded events, oldest first."""
+        events = list(self._events)
+        if session_key is None:
+            return events
+        return [e for e in events if e.session_key == session_key]
+
+    def dump(self, reason: str, force: bool = False, background: bool = False) -> Optional[Path]:
+        """Writes the recorded events to a new file in dump_dir.
+
+        Unless forced, dumps are skipped if the previous one happened less than
+        min_dump_interval_sec ago, so that a burst of missed skips doesn't
+        write the same events over and over. Returns the file written, if any.
+
+        With background=True, the events are written by another thread, so
+        that callers holding locks don't wait on the disk. The file it's
+        written to is returned right away.
+        """
+        if self._dump_dir is None:
+            return None
+
+        with self._dump_lock:
+            now = self._clock()
+            if (
+                not force
+                and self._last_dump_at is not None
+                and now - self._last_dump_at < self._min_dump_interval_sec
+            ):
+                logger.debug('Skipped trace dump (%s): too soon after the previous one', reason)
+                return None
+            self._last_dump_at = now
+            n = next(self._dump_counter)
+
+        events = list(self._events)
+        # The PID tells apart the dumps of worker processes.
+        path = self._dump_dir / time.strftime(f'trace-%Y%m%d-%H%M%S-{os.getpid()}-{n}.jsonl')
+        if background:
+            threading.Thread(
+                target=self._write,
+                args=(path, reason, now, events),
+                name='TraceDump',
+                daemon=True,
+            ).start()
+            return path
+        return path if self._write(path, reason, now, events) else None
+
+    def _write(self, path: Path, reason: str, dumped_at: float, events: List[TraceEvent]) -> bool:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open('w') as f:
+                f.write(json.dumps({'reason': reason, 'dumped_at': dumped_at}) + '\n')
+                for event in events:
+                    f.write(json.dumps(event._asdict()) + '\n')
+        except OSError:
+            logger.exception('Could not dump the trace to %s', path)
+            return False
+
+        logger.info('Dumped %s trace events to %s (%s)', len(events), path, reason)
+        return True
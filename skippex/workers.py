@@ -0,0 +1,138 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import zlib
+
+from .notifications import NotificationContainerDict
+
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(session_key: str, shards: int) -> int:
+    # Unlike hash(), stable across processes and runs.
+    return zlib.crc32(session_key.encode()) % shards
+
+
+class ShardedWorkers:
+    """Routes alerts to worker processes by session key.
+
+    Each worker runs target(index, alerts_queue, *args), which has to handle
+    the alerts it gets from the queue until it gets None. The notifications of
+    a given session always go to the same worker, in order. Workers that die
+    are restarted from a monitoring thread, and get the alerts that were
+    routed to them in the meantime.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        target: Callable[..., None],
+        args: Sequence[Any] = (),
+        max_queue_size: int = 1024,
+        monitor_interval_sec: float = 1,
+    ):
+        # Spawn rather than fork, since this process runs threads.
+        self._context = multiprocessing.get_context('spawn')
+        self._target = target
+        self._args = tuple(args)
+        self._queues = [self._context.Queue(max_queue_size) for _ in range(count)]
+        self._processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * count
+        self._lock = threading.Lock()
+        self._monitor_interval_sec = monitor_interval_sec
+        self._closing = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        self.dropped = 0
+        self.restarts = 0
+
+    def start(self):
+        for index in range(len(self._processes)):
+            self._start_worker(index)
+        self._monitor = threading.Thread(target=self._monitor_workers, name='WorkerMonitor', daemon=True)
+        self._monitor.start()
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=self._target,
+            args=(index, self._queues[index]) + self._args,
+            name=f'Worker-{index}',
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+        logger.debug('Started worker %s (PID %s)', index, process.pid)
+
+    def _monitor_workers(self):
+        while True:
+            sentinels = [p.sentinel for p in self._processes if p is not None]
+            # Returns as soon as a worker exits.
+            multiprocessing.connection.wait(sentinels, timeout=self._monitor_interval_sec)
+            if self._closing.is_set():
+                return
+            if self._restart_dead_workers():
+                # Don't spin on workers that die right away.
+                self._closing.wait(self._monitor_interval_sec)
+
+    def _restart_dead_workers(self) -> bool:
+        restarted = False
+        with self._lock:
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._closing.is_set():
+                    logger.error('Worker %s died (exit code %s), restarting it', index, process.exitcode)
+                    self.restarts += 1
+                    self._start_worker(index)
+                    restarted = True
+        return restarted
+
+    def put(self, alert: NotificationContainerDict):
+        if alert['type'] != 'playing':
+            return
+        for notification in alert['PlaySessionStateNotification']:  # type: ignore
+            index = shard_of(str(notification['sessionKey']), len(self._queues))
+            try:
+                self._queues[index].put_nowait({'type': 'playing', 'PlaySessionStateNotification': [notification]})
+            except queue.Full:
+                self.dropped += 1
+                logger.warning('Worker %s is falling behind, dropped a notification', index)
+
+    def pids(self) -> List[int]:
+        return [p.pid for p in self._processes if p is not None and p.pid is not None]
+
+    def stats(self) -> Dict[str, Any]:
+        depths: List[Optional[int]] = []
+        for q in self._queues:
+            try:
+                depths.append(q.qsize())
+            except NotImplementedError:  # macOS.
+                depths.append(None)
+        return {
+            'count': len(self._processes),
+            'alive': sum(1 for p in self._processes if p is not None and p.is_alive()),
+            'restarts': self.restarts,
+            'dropped': self.dropped,
+            'depths': depths,
+        }
+
+    def close(self, timeout_sec: float = 5):
+        with self._lock:
+            self._closing.set()
+        for q, process in zip(self._queues, self._processes):
+            if process is not None and process.is_alive():
+                try:
+                    q.put(None, timeout=timeout_sec)
+                except queue.Full:
+                    pass
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout_sec)
+            if process.is_alive():
+                logger.warning('Worker %s did not stop in time, terminating it', process.name)
+                process.terminate()
+                process.join()
+        # Returns once it notices the workers exited.
+        if self._monitor:
+            self._monitor.join()
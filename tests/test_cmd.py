@@ -1,9 +1,30 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+from pathlib import Path
+import queue
+import threading
+import time
+from unittest.mock import MagicMock, Mock, patch
 
+from plexapi.exceptions import NotFound
 import pytest
+import requests
 
 from skippex.auth import PlexApplication
-from skippex.cmd import EXIT_UNAUTHORIZED, cmd_run
+from skippex.cmd import (
+    EXIT_UNAUTHORIZED,
+    _connect_server,
+    _DeferredQueueHandler,
+    _build_pipeline,
+    _JsonLinesFormatter,
+    _reload_config,
+    _Runner,
+    cmd_run,
+)
+from skippex.config import Config
+from skippex.seekables import ChromecastMonitor
 from skippex.stores import Database
 
 
@@ -28,3 +49,150 @@ def test_cmd_run__empty_db_returns_exit_unauthorized(
     app: PlexApplication
 ):
     assert cmd_run(args, db, app) == EXIT_UNAUTHORIZED
+
+
+def test_cmd_run__invalid_workers_fails_before_connecting(tmp_path: Path, app: PlexApplication):
+    db = Database({'auth_token': 'token'})
+    args = argparse.Namespace(config=tmp_path / 'config.json', debug=False, server=None, workers=0)
+
+    with patch('skippex.cmd._reconfigure_logging'), \
+            patch('skippex.cmd.PlexAuthClient') as auth_client, \
+            patch('skippex.cmd._lookup_server') as lookup_server:
+        assert cmd_run(args, db, app) == 1
+
+    auth_client.assert_not_called()
+    lookup_server.assert_not_called()
+
+
+def _make_connection(uri: str, local: bool) -> Mock:
+    connection = Mock()
+    connection.uri = uri
+    connection.httpuri = uri.replace('https://', 'http://')
+    connection.local = local
+    return connection
+
+
+@pytest.fixture
+def server_resource() -> Mock:
+    resource = Mock()
+    resource.name = 'dummy'
+    resource.owned = True
+    resource.accessToken = 'dummy_token'
+    resource.connections = [
+        _make_connection('https://remote', local=False),
+        _make_connection('https://lan', local=True),
+    ]
+    return resource
+
+
+def test_connect_server__returns_first_to_answer(server_resource: Mock):
+    def fake_plex_server(url, token, timeout=None):
+        if url == 'https://remote':
+            time.sleep(0.5)
+        return url
+
+    with patch('skippex.cmd.PlexServer', side_effect=fake_plex_server):
+        assert _connect_server(server_resource) == 'https://lan'
+
+
+def test_connect_server__falls_back_to_http(server_resource: Mock):
+    def fake_plex_server(url, token, timeout=None):
+        if url.startswith('https://'):
+            raise ConnectionError
+        return url
+
+    with patch('skippex.cmd.PlexServer', side_effect=fake_plex_server):
+        assert _connect_server(server_resource) in {'http://remote', 'http://lan'}
+
+
+def test_connect_server__raises_not_found(server_resource: Mock):
+    with patch('skippex.cmd.PlexServer', side_effect=ConnectionError):
+        with pytest.raises(NotFound):
+            _connect_server(server_resource)
+
+
+def test_deferred_queue_handler__does_not_format():
+    log_queue: 'queue.Queue[logging.LogRecord]' = queue.Queue()
+    handler = _DeferredQueueHandler(log_queue)
+    arg = MagicMock()
+    record = logging.LogRecord('dummy', logging.DEBUG, __file__, 1, 'arg=%s', (arg,), None)
+
+    handler.emit(record)
+
+    assert log_queue.get_nowait() is record
+    arg.__str__.assert_not_called()
+
+
+def test_json_lines_formatter():
+    record = logging.LogRecord('dummy', logging.INFO, __file__, 1, 'value=%s', (1,), None)
+    entry = json.loads(_JsonLinesFormatter().format(record))
+    assert entry['level'] == 'INFO'
+    assert entry['message'] == 'value=1'
+
+
+def test_reload_config__keeps_current_if_invalid(tmp_path: Path):
+    path = tmp_path / 'config.json'
+    path.write_text('{"removal_timeout_sec": -1}')
+    assert _reload_config(path, Config(), debug=True) is None
+
+
+def test_reload_config__toggles_debug_logging(tmp_path: Path):
+    path = tmp_path / 'config.json'
+    with patch('skippex.cmd._reconfigure_logging') as reconfigure_logging:
+        path.write_text('{"debug": true}')
+        assert _reload_config(path, Config(), debug=False) == Config(debug=True)
+        reconfigure_logging.assert_called_with(debug=True)
+
+        # The command line still asks for it.
+        path.write_text('{}')
+        assert _reload_config(path, Config(debug=True), debug=True) == Config()
+        reconfigure_logging.assert_called_with(debug=True)
+
+
+def test_runner_reload__switches_server_before_run(tmp_path: Path, db: Database):
+    path = tmp_path / 'config.json'
+    path.write_text('{"server": "new"}')
+    args = argparse.Namespace(config=path, debug=False, server=None, chromecast=False, lean_sessions=False)
+    old_server = Mock(machineIdentifier='old')
+    new_server = Mock(machineIdentifier='new')
+
+    with patch('skippex.cmd._build_pipeline') as build_pipeline, \
+            patch.object(_Runner, '_connect', return_value=new_server), \
+            patch('skippex.cmd._reconfigure_logging'):
+        old_pipeline, new_pipeline = Mock(), Mock()
+        build_pipeline.side_effect = [old_pipeline, new_pipeline]
+        runner = _Runner(args, db, 'token', old_server, Config(server='old'))
+        runner.reload()
+
+    assert runner._server is new_server
+    assert runner._pipeline is new_pipeline
+    assert runner._next_server is None
+    old_pipeline.close.assert_called_once_with()
+
+
+def test_build_pipeline__close_stops_threads(db: Database):
+    def executor_threads():
+        return [t for t in threading.enumerate() if t.name.startswith(('SeekableProvider', 'Prewarm'))]
+
+    created = []
+
+    def make_executor(*args, **kwargs):
+        executor = ThreadPoolExecutor(*args, **kwargs)
+        created.append(executor)
+        return executor
+
+    with patch('skippex.core.ThreadPoolExecutor', side_effect=make_executor), \
+            patch('skippex.seekables.ThreadPoolExecutor', side_effect=make_executor):
+        for _ in range(3):
+            # As when reloading, or switching servers.
+            server = Mock(_session=requests.Session())
+            pipeline = _build_pipeline(server, db, Mock(spec=ChromecastMonitor), False, Config())
+            # Executors only start threads once used.
+            for executor in created:
+                executor.submit(lambda: None).result()
+            created.clear()
+            pipeline.close()
+
+    for thread in executor_threads():
+        thread.join(timeout=5)
+    assert not executor_threads()
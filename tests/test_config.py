@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import pytest
+
+from skippex.config import Config, ConfigError, changed_settings, load_config
+
+
+class TestLoadConfig:
+    def test_missing_file__returns_defaults(self, tmp_path: Path):
+        assert load_config(tmp_path / 'missing.json') == Config()
+
+    def test_reads_settings(self, tmp_path: Path):
+        path = tmp_path / 'config.json'
+        path.write_text('{"server": "Home", "removal_timeout_sec": 30}')
+        assert load_config(path) == Config(server='Home', removal_timeout_sec=30)
+
+    @pytest.mark.parametrize('content', [
+        'not json',
+        '[]',
+        '{"unknown": 1}',
+        '{"debug": "yes"}',
+        '{"player_timeout_sec": 0}',
+        '{"server": 1}',
+    ])
+    def test_raises_if_invalid(self, tmp_path: Path, content: str):
+        path = tmp_path / 'config.json'
+        path.write_text(content)
+        with pytest.raises(ConfigError):
+            load_config(path)
+
+
+def test_changed_settings():
+    assert changed_settings(Config(), Config(debug=True, server='Home')) == {'debug', 'server'}
+    assert changed_settings(Config(), Config()) == set()
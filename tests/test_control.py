@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pytest
+
+from skippex.control import ControlServer, query_status
+
+
+class TestControlServer:
+    def test_query_status__returns_status(self, tmp_path: Path):
+        server = ControlServer(tmp_path / 'test.sock', lambda: {'sessions': []})
+        server.start()
+        try:
+            assert query_status(server.path) == {'sessions': []}
+        finally:
+            server.close()
+
+        assert not server.path.exists()
+
+    def test_query_status__reports_errors(self, tmp_path: Path):
+        def status():
+            raise RuntimeError
+
+        server = ControlServer(tmp_path / 'test.sock', status)
+        server.start()
+        try:
+            assert 'error' in query_status(server.path)
+        finally:
+            server.close()
+
+    def test_start__replaces_stale_socket(self, tmp_path: Path):
+        path = tmp_path / 'test.sock'
+        path.touch()
+        server = ControlServer(path, lambda: {})
+        server.start()
+        try:
+            assert query_status(path) == {}
+        finally:
+            server.close()
+
+    def test_query_status__raises_if_not_running(self, tmp_path: Path):
+        with pytest.raises(OSError):
+            query_status(tmp_path / 'test.sock')
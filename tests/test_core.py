@@ -1,52 +1,500 @@
-from unittest.mock import Mock
+import logging
+import threading
+from typing import Optional, cast
+from unittest.mock import ANY, Mock, call
 
-from plexapi.base import Playable
-from plexapi.client import PlexClient
-from plexapi.video import Episode
 import pytest
 from typing_extensions import Literal
 
-from skippex.core import AutoSkipper
-from skippex.seekables import SeekableProvider
-from skippex.sessions import EpisodeSession
+from skippex.core import AutoSkipper, SeekLatencyEstimator
+from skippex.ratelimit import Priority, RateLimiter, priority_of
+from skippex.scheduling import VirtualScheduler
+from skippex.seekables import (
+    Seekable,
+    SeekableNotFoundError,
+    SeekableProvider,
+    SeekableProviderChain,
+    SeekSerializer,
+)
+from skippex.sessions import EpisodeSession, IntroMarker, SessionDispatcher
+from skippex.traces import TraceBuffer
 
 
 def make_episode_session(
     *,
     key: str = 'dummy',
     state: Literal['buffering', 'playing', 'paused', 'stopped'] = 'buffering',
-    playable: Episode,
-    player: PlexClient,
+    rating_key: str = 'dummy',
+    player_id: str = 'player',
     view_offset_ms: int = -1,
+    observed_at: float = 0.0,
+    intro_marker: Optional[IntroMarker] = None,
 ) -> EpisodeSession:
     return EpisodeSession(
         key=key,
         state=state,
-        playable=playable,
-        player=player,
+        rating_key=rating_key,
+        title='dummy',
+        player_id=player_id,
+        player_address='dummy',
+        player_title='dummy',
         view_offset_ms=view_offset_ms,
+        observed_at=observed_at,
+        intro_marker=intro_marker,
     )
 
 
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestSeekLatencyEstimator:
+    def test_estimate_ms__defaults_to_zero(self):
+        assert SeekLatencyEstimator().estimate_ms('player') == 0
+
+    def test_on_offset_observed__discounts_playback_since_seek(self):
+        clock = FakeClock()
+        estimator = SeekLatencyEstimator(clock=clock)
+
+        estimator.on_seek_sent('1', 'player', target_ms=10000)
+        clock.now = 5.0
+        # Playback resumed at the target 3s ago, so the seek took 2s.
+        assert estimator.on_offset_observed('1', 13000) == 2000
+        assert estimator.estimate_ms('player') == 2000
+
+    def test_on_offset_observed__ignores_offsets_before_target(self):
+        clock = FakeClock()
+        estimator = SeekLatencyEstimator(clock=clock)
+
+        estimator.on_seek_sent('1', 'player', target_ms=10000)
+        clock.now = 1.0
+        assert estimator.on_offset_observed('1', 5000) is None
+        assert estimator.estimate_ms('player') == 0
+
+    def test_on_offset_observed__smooths_estimate(self):
+        clock = FakeClock()
+        estimator = SeekLatencyEstimator(smoothing=0.5, clock=clock)
+
+        for latency_sec in (1.0, 3.0):
+            clock.now = 0.0
+            estimator.on_seek_sent('1', 'player', target_ms=10000)
+            clock.now = latency_sec
+            estimator.on_offset_observed('1', 10000)
+
+        assert estimator.estimate_ms('player') == 2000
+
+
 class TestAutoSkipper:
     @pytest.fixture
     def auto_skipper(self) -> AutoSkipper:
         provider = Mock(spec=SeekableProvider)
         return AutoSkipper(seekable_provider=provider)
 
-    def test_trigger_extrapolation__returns_false_if_past_intro(self, auto_skipper: AutoSkipper):
-        intro_marker = Mock()
-        intro_marker.type = 'intro'
-        intro_marker.start = 0
-        intro_marker.end = 1000
+    def test_on_session_activity__seeks_ahead_by_latency(self):
+        provider = Mock(spec=SeekableProvider)
+        estimator = Mock(spec=SeekLatencyEstimator)
+        estimator.estimate_ms.return_value = 2000
+        serializer = Mock(spec=SeekSerializer)
+        auto_skipper = AutoSkipper(
+            seekable_provider=provider,
+            latency_estimator=estimator,
+            scheduler=VirtualScheduler(),
+            seek_serializer=serializer,
+        )
+
+        session = make_episode_session(
+            state='playing',
+            intro_marker=IntroMarker(start=10000, end=60000),
+            view_offset_ms=8500,
+        )
+        auto_skipper.on_session_activity(session)
+
+        serializer.seek.assert_called_once_with('player', provider.provide_seekable.return_value, 60000, on_done=ANY)
+
+    def test_on_session_activity__reports_unskippable_once(self, caplog: pytest.LogCaptureFixture):
+        provider = Mock(spec=SeekableProvider)
+        provider.provide_seekable.side_effect = SeekableNotFoundError
+        auto_skipper = AutoSkipper(seekable_provider=provider, scheduler=VirtualScheduler())
+        session = make_episode_session(
+            state='playing',
+            intro_marker=IntroMarker(start=0, end=60000),
+            view_offset_ms=1000,
+        )
+
+        auto_skipper.on_session_activity(session)
+        auto_skipper.on_session_activity(session)
+
+        assert len([r for r in caplog.records if r.levelno >= logging.ERROR]) == 1
+
+    def test_extrapolate__lands_on_seek_point(self):
+        provider = Mock(spec=SeekableProvider)
+        estimator = Mock(spec=SeekLatencyEstimator)
+        estimator.estimate_ms.return_value = 2000
+        scheduler = VirtualScheduler()
+        auto_skipper = AutoSkipper(seekable_provider=provider, latency_estimator=estimator, scheduler=scheduler)
+
+        session = make_episode_session(
+            state='playing',
+            intro_marker=IntroMarker(start=10000, end=60000),
+            view_offset_ms=7000,
+        )
+        scheduler.run_until(0.6)
+        new_session, delay_ms = auto_skipper.extrapolate(session)
+
+        assert delay_ms == 400
+        assert cast(EpisodeSession, new_session).current_view_offset_ms(scheduler.now() + 0.4) == 8000
+
+    def test_accept_session__records_drift(self, auto_skipper: AutoSkipper):
+        intro_marker = IntroMarker(start=10000, end=60000)
+        auto_skipper.accept_session(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=1000, observed_at=0.0,
+        ))
+        auto_skipper.accept_session(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=10900, observed_at=10.0,
+        ))
+
+        stats = auto_skipper.drift_stats.snapshot()
+        assert stats['count'] == 1
+        assert stats['last_ms'] == -100
+
+    def test_accept_session__rejects_without_intro_marker(self, auto_skipper: AutoSkipper):
+        session = make_episode_session(state='playing', intro_marker=None)
+        assert not auto_skipper.accept_session(session)
+
+    def test_accept_session__traces_rejection_reason(self):
+        trace = TraceBuffer()
+        auto_skipper = AutoSkipper(seekable_provider=Mock(spec=SeekableProvider), trace=trace)
+
+        auto_skipper.accept_session(make_episode_session(key='1', state='paused'))
+
+        assert [(e.kind, e.detail) for e in trace.events('1')] == [
+            ('reject', 'state is "paused" instead of "playing"'),
+        ]
+
+    def test_accept_session__dumps_trace_on_missed_skip(self):
+        trace = Mock(spec=TraceBuffer)
+        auto_skipper = AutoSkipper(seekable_provider=Mock(spec=SeekableProvider), trace=trace)
+        intro_marker = IntroMarker(start=10000, end=60000)
+
+        auto_skipper.accept_session(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=5000, observed_at=0.0,
+        ))
+        # Played through the whole intro without being skipped.
+        auto_skipper.accept_session(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=65000, observed_at=60.0,
+        ))
+
+        trace.dump.assert_called_once()
+
+    def test_accept_session__no_dump_on_manual_seek_past_intro(self):
+        trace = Mock(spec=TraceBuffer)
+        auto_skipper = AutoSkipper(seekable_provider=Mock(spec=SeekableProvider), trace=trace)
+        intro_marker = IntroMarker(start=10000, end=60000)
+
+        auto_skipper.accept_session(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=1000, observed_at=0.0,
+        ))
+        auto_skipper.accept_session(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=65000, observed_at=2.0,
+        ))
+
+        trace.dump.assert_not_called()
+
+    def test_on_session_activity__dumps_trace_on_late_skip(self):
+        trace = Mock(spec=TraceBuffer)
+        scheduler = VirtualScheduler()
+        auto_skipper = AutoSkipper(
+            seekable_provider=Mock(spec=SeekableProvider),
+            scheduler=scheduler,
+            seek_serializer=Mock(spec=SeekSerializer),
+            trace=trace,
+        )
+        session = make_episode_session(
+            state='playing', intro_marker=IntroMarker(start=10000, end=60000), view_offset_ms=9000,
+        )
+
+        assert auto_skipper.accept_session(session)
+        scheduler.run_until(4.0)  # Now at 13000ms, 3 seconds into the intro.
+        auto_skipper.on_session_activity(session)
+
+        trace.dump.assert_called_once()
+
+    def test_status__extrapolates_sessions(self):
+        scheduler = VirtualScheduler()
+        auto_skipper = AutoSkipper(seekable_provider=Mock(spec=SeekableProvider), scheduler=scheduler)
+        auto_skipper.accept_session(make_episode_session(
+            key='1', state='playing', intro_marker=IntroMarker(start=10000, end=60000), view_offset_ms=1000,
+        ))
+
+        scheduler.run_until(2.0)
+        status = auto_skipper.status()
+
+        assert [(s['key'], s['view_offset_ms'], s['intro_marker']) for s in status['sessions']] == [
+            ('1', 3000, [10000, 60000]),
+        ]
+        assert status['skipped'] == []
+
+    def test_accept_session__reused_key_is_not_skipped(self):
+        scheduler = VirtualScheduler()
+        auto_skipper = AutoSkipper(
+            seekable_provider=Mock(spec=SeekableProvider),
+            scheduler=scheduler,
+            seek_serializer=Mock(spec=SeekSerializer),
+        )
+        intro_marker = IntroMarker(start=0, end=60000)
+        first = make_episode_session(state='playing', rating_key='1', intro_marker=intro_marker, view_offset_ms=1000)
+        assert auto_skipper.accept_session(first)
+        auto_skipper.on_session_activity(first)
+        assert not auto_skipper.accept_session(first)
+
+        # Plex reused the session key for another episode, and we missed the
+        # removal of the first session.
+        second = make_episode_session(state='playing', rating_key='2', intro_marker=intro_marker, view_offset_ms=1000)
+        assert auto_skipper.accept_session(second)
+
+    @staticmethod
+    def make_bounded_auto_skipper(scheduler: VirtualScheduler, max_sessions: int):
+        provider = Mock(spec=SeekableProvider)
+        provider.provide_seekable.return_value.offset_ms.return_value = None
+        provider.provide_alternate_seekable.return_value.offset_ms.return_value = None
+        serializer = Mock(spec=SeekSerializer)
+        serializer.seek.return_value = True
+        auto_skipper = AutoSkipper(
+            seekable_provider=provider,
+            scheduler=scheduler,
+            seek_serializer=serializer,
+            state_ttl_sec=3600,
+            max_sessions=max_sessions,
+        )
+        return auto_skipper, SessionDispatcher(auto_skipper, removal_timeout_sec=20, clock=scheduler), serializer
+
+    def test_state__bounded_without_removals(self):
+        scheduler = VirtualScheduler()
+        auto_skipper, dispatcher, _ = self.make_bounded_auto_skipper(scheduler, max_sessions=100)
+        intro_marker = IntroMarker(start=10000, end=60000)
+
+        # Sessions whose removal never comes, with keys reused by Plex. The
+        # dispatcher still removes them once it stops hearing about them.
+        for i in range(2000):
+            key, rating_key = str(i % 500), str(i)
+            for view_offset_ms in [5000, 10500, 61000]:
+                scheduler.advance(3)
+                dispatcher.dispatch(make_episode_session(
+                    key=key, rating_key=rating_key, state='playing', intro_marker=intro_marker,
+                    view_offset_ms=view_offset_ms, observed_at=scheduler.now(),
+                ))
 
-        playable = Mock()
-        playable.markers = [intro_marker]
+        sizes = auto_skipper.sizes()
+        assert all(size <= 100 for size in sizes.values()), sizes
+        assert sizes['live'] <= 10
 
+    def test_state__keeps_live_sessions_past_cap(self):
+        scheduler = VirtualScheduler()
+        auto_skipper, dispatcher, serializer = self.make_bounded_auto_skipper(scheduler, max_sessions=2)
+        intro_marker = IntroMarker(start=10000, end=60000)
+
+        for _ in range(2):
+            for key in ['1', '2', '3', '4']:
+                dispatcher.dispatch(make_episode_session(
+                    key=key, rating_key=key, state='playing', intro_marker=intro_marker,
+                    view_offset_ms=10500, observed_at=scheduler.now(),
+                ))
+            scheduler.advance(1)
+
+        # Skipped once each, however many sessions there are.
+        assert serializer.seek.call_count == 4
+        assert auto_skipper.sizes()['skipped'] == 4
+
+    def test_trigger_extrapolation__returns_false_if_past_intro(self, auto_skipper: AutoSkipper):
         session = make_episode_session(
-            playable=playable,
+            intro_marker=IntroMarker(start=0, end=1000),
             view_offset_ms=2000,
-            player=Mock(spec=PlexClient),
         )
 
         assert not auto_skipper.trigger_extrapolation(session, True)
+
+    @staticmethod
+    def make_skipping_auto_skipper(scheduler: VirtualScheduler, **kwargs):
+        provider = Mock(spec=SeekableProvider)
+        provider.provide_seekable.return_value.offset_ms.return_value = None
+        provider.provide_alternate_seekable.return_value.offset_ms.return_value = None
+        serializer = Mock(spec=SeekSerializer)
+        serializer.seek.return_value = True
+        auto_skipper = AutoSkipper(
+            seekable_provider=provider,
+            seek_serializer=serializer,
+            scheduler=scheduler,
+            confirm_timeout_ms=3000,
+            **kwargs,
+        )
+        session = make_episode_session(
+            key='1', state='playing', intro_marker=IntroMarker(start=10000, end=60000), view_offset_ms=10000,
+        )
+        assert auto_skipper.accept_session(session)
+        auto_skipper.on_session_activity(session)
+        return auto_skipper, provider, serializer
+
+    def test_on_session_activity__traces_seek_as_queued_until_sent(self):
+        scheduler = VirtualScheduler()
+        trace = Mock(spec=TraceBuffer)
+        _, _, serializer = self.make_skipping_auto_skipper(scheduler, trace=trace)
+
+        assert trace.record.call_args_list[-1] == call('1', 'seek_queued')
+        serializer.seek.call_args[1]['on_done']('acked')
+        assert trace.record.call_args_list[-1] == call('1', 'seek_acked')
+
+    def test_on_session_activity__confirms_skip_from_observation(self):
+        scheduler = VirtualScheduler()
+        auto_skipper, _, serializer = self.make_skipping_auto_skipper(scheduler)
+
+        scheduler.advance(1.5)
+        auto_skipper.accept_session(make_episode_session(
+            key='1', state='playing', intro_marker=IntroMarker(start=10000, end=60000),
+            view_offset_ms=60500, observed_at=1.5,
+        ))
+        scheduler.advance(10)
+
+        status = auto_skipper.status()
+        assert status['skip_states'] == {'1': 'confirmed'}
+        assert status['time_to_confirm_ms']['buckets']['<=2000'] == 1
+        serializer.seek.assert_called_once()
+
+    def test_on_session_activity__retries_unconfirmed_skip_then_fails(self):
+        scheduler = VirtualScheduler()
+        trace = Mock(spec=TraceBuffer)
+        auto_skipper, provider, serializer = self.make_skipping_auto_skipper(
+            scheduler, max_seek_attempts=2, trace=trace,
+        )
+
+        scheduler.advance(3)
+        alternate = provider.provide_alternate_seekable.return_value
+        serializer.seek.assert_called_with('player', alternate, 60000, retry=True, on_done=ANY)
+        assert auto_skipper.status()['skip_states'] == {'1': 'pending'}
+
+        scheduler.advance(3)
+        assert serializer.seek.call_count == 2
+        assert auto_skipper.status()['skip_states'] == {'1': 'failed'}
+        trace.dump.assert_called_once()
+
+    def test_accept_session__retries_overdue_skip_off_the_caller(self):
+        scheduler = VirtualScheduler()
+        auto_skipper, provider, serializer = self.make_skipping_auto_skipper(scheduler)
+
+        auto_skipper.accept_session(make_episode_session(
+            key='1', state='playing', intro_marker=IntroMarker(start=10000, end=60000),
+            view_offset_ms=12000, observed_at=100,
+        ))
+        provider.provide_alternate_seekable.assert_not_called()
+        assert serializer.seek.call_count == 1
+
+        scheduler.advance(0)
+        assert serializer.seek.call_count == 2
+
+    def test_on_session_activity__confirms_skip_from_player_offset(self):
+        scheduler = VirtualScheduler()
+        auto_skipper, provider, serializer = self.make_skipping_auto_skipper(scheduler)
+        seekable = cast(Mock, provider.provide_seekable.return_value)
+        seekable.offset_ms.return_value = 62000
+
+        scheduler.advance(3)
+
+        assert auto_skipper.status()['skip_states'] == {'1': 'confirmed'}
+        serializer.seek.assert_called_once()
+
+    def test_on_session_activity__prewarms_seekable_before_intro(self):
+        provider = Mock(spec=SeekableProvider)
+        serializer = Mock(spec=SeekSerializer)
+        scheduler = VirtualScheduler()
+        auto_skipper = AutoSkipper(
+            seekable_provider=provider, scheduler=scheduler, seek_serializer=serializer, prewarm_lead_ms=5000,
+        )
+        intro_marker = IntroMarker(start=10000, end=60000)
+
+        auto_skipper.on_session_activity(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=2000,
+        ))
+        assert auto_skipper.sizes()['prewarmed'] == 0
+
+        auto_skipper.on_session_activity(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=6000,
+        ))
+        auto_skipper.on_session_activity(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=10000,
+        ))
+
+        seekable = provider.provide_seekable.return_value
+        provider.provide_seekable.assert_called_once()
+        seekable.prewarm.assert_called_once_with()
+        serializer.seek.assert_called_once_with('player', seekable, 60000, on_done=ANY)
+        assert auto_skipper.sizes()['prewarmed'] == 0
+
+    def test_prewarm__parallel_lookups_run_at_background_priority(self):
+        limiter = Mock(spec=RateLimiter)
+
+        class NotFindingProvider(SeekableProvider):
+            def provide_seekable(self, session):
+                limiter.acquire(priority_of('http://server/clients'))
+                raise SeekableNotFoundError
+
+        class FindingProvider(SeekableProvider):
+            def provide_seekable(self, session):
+                limiter.acquire(priority_of('http://server/clients'))
+                return Mock(spec=Seekable)
+
+        # The first provider can't win, so the chain waits for both.
+        chain = SeekableProviderChain([NotFindingProvider(), FindingProvider()], parallel=True)
+        auto_skipper = AutoSkipper(seekable_provider=chain, scheduler=VirtualScheduler())
+
+        auto_skipper._prewarm(make_episode_session(state='playing'))
+
+        assert limiter.acquire.call_args_list == [call(Priority.BACKGROUND)] * 2
+
+    def test_on_session_activity__provides_seekable_if_prewarming_failed(self):
+        provider = Mock(spec=SeekableProvider)
+        seekable = Mock(spec=Seekable)
+        provider.provide_seekable.side_effect = [SeekableNotFoundError, seekable]
+        serializer = Mock(spec=SeekSerializer)
+        auto_skipper = AutoSkipper(seekable_provider=provider, scheduler=VirtualScheduler(), seek_serializer=serializer)
+        intro_marker = IntroMarker(start=10000, end=60000)
+
+        auto_skipper.on_session_activity(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=5000,
+        ))
+        auto_skipper.on_session_activity(make_episode_session(
+            state='playing', intro_marker=intro_marker, view_offset_ms=10000,
+        ))
+
+        serializer.seek.assert_called_once_with('player', seekable, 60000, on_done=ANY)
+
+    def test_on_session_activity__does_not_wait_for_pending_prewarm(self):
+        provider = Mock(spec=SeekableProvider)
+        prewarmed = Mock(spec=Seekable)
+        provided = Mock(spec=Seekable)
+        release = threading.Event()
+
+        def provide_seekable(session):
+            if threading.current_thread().name.startswith('Prewarm'):
+                release.wait(5)
+                return prewarmed
+            return provided
+
+        provider.provide_seekable.side_effect = provide_seekable
+        serializer = Mock(spec=SeekSerializer)
+        auto_skipper = AutoSkipper(seekable_provider=provider, scheduler=VirtualScheduler(), seek_serializer=serializer)
+        intro_marker = IntroMarker(start=10000, end=60000)
+
+        try:
+            auto_skipper.on_session_activity(make_episode_session(
+                state='playing', intro_marker=intro_marker, view_offset_ms=5000,
+            ))
+            auto_skipper.on_session_activity(make_episode_session(
+                state='playing', intro_marker=intro_marker, view_offset_ms=10000,
+            ))
+        finally:
+            release.set()
+
+        serializer.seek.assert_called_once_with('player', provided, 60000, on_done=ANY)
@@ -0,0 +1,61 @@
+from skippex.expiring import ExpiringDict
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestExpiringDict:
+    def test_getitem__expires_entries(self):
+        clock = FakeClock()
+        d = ExpiringDict(ttl_sec=10, max_size=10, clock=clock)
+        d['a'] = 1
+
+        clock.now = 9
+        assert d['a'] == 1
+        clock.now = 10
+        assert 'a' not in d
+
+    def test_setitem__refreshes_ttl(self):
+        clock = FakeClock()
+        d = ExpiringDict(ttl_sec=10, max_size=10, clock=clock)
+        d['a'] = 1
+        clock.now = 5
+        d['a'] = 2
+
+        clock.now = 12
+        assert d['a'] == 2
+
+    def test_setitem__evicts_least_recently_set(self):
+        d = ExpiringDict(ttl_sec=10, max_size=2, clock=FakeClock())
+        d['a'] = 1
+        d['b'] = 2
+        d['a'] = 3
+        d['c'] = 4
+
+        assert sorted(d.items()) == [('a', 3), ('c', 4)]
+
+    def test_setitem__does_not_evict_pinned(self):
+        d = ExpiringDict(ttl_sec=10, max_size=2, clock=FakeClock(), pinned=lambda key: key != 'b')
+        d['a'] = 1
+        d['b'] = 2
+        d['c'] = 3
+        assert sorted(d.items()) == [('a', 1), ('c', 3)]
+
+        d['d'] = 4
+        assert sorted(d.items()) == [('a', 1), ('c', 3), ('d', 4)]
+
+    def test_len__excludes_expired(self):
+        clock = FakeClock()
+        d = ExpiringDict(ttl_sec=10, max_size=10, clock=clock)
+        d['a'] = 1
+        clock.now = 5
+        d['b'] = 2
+
+        clock.now = 10
+        assert len(d) == 1
+        assert list(d) == ['b']
@@ -0,0 +1,33 @@
+import threading
+from unittest.mock import Mock
+
+import requests
+
+from skippex.instrumentation import RequestCounter
+
+
+class TestRequestCounter:
+    def test_scope__counts_requests_of_this_thread(self):
+        counter = RequestCounter()
+        response = Mock(spec=requests.Response)
+
+        with counter.scope('notification'):
+            counter._on_response(response)
+            counter._on_response(response)
+            other = threading.Thread(target=counter._on_response, args=(response,))
+            other.start()
+            other.join()
+        with counter.scope('notification'):
+            pass
+        counter._on_response(response)
+
+        assert counter.stats() == {
+            'notification': {'count': 2, 'requests': 2, 'max_requests': 2, 'requests_per_scope': 1.0},
+            'unscoped': 2,
+        }
+
+    def test_install__hooks_responses(self):
+        counter = RequestCounter()
+        session = requests.Session()
+        counter.install(session)
+        assert counter._on_response in session.hooks['response']
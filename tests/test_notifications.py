@@ -0,0 +1,248 @@
+import json
+import threading
+from typing import List
+from unittest.mock import Mock
+from xml.etree import ElementTree
+
+from plexapi.server import PlexServer
+import pytest
+
+from skippex.notifications import (
+    EventSourceTransport,
+    NotificationContainerDict,
+    NotificationListener,
+    NotificationQueue,
+    NotificationTransport,
+    SessionPoller,
+    TransportUnavailableError,
+    WebSocketTransport,
+    iter_sse_events,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_sessions_container(*videos: str) -> ElementTree.Element:
+    return ElementTree.fromstring(f'<MediaContainer>{"".join(videos)}</MediaContainer>')
+
+
+def make_video(session_key: str = '1', view_offset: int = 0, state: str = 'playing') -> str:
+    return (
+        f'<Video sessionKey="{session_key}" ratingKey="10" key="/library/metadata/10" '
+        f'viewOffset="{view_offset}"><Player state="{state}" /></Video>'
+    )
+
+
+def make_alert(session_key: str, view_offset: int = 0) -> NotificationContainerDict:
+    return NotificationContainerDict(  # type: ignore
+        type='playing',
+        size=1,
+        PlaySessionStateNotification=[{'sessionKey': session_key, 'viewOffset': view_offset, 'state': 'playing'}],
+    )
+
+
+def offsets_of(alerts: List[NotificationContainerDict]) -> List[int]:
+    return [a['PlaySessionStateNotification'][0]['viewOffset'] for a in alerts]  # type: ignore
+
+
+class TestNotificationQueue:
+    def test_preserves_order_per_session(self):
+        received: List[NotificationContainerDict] = []
+        done = threading.Event()
+
+        def callback(alert: NotificationContainerDict):
+            received.append(alert)
+            if len(received) == 100:
+                done.set()
+
+        queue = NotificationQueue(callback, workers=4, max_size=1000)
+        queue.start()
+        for i in range(100):
+            queue.put(make_alert(session_key='1', view_offset=i))
+
+        assert done.wait(timeout=5)
+        assert offsets_of(received) == list(range(100))
+
+    def test_put__coalesces_same_session_when_full(self):
+        queue = NotificationQueue(Mock(), workers=1, max_size=2)
+        queue.put(make_alert(session_key='1', view_offset=0))
+        queue.put(make_alert(session_key='2', view_offset=0))
+        queue.put(make_alert(session_key='1', view_offset=1))
+
+        assert queue.stats() == {'depth': 2, 'max_depth': 2, 'coalesced': 1, 'dropped': 0}
+
+    def test_put__drops_oldest_when_full(self):
+        queue = NotificationQueue(Mock(), workers=1, max_size=2)
+        queue.put(make_alert(session_key='1'))
+        queue.put(make_alert(session_key='2'))
+        queue.put(make_alert(session_key='3'))
+
+        assert queue.stats() == {'depth': 2, 'max_depth': 2, 'coalesced': 0, 'dropped': 1}
+
+    def test_put__drops_other_than_playing(self):
+        queue = NotificationQueue(Mock(), workers=1, max_size=1)
+        queue.put(make_alert(session_key='1'))
+        queue.put(NotificationContainerDict(type='timeline', size=1))  # type: ignore
+
+        assert queue.stats() == {'depth': 1, 'max_depth': 1, 'coalesced': 0, 'dropped': 0}
+
+    def test_close__stops_workers_once_drained(self):
+        callback = Mock()
+        queue = NotificationQueue(callback, workers=2)
+        queue.start()
+        queue.put(make_alert(session_key='1'))
+        queue.close()
+
+        for thread in queue._threads:
+            thread.join(timeout=5)
+            assert not thread.is_alive()
+        callback.assert_called_once()
+
+
+class TestSessionPoller:
+    @pytest.fixture
+    def server(self) -> Mock:
+        return Mock(spec=PlexServer)
+
+    @pytest.fixture
+    def alerts(self) -> List[NotificationContainerDict]:
+        return []
+
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        return FakeClock()
+
+    @pytest.fixture
+    def poller(self, server: Mock, alerts: List[NotificationContainerDict], clock: FakeClock) -> SessionPoller:
+        return SessionPoller(server, alerts.append, intro_markers={'10': (60000, 90000)}, clock=clock)
+
+    def test_poll__notifies_new_sessions(self, poller: SessionPoller, server: Mock, alerts: list):
+        server.query.return_value = make_sessions_container(make_video())
+        poller.poll()
+
+        assert len(alerts) == 1
+        assert alerts[0]['type'] == 'playing'
+        notification = alerts[0]['PlaySessionStateNotification'][0]  # type: ignore
+        assert notification['sessionKey'] == '1'
+        assert notification['state'] == 'playing'
+
+    def test_poll__does_not_notify_steady_playback(
+        self, poller: SessionPoller, server: Mock, alerts: list, clock: FakeClock,
+    ):
+        server.query.return_value = make_sessions_container(make_video(view_offset=0))
+        poller.poll()
+        clock.now = 2.0
+        server.query.return_value = make_sessions_container(make_video(view_offset=2000))
+        poller.poll()
+
+        assert len(alerts) == 1
+
+    @pytest.mark.parametrize('view_offset, state', [(30000, 'playing'), (0, 'paused')])
+    def test_poll__notifies_changes(
+        self, poller: SessionPoller, server: Mock, alerts: list, clock: FakeClock, view_offset: int, state: str,
+    ):
+        server.query.return_value = make_sessions_container(make_video(view_offset=0))
+        poller.poll()
+        clock.now = 2.0
+        server.query.return_value = make_sessions_container(make_video(view_offset=view_offset, state=state))
+        poller.poll()
+
+        assert len(alerts) == 2
+
+    def test_poll__notifies_stopped_sessions(self, poller: SessionPoller, server: Mock, alerts: list):
+        server.query.return_value = make_sessions_container(make_video())
+        poller.poll()
+        server.query.return_value = make_sessions_container()
+        poller.poll()
+
+        assert alerts[-1]['PlaySessionStateNotification'][0]['state'] == 'stopped'  # type: ignore
+
+    @pytest.mark.parametrize('videos, expected_sec', [
+        ([], 10),
+        ([make_video(view_offset=0)], 5),
+        ([make_video(view_offset=55000)], 1),
+        ([make_video(view_offset=55000, state='paused')], 5),
+    ])
+    def test_next_interval_sec(self, poller: SessionPoller, server: Mock, videos: List[str], expected_sec: float):
+        server.query.return_value = make_sessions_container(*videos)
+        poller.poll()
+        assert poller._next_interval_sec() == expected_sec
+
+
+def test_iter_sse_events():
+    chunks = [
+        b': comment\n',
+        b'event: playing\r\ndata: {"a":',
+        b' 1}\r\n\r\nevent: ping\n\n',
+        b'data: first\ndata: second\n\n',
+    ]
+    assert list(iter_sse_events(chunks)) == [('playing', '{"a": 1}'), ('message', 'first\nsecond')]
+
+
+class TestWebSocketTransport:
+    @pytest.mark.parametrize('baseurl, expected', [
+        ('http://server:32400', 'ws://server:32400/:/websockets/notifications?X-Plex-Token=token'),
+        ('https://server:32400', 'wss://server:32400/:/websockets/notifications?X-Plex-Token=token'),
+    ])
+    def test_url__matches_server_scheme(self, baseurl: str, expected: str):
+        server = Mock(spec=PlexServer)
+        server.url.side_effect = lambda key, includeToken: f'{baseurl}{key}?X-Plex-Token=token'
+        assert WebSocketTransport(server).url() == expected
+
+
+class TestEventSourceTransport:
+    @staticmethod
+    def make_server(content_type: str, chunks: List[bytes]) -> Mock:
+        server = Mock(spec=PlexServer)
+        server._session = Mock()
+        response = server._session.get.return_value
+        response.ok = True
+        response.headers = {'Content-Type': content_type}
+        response.iter_content.return_value = iter(chunks)
+        return server
+
+    def test_run_forever__notifies_containers(self):
+        notification = {'sessionKey': '1', 'state': 'playing'}
+        server = self.make_server('text/event-stream', [
+            b'event: playing\ndata: %s\n\n' % json.dumps({'PlaySessionStateNotification': notification}).encode(),
+        ])
+        on_open = Mock()
+        containers: List[NotificationContainerDict] = []
+
+        EventSourceTransport(server).run_forever(on_open, containers.append)
+
+        on_open.assert_called_once_with()
+        assert containers == [{'type': 'playing', 'size': 1, 'PlaySessionStateNotification': [notification]}]
+
+    def test_run_forever__raises_if_not_an_event_stream(self):
+        server = self.make_server('text/html', [])
+        with pytest.raises(TransportUnavailableError):
+            EventSourceTransport(server).run_forever(Mock(), Mock())
+
+
+class TestNotificationListener:
+    def test_run_forever__falls_back_to_next_transport(self):
+        unavailable = Mock(spec=NotificationTransport)
+        unavailable.name = 'unavailable'
+        unavailable.run_forever.side_effect = TransportUnavailableError
+        available = Mock(spec=NotificationTransport)
+        available.name = 'available'
+        on_open = Mock()
+        available.run_forever.side_effect = lambda on_open, on_container: on_open()
+
+        NotificationListener([unavailable, available], Mock(), on_open=on_open).run_forever()
+
+        on_open.assert_called_once_with()
+
+    def test_run_forever__raises_if_all_unavailable(self):
+        unavailable = Mock(spec=NotificationTransport)
+        unavailable.name = 'unavailable'
+        unavailable.run_forever.side_effect = TransportUnavailableError
+        with pytest.raises(TransportUnavailableError):
+            NotificationListener([unavailable], Mock()).run_forever()
@@ -0,0 +1,57 @@
+from io import BytesIO
+
+from skippex.parsing import iter_session_elements, read_intro_marker_element
+
+
+SESSIONS_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<MediaContainer size="2">
+<Video sessionKey="12" ratingKey="345" type="episode" title="Pilot" grandparentTitle="Some Show" viewOffset="61000">
+<Media id="1"><Part id="2"><Stream id="3" streamType="1" /></Part></Media>
+<Marker id="4" type="intro" startTimeOffset="1000" endTimeOffset="60000" />
+<User id="1" title="someone" />
+<Player address="192.168.1.2" machineIdentifier="abc" state="playing" title="Living Room" />
+<Session id="xyz" bandwidth="1000" location="lan" />
+</Video>
+<Track sessionKey="13" ratingKey="678" type="track" title="Some Song" grandparentTitle="Some Artist" viewOffset="1000">
+<Player address="192.168.1.3" machineIdentifier="def" state="paused" title="Kitchen" />
+</Track>
+<Video sessionKey="14" ratingKey="910" type="movie" title="No Player" />
+</MediaContainer>
+'''
+
+
+class TestIterSessionElements:
+    def test_extracts_fields(self):
+        episode, track = iter_session_elements(BytesIO(SESSIONS_XML))
+
+        assert episode.session_key == '12'
+        assert episode.rating_key == '345'
+        assert episode.type == 'episode'
+        assert episode.title == 'Pilot'
+        assert episode.grandparent_title == 'Some Show'
+        assert episode.view_offset_ms == 61000
+        assert episode.state == 'playing'
+        assert episode.player_id == 'abc'
+        assert episode.player_address == '192.168.1.2'
+        assert episode.player_title == 'Living Room'
+        assert episode.markers == (('intro', 1000, 60000),)
+
+        assert track.session_key == '13'
+        assert track.state == 'paused'
+        assert track.markers is None
+
+    def test_empty_container(self):
+        assert list(iter_session_elements(BytesIO(b'<MediaContainer size="0" />'))) == []
+
+
+class TestReadIntroMarkerElement:
+    def test_reads_intro_marker(self):
+        xml = b'''<MediaContainer><Video ratingKey="1">
+        <Marker type="credits" startTimeOffset="100" endTimeOffset="200" />
+        <Marker type="intro" startTimeOffset="300" endTimeOffset="400" />
+        </Video></MediaContainer>'''
+        assert read_intro_marker_element(BytesIO(xml)) == (300, 400)
+
+    def test_returns_none_without_intro_marker(self):
+        xml = b'<MediaContainer><Video ratingKey="1" /></MediaContainer>'
+        assert read_intro_marker_element(BytesIO(xml)) is None
@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import List
+from unittest.mock import patch
+
+import requests
+
+from skippex.ratelimit import Priority, RateLimitedSession, RateLimiter, prioritized, priority_of
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestRateLimiter:
+    def test_acquire__allows_bursts_without_waiting(self):
+        limiter = RateLimiter(rate_per_sec=1, burst=3, clock=FakeClock())
+        assert [limiter.acquire() for _ in range(3)] == [0, 0, 0]
+        assert limiter.stats()['throttled'] == 0
+
+    def test_acquire__refills_over_time(self):
+        clock = FakeClock()
+        limiter = RateLimiter(rate_per_sec=2, burst=2, clock=clock)
+        limiter.acquire()
+        limiter.acquire()
+        clock.now = 0.5
+        assert limiter.acquire() == 0
+
+    def test_acquire__waits_for_tokens(self):
+        limiter = RateLimiter(rate_per_sec=20, burst=1)
+        limiter.acquire()
+        assert limiter.acquire() > 0.03
+
+        stats = limiter.stats()
+        assert stats['requests'] == 2
+        assert stats['throttled'] == 1
+        assert stats['throttled_sec'] > 0.03
+
+    def test_acquire__serves_higher_priorities_first(self):
+        limiter = RateLimiter(rate_per_sec=10, burst=1)
+        limiter.acquire()
+        order: List[Priority] = []
+
+        def acquire(priority: Priority):
+            limiter.acquire(priority)
+            order.append(priority)
+
+        background = threading.Thread(target=acquire, args=(Priority.BACKGROUND,))
+        background.start()
+        time.sleep(0.02)
+        seek = threading.Thread(target=acquire, args=(Priority.SEEK,))
+        seek.start()
+        background.join()
+        seek.join()
+
+        assert order == [Priority.SEEK, Priority.BACKGROUND]
+
+
+class TestPriorityOf:
+    def test_by_path(self):
+        assert priority_of('http://player:32500/player/playback/seekTo?offset=1') == Priority.SEEK
+        assert priority_of('http://server:32400/status/sessions') == Priority.SESSIONS
+        assert priority_of('http://server:32400/clients') == Priority.DEFAULT
+
+    def test_prioritized__overrides(self):
+        with prioritized(Priority.BACKGROUND):
+            assert priority_of('http://server:32400/status/sessions') == Priority.BACKGROUND
+        assert priority_of('http://server:32400/status/sessions') == Priority.SESSIONS
+
+
+class TestRateLimitedSession:
+    def test_request__acquires_token(self):
+        limiter = RateLimiter(rate_per_sec=1, burst=1, clock=FakeClock())
+        session = RateLimitedSession(limiter)
+        with patch.object(requests.Session, 'request') as request:
+            session.get('http://server:32400/status/sessions')
+
+        request.assert_called_once()
+        assert limiter.stats()['requests'] == 1
@@ -0,0 +1,42 @@
+from typing import List
+
+from skippex.scheduling import VirtualScheduler
+
+
+class TestVirtualScheduler:
+    def test_advance__runs_due_calls_in_order(self):
+        scheduler = VirtualScheduler()
+        calls: List[str] = []
+        scheduler.call_later(2, lambda: calls.append(f'b@{scheduler.now()}'))
+        scheduler.call_later(1, lambda: calls.append(f'a@{scheduler.now()}'))
+        scheduler.call_later(5, lambda: calls.append('c'))
+
+        scheduler.advance(3)
+
+        assert calls == ['a@1.0', 'b@2.0']
+        assert scheduler.now() == 3
+        assert scheduler.pending == 1
+
+    def test_advance__runs_calls_scheduled_by_calls(self):
+        scheduler = VirtualScheduler()
+        times: List[float] = []
+
+        def tick():
+            times.append(scheduler.now())
+            scheduler.call_later(1, tick)
+
+        scheduler.call_later(1, tick)
+        scheduler.advance(3.5)
+
+        assert times == [1, 2, 3]
+
+    def test_cancel(self):
+        scheduler = VirtualScheduler()
+        calls: List[int] = []
+        call = scheduler.call_later(1, lambda: calls.append(1))
+
+        call.cancel()
+        scheduler.advance(2)
+
+        assert calls == []
+        assert call.done
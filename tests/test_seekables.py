@@ -0,0 +1,356 @@
+import queue
+import threading
+import time
+from typing import List, Tuple
+from unittest.mock import Mock, patch
+from uuid import UUID
+
+from plexapi.client import PlexClient
+from plexapi.exceptions import BadRequest
+from plexapi.server import PlexServer
+import pytest
+import requests
+
+from skippex.scheduling import VirtualScheduler
+from skippex.seekables import (
+    ChromecastMonitor,
+    ChromecastNotFoundError,
+    NegativeCachingSeekableProvider,
+    PlexPlayerNotFoundError,
+    PlexSeekableProvider,
+    Seekable,
+    SeekableNotFoundError,
+    SeekableNotFoundErrorChain,
+    SeekablePlexClient,
+    SeekableProvider,
+    SeekableProviderChain,
+    SeekSerializer,
+)
+from skippex.sessions import Session
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BlockingSeekable(Seekable):
+    """Records seeks, and blocks on each until released."""
+
+    def __init__(self):
+        self.offsets: List[int] = []
+        self.started = threading.Semaphore(0)
+        self.release = threading.Semaphore(0)
+        self.done = threading.Semaphore(0)
+
+    def seek(self, offset_ms: int):
+        self.offsets.append(offset_ms)
+        self.started.release()
+        self.release.acquire()
+        self.done.release()
+
+
+class TestSeekSerializer:
+    def test_seek__supersedes_waiting_seeks(self):
+        seekable = BlockingSeekable()
+        serializer = SeekSerializer()
+
+        assert serializer.seek('player', seekable, 1000)
+        assert seekable.started.acquire(timeout=5)
+        # In flight: these two wait, and the second supersedes the first.
+        assert serializer.seek('player', seekable, 2000)
+        assert serializer.seek('player', seekable, 3000)
+
+        seekable.release.release()
+        assert seekable.started.acquire(timeout=5)
+        seekable.release.release()
+        assert seekable.done.acquire(timeout=5)
+        assert seekable.done.acquire(timeout=5)
+
+        assert seekable.offsets == [1000, 3000]
+
+    def test_seek__does_not_serialize_different_players(self):
+        seekable = BlockingSeekable()
+        serializer = SeekSerializer()
+
+        serializer.seek('player1', seekable, 1000)
+        serializer.seek('player2', seekable, 1000)
+
+        assert seekable.started.acquire(timeout=5)
+        assert seekable.started.acquire(timeout=5)
+        seekable.release.release()
+        seekable.release.release()
+
+    def test_seek__suppresses_duplicates_within_window(self):
+        seekable = BlockingSeekable()
+        seekable.release.release()
+        clock = FakeClock()
+        serializer = SeekSerializer(duplicate_window_sec=10, clock=clock)
+
+        assert serializer.seek('player', seekable, 1000)
+        assert seekable.done.acquire(timeout=5)
+        clock.now = 5
+        assert not serializer.seek('player', seekable, 1000)
+
+        seekable.release.release()
+        clock.now = 20
+        assert serializer.seek('player', seekable, 1000)
+        assert seekable.done.acquire(timeout=5)
+        assert seekable.offsets == [1000, 1000]
+
+    def test_seek__does_not_suppress_retries(self):
+        seekable = BlockingSeekable()
+        seekable.release.release()
+        seekable.release.release()
+        serializer = SeekSerializer(duplicate_window_sec=10, clock=FakeClock())
+
+        assert serializer.seek('player', seekable, 1000)
+        assert seekable.done.acquire(timeout=5)
+        assert serializer.seek('player', seekable, 1000, retry=True)
+        assert seekable.done.acquire(timeout=5)
+        assert seekable.offsets == [1000, 1000]
+
+    def test_seek__reports_outcome_once_sent(self):
+        seekable = BlockingSeekable()
+        serializer = SeekSerializer()
+        outcomes: 'queue.Queue[Tuple[int, str]]' = queue.Queue()
+
+        def on_done(offset_ms: int):
+            return lambda outcome: outcomes.put((offset_ms, outcome))
+
+        assert serializer.seek('player', seekable, 1000, on_done=on_done(1000))
+        assert seekable.started.acquire(timeout=5)
+        assert outcomes.empty()
+        serializer.seek('player', seekable, 2000, on_done=on_done(2000))
+        serializer.seek('player', seekable, 3000, on_done=on_done(3000))
+        assert outcomes.get(timeout=5) == (2000, 'superseded')
+
+        # Only the seek that's waiting fails: the first one is already sent.
+        seekable.seek = Mock(side_effect=RuntimeError)  # type: ignore
+        seekable.release.release()
+        assert outcomes.get(timeout=5) == (1000, 'acked')
+        assert outcomes.get(timeout=5) == (3000, 'failed')
+
+    @pytest.mark.parametrize('error, expected', [
+        (None, 'acked'),
+        (requests.Timeout, 'timed_out'),
+        (requests.ConnectionError, 'failed'),
+        (BadRequest, 'failed'),
+    ])
+    def test_seek__reports_outcome_of_plex_client_seeks(self, error, expected):
+        client = Mock(spec=PlexClient)
+        client.seekTo.side_effect = error
+        serializer = SeekSerializer()
+        outcomes: 'queue.Queue[str]' = queue.Queue()
+
+        serializer.seek('player', SeekablePlexClient(client), 1000, on_done=outcomes.put)
+
+        assert outcomes.get(timeout=5) == expected
+
+
+class FakeProvider(SeekableProvider):
+    def __init__(self, delay_sec: float = 0, found: bool = True):
+        self.delay_sec = delay_sec
+        self.found = found
+        self.seekable = Mock(spec=Seekable)
+
+    def provide_seekable(self, session: Session) -> Seekable:
+        time.sleep(self.delay_sec)
+        if not self.found:
+            raise SeekableNotFoundError
+        return self.seekable
+
+
+class TestSeekableProviderChain:
+    @pytest.fixture
+    def session(self) -> Session:
+        return Mock(spec=Session, key='1')
+
+    def test_provide_seekable__sequential_tries_in_order(self, session: Session):
+        providers = [FakeProvider(found=False), FakeProvider(), FakeProvider()]
+        chain = SeekableProviderChain(providers)
+        assert chain.provide_seekable(session) is providers[1].seekable
+
+    def test_provide_seekable__parallel_takes_first_found(self, session: Session):
+        providers = [FakeProvider(delay_sec=1), FakeProvider()]
+        chain = SeekableProviderChain(providers, parallel=True)
+
+        started_at = time.monotonic()
+        assert chain.provide_seekable(session) is providers[1].seekable
+        assert time.monotonic() - started_at < 0.5
+
+    def test_provide_seekable__parallel_prefers_priority_within_tiebreak(self, session: Session):
+        providers = [FakeProvider(delay_sec=0.1), FakeProvider()]
+        chain = SeekableProviderChain(providers, parallel=True, tiebreak_sec=1)
+        assert chain.provide_seekable(session) is providers[0].seekable
+
+    def test_provide_seekable__parallel_raises_chain(self, session: Session):
+        providers = [FakeProvider(found=False), FakeProvider(found=False)]
+        chain = SeekableProviderChain(providers, parallel=True)
+
+        with pytest.raises(SeekableNotFoundErrorChain) as exc_info:
+            chain.provide_seekable(session)
+        assert len(exc_info.value.exceptions) == 2
+
+    @pytest.mark.parametrize('parallel', [False, True])
+    def test_provide_alternate_seekable__prefers_other_kind(self, session: Session, parallel: bool):
+        providers = [FakeProvider(), FakeProvider()]
+        providers[0].seekable = BlockingSeekable()
+        chain = SeekableProviderChain(providers, parallel=parallel)
+
+        assert chain.provide_alternate_seekable(session, providers[0].seekable) is providers[1].seekable
+        assert chain.provide_alternate_seekable(session, providers[1].seekable) is providers[0].seekable
+
+    @pytest.mark.parametrize('parallel', [False, True])
+    def test_provide_alternate_seekable__falls_back_to_same_kind(self, session: Session, parallel: bool):
+        providers = [FakeProvider(found=False), FakeProvider()]
+        chain = SeekableProviderChain(providers, parallel=parallel)
+        failed = Mock(spec=Seekable)
+
+        assert chain.provide_alternate_seekable(session, failed) is providers[1].seekable
+
+    def test_provide_alternate_seekable__parallel_races_providers(self, session: Session):
+        providers = [FakeProvider(), FakeProvider(delay_sec=1), FakeProvider()]
+        providers[2].seekable = BlockingSeekable()
+        chain = SeekableProviderChain(providers, parallel=True)
+
+        started_at = time.monotonic()
+        assert chain.provide_alternate_seekable(session, providers[0].seekable) is providers[2].seekable
+        assert time.monotonic() - started_at < 0.5
+
+
+class TestNegativeCachingSeekableProvider:
+    @pytest.fixture
+    def session(self) -> Session:
+        return Mock(spec=Session, key='1', player_id='player')
+
+    def test_provide_seekable__backs_off_exponentially(self, session: Session):
+        inner = Mock(spec=SeekableProvider)
+        inner.provide_seekable.side_effect = PlexPlayerNotFoundError
+        clock = FakeClock()
+        provider = NegativeCachingSeekableProvider(inner, initial_backoff_sec=10, clock=clock)
+
+        for now, expected_calls in [(0, 1), (5, 1), (10, 2), (25, 2), (30, 3)]:
+            clock.now = now
+            with pytest.raises(SeekableNotFoundError) as exc_info:
+                provider.provide_seekable(session)
+            assert exc_info.value.has_plex_player_not_found()
+            assert inner.provide_seekable.call_count == expected_calls
+
+    def test_provide_seekable__invalidate_retries_immediately(self, session: Session):
+        inner = Mock(spec=SeekableProvider)
+        inner.provide_seekable.side_effect = [SeekableNotFoundError, Mock(spec=Seekable)]
+        provider = NegativeCachingSeekableProvider(inner, clock=FakeClock())
+
+        with pytest.raises(SeekableNotFoundError):
+            provider.provide_seekable(session)
+        provider.invalidate()
+        provider.provide_seekable(session)
+
+        assert inner.provide_seekable.call_count == 2
+
+
+class TestPlexSeekableProvider:
+    def test_provide_seekable__notifies_client_changes(self):
+        server = Mock(spec=PlexServer)
+        server.clients.side_effect = [
+            [Mock(spec=PlexClient, machineIdentifier='a', title='a')],
+            [Mock(spec=PlexClient, machineIdentifier='a', title='a')],
+            [Mock(spec=PlexClient, machineIdentifier='b', title='b')],
+        ]
+        callback = Mock()
+        provider = PlexSeekableProvider(server)
+        provider.add_change_callback(callback)
+        session = Mock(spec=Session, player_id='c')
+
+        for expected_calls in (0, 0, 1):
+            with pytest.raises(PlexPlayerNotFoundError):
+                provider.provide_seekable(session)
+            assert callback.call_count == expected_calls
+
+        assert provider.known_clients() == {'b': 'b'}
+
+
+class TestChromecastMonitor:
+    UUID = UUID(int=1)
+
+    @pytest.fixture
+    def listener(self) -> Mock:
+        listener = Mock()
+        listener.services = {self.UUID: ({'name'}, self.UUID, 'Chromecast', 'Living Room', '192.168.1.2', 8009)}
+        return listener
+
+    def test_add_callback__does_not_connect(self, listener: Mock):
+        monitor = ChromecastMonitor(listener, Mock())
+        with patch('pychromecast.get_chromecast_from_service') as get_chromecast:
+            monitor.add_callback(self.UUID, 'name')
+
+        get_chromecast.assert_not_called()
+        assert monitor.known_chromecasts() == {'192.168.1.2': 'Living Room'}
+
+    def test_get_chromecast_by_ip__connects_once(self, listener: Mock):
+        monitor = ChromecastMonitor(listener, Mock())
+        monitor.add_callback(self.UUID, 'name')
+
+        with patch('pychromecast.get_chromecast_from_service') as get_chromecast:
+            first = monitor.get_chromecast_by_ip('192.168.1.2')
+            second = monitor.get_chromecast_by_ip('192.168.1.2')
+
+        assert first is second is get_chromecast.return_value
+        get_chromecast.assert_called_once()
+
+    def test_get_chromecast_by_ip__connects_without_lock(self, listener: Mock):
+        monitor = ChromecastMonitor(listener, Mock())
+        monitor.add_callback(self.UUID, 'name')
+        connecting = threading.Event()
+        connected = threading.Event()
+
+        def get_chromecast(service, zconf):
+            connecting.set()
+            assert connected.wait(timeout=5)
+            return Mock()
+
+        with patch('pychromecast.get_chromecast_from_service', side_effect=get_chromecast) as patched:
+            results: 'queue.Queue[object]' = queue.Queue()
+            threads = [
+                threading.Thread(target=lambda: results.put(monitor.get_chromecast_by_ip('192.168.1.2')))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            assert connecting.wait(timeout=5)
+            # Doesn't wait for the connection.
+            assert monitor.known_chromecasts() == {'192.168.1.2': 'Living Room'}
+            connected.set()
+            for thread in threads:
+                thread.join(timeout=5)
+
+        assert results.get_nowait() is results.get_nowait()
+        patched.assert_called_once()
+
+    def test_get_chromecast_by_ip__raises_if_unknown(self, listener: Mock):
+        monitor = ChromecastMonitor(listener, Mock())
+        with pytest.raises(ChromecastNotFoundError):
+            monitor.get_chromecast_by_ip('192.168.1.2')
+
+    def test_close_idle_connections(self, listener: Mock):
+        scheduler = VirtualScheduler()
+        monitor = ChromecastMonitor(listener, Mock(), idle_timeout_sec=60, scheduler=scheduler)
+        monitor.add_callback(self.UUID, 'name')
+        with patch('pychromecast.get_chromecast_from_service') as get_chromecast:
+            monitor.get_chromecast_by_ip('192.168.1.2')
+
+            scheduler.advance(30)
+            monitor.get_chromecast_by_ip('192.168.1.2')
+            scheduler.advance(30)
+            get_chromecast.return_value.disconnect.assert_not_called()
+
+            scheduler.advance(60)
+            get_chromecast.return_value.disconnect.assert_called_once()
+            assert scheduler.pending == 0
+
+            monitor.get_chromecast_by_ip('192.168.1.2')
+            assert get_chromecast.call_count == 2
@@ -1,18 +1,29 @@
-from typing import Set
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import threading
+from typing import Dict, List, Set
 from unittest.mock import Mock
 
-from plexapi.base import Playable
-from plexapi.client import PlexClient
 from plexapi.server import PlexServer
+from plexapi.video import Episode
 import pytest
+import requests
 from typing_extensions import Literal
 
-from skippex.notifications import PlaybackNotification
+from skippex.core import AutoSkipper
+from skippex.instrumentation import RequestCounter
+from skippex.notifications import PlaybackNotification, PolledPlaybackNotification
+from skippex.parsing import SessionElement
+from skippex.scheduling import VirtualScheduler
+from skippex.seekables import SeekableProvider, SeekSerializer
 from skippex.sessions import (
+    EpisodeSession,
+    IntroMarker,
     Session,
     SessionDiscovery,
     SessionDispatcher,
     SessionExtrapolator,
+    SessionFactory,
     SessionListener,
     SessionNotFoundError,
     SessionProvider,
@@ -44,14 +55,15 @@ def make_fake_notification(
 def make_fake_session(
     key: str = 'dummy',
     state: Literal['buffering', 'playing', 'paused', 'stopped'] = 'buffering',
-    playable: Playable = Mock(spec=Playable),
-    player: PlexClient = Mock(spec=PlexClient),
 ) -> Session:
     return Session(
         key=key,
         state=state,
-        playable=playable,
-        player=player,
+        rating_key='dummy',
+        title='dummy',
+        player_id='dummy',
+        player_address='dummy',
+        player_title='dummy',
     )
 
 
@@ -117,6 +129,48 @@ class TestSession:
         assert (a == b) is is_same
 
 
+class TestEpisodeSession:
+    @pytest.mark.parametrize('state, expected', [('playing', 3500), ('paused', 1000)])
+    def test_current_view_offset_ms(self, state: str, expected: int):
+        session = EpisodeSession(
+            key='1',
+            state=state,  # type: ignore
+            rating_key='dummy',
+            title='dummy',
+            player_id='dummy',
+            player_address='dummy',
+            player_title='dummy',
+            view_offset_ms=1000,
+            observed_at=10.0,
+            intro_marker=None,
+        )
+        assert session.current_view_offset_ms(12.5) == expected
+
+    def test_from_playable__reads_view_offset_before_marker(self):
+        episode = Mock(spec=Episode)
+        episode.isFullObject.return_value = False
+        episode.sessionKey = 1
+        episode.ratingKey = 2
+        episode.viewOffset = 1000
+        episode.grandparentTitle = 'Show'
+        episode.title = 'Episode'
+        episode.players = [Mock(state='playing', machineIdentifier='id', address='addr', title='Player')]
+
+        def intro_marker_of(episode: Episode) -> IntroMarker:
+            # Simulates the reload.
+            episode.viewOffset = 0
+            return IntroMarker(start=0, end=1000)
+
+        session = EpisodeSession.from_playable(episode, observed_at=0.0, intro_marker_of=intro_marker_of)
+
+        assert session.view_offset_ms == 1000
+        assert session.intro_marker == IntroMarker(start=0, end=1000)
+
+    def test_has_no_instance_dict(self):
+        session = make_fake_session()
+        assert not hasattr(session, '__dict__')
+
+
 class TestSessionDispatcher:
     def test_dispatch(
         self,
@@ -154,6 +208,161 @@ class TestSessionDispatcher:
         dispatcher.dispatch(fake_session)
         assert fake_session not in accept_listener.sessions
 
+    def test_dispatch__discards_inactives_after_timeout(self, accept_listener: AcceptListener):
+        scheduler = VirtualScheduler()
+        dispatcher = SessionDispatcher(accept_listener, removal_timeout_sec=20, clock=scheduler)
+        inactive = make_fake_session(key='1')
+        active = make_fake_session(key='2')
+        dispatcher.dispatch(inactive)
+
+        scheduler.advance(15)
+        dispatcher.dispatch(active)
+        assert inactive in accept_listener.sessions
+
+        scheduler.advance(5)
+        dispatcher.dispatch(active)
+        assert accept_listener.sessions == {active}
+
+    def test_set_removal_timeout_sec__applies_to_tracked_sessions(self, accept_listener: AcceptListener):
+        scheduler = VirtualScheduler()
+        dispatcher = SessionDispatcher(accept_listener, removal_timeout_sec=20, clock=scheduler)
+        inactive = make_fake_session(key='1')
+        active = make_fake_session(key='2')
+        dispatcher.dispatch(inactive)
+
+        scheduler.advance(5)
+        dispatcher.set_removal_timeout_sec(5)
+        dispatcher.dispatch(active)
+        assert accept_listener.sessions == {active}
+
+
+class TestSessionFactory:
+    def test_cached_intro_marker__in_memory_cache_expires(self):
+        scheduler = VirtualScheduler()
+        factory = SessionFactory(clock=scheduler, cache_ttl_sec=60, max_cached=2)
+        read = Mock(return_value=None)
+
+        assert factory._cached_intro_marker('1', read) is None
+        assert factory._cached_intro_marker('1', read) is None
+        assert read.call_count == 1
+
+        scheduler.advance(60)
+        read.return_value = IntroMarker(start=1000, end=2000)
+        assert factory._cached_intro_marker('1', read) == IntroMarker(start=1000, end=2000)
+        assert read.call_count == 2
+
+    def test_cached_intro_marker__in_memory_cache_is_bounded(self):
+        factory = SessionFactory(max_cached=2)
+        for rating_key in ['1', '2', '3']:
+            factory._cached_intro_marker(rating_key, lambda: None)
+        assert len(factory._intro_markers) == 2
+
+
+class TestSessionProvider:
+    @staticmethod
+    def make_server(responses):
+        def get(url, **kwargs):
+            path = url.replace('http://server', '')
+            response = Mock(status_code=200, url=url)
+            response.raw = BytesIO(responses[path])
+            return response
+
+        server = Mock(spec=PlexServer)
+        server._session = Mock()
+        server._session.get.side_effect = get
+        server.url.side_effect = lambda path: 'http://server' + path
+        server._headers.return_value = {}
+        return server
+
+    def test_provide__lean(self):
+        server = self.make_server({
+            '/status/sessions': (
+                b'<MediaContainer><Video sessionKey="1" ratingKey="2" type="episode" title="Episode" '
+                b'grandparentTitle="Show" viewOffset="5000">'
+                b'<Player machineIdentifier="id" address="addr" title="Player" state="playing" />'
+                b'</Video></MediaContainer>'
+            ),
+            '/library/metadata/2?includeMarkers=1': (
+                b'<MediaContainer><Video ratingKey="2">'
+                b'<Marker type="intro" startTimeOffset="1000" endTimeOffset="2000" />'
+                b'</Video></MediaContainer>'
+            ),
+        })
+        provider = SessionProvider(server, clock=lambda: 10.0, lean=True)
+
+        session = provider.provide('1')
+        again = provider.provide('1')
+
+        assert session == EpisodeSession(
+            key='1',
+            state='playing',
+            rating_key='2',
+            title='Show - Episode',
+            player_id='id',
+            player_address='addr',
+            player_title='Player',
+            view_offset_ms=5000,
+            observed_at=10.0,
+            intro_marker=IntroMarker(start=1000, end=2000),
+        )
+        assert (session.title, session.view_offset_ms, session.intro_marker) == \
+            (again.title, again.view_offset_ms, again.intro_marker)
+        assert provider.stats() == {'intro_marker_hits': 1, 'intro_marker_misses': 1}
+        server.sessions.assert_not_called()
+
+    def test_provide__lean_reuses_connection(self):
+        body = b'<MediaContainer>' + b''.join(
+            b'<Video sessionKey="%d" ratingKey="2" type="episode" title="Episode" grandparentTitle="Show" '
+            b'viewOffset="5000"><Player machineIdentifier="id" address="addr" title="Player" state="playing" />'
+            b'</Video>' % i
+            for i in range(1000)
+        ) + b'</MediaContainer>'
+        connections = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                connections.append(self.client_address)
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        httpd.daemon_threads = True
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            server = Mock(spec=PlexServer)
+            server._session = requests.Session()
+            server.url.side_effect = lambda path: f'http://127.0.0.1:{httpd.server_port}{path}'
+            server._headers.return_value = {}
+            provider = SessionProvider(server, lean=True)
+
+            for _ in range(5):
+                # Found near the start of the body, so the rest is unread.
+                provider.provide('1')
+        finally:
+            server._session.close()
+            httpd.shutdown()
+            httpd.server_close()
+
+        assert len(connections) == 1
+
+    def test_provide__lean_not_found(self):
+        server = self.make_server({'/status/sessions': b'<MediaContainer size="0" />'})
+        provider = SessionProvider(server, lean=True)
+
+        with pytest.raises(SessionNotFoundError):
+            provider.provide('1')
+
 
 class TestSessionDiscovery:
     buffering_notif = make_fake_notification(state='buffering')
@@ -175,3 +384,164 @@ class TestSessionDiscovery:
             extrapolator=extrapolator,
         )
         discovery._handle_notification(notif)  # Shouldn't raise.
+
+    def test_handle_notification__does_not_refetch_polled_session(self):
+        session = make_fake_session(key='1', state='playing')
+        provider = Mock(spec=SessionProvider)
+        provider.provide_polled.return_value = session
+        dispatcher = Mock(spec=SessionDispatcher)
+        extrapolator = Mock(spec=SessionExtrapolator)
+        extrapolator.trigger_extrapolation.return_value = False
+        element = Mock(spec=SessionElement)
+
+        discovery = SessionDiscovery(
+            server=Mock(spec=PlexServer),
+            provider=provider,
+            dispatcher=dispatcher,
+            extrapolator=extrapolator,
+        )
+        discovery._handle_notification(PolledPlaybackNotification(  # type: ignore
+            make_fake_notification(sessionKey='1', state='playing'), element=element, observedAt=1.5,
+        ))
+
+        provider.provide.assert_not_called()
+        provider.provide_polled.assert_called_once_with(element, 1.5)
+        dispatcher.dispatch.assert_called_once_with(session)
+
+    def test_handle_notification__extrapolates_until_rejected(self):
+        scheduler = VirtualScheduler()
+        session = make_fake_session(key='1', state='playing')
+        provider = Mock(spec=SessionProvider)
+        provider.provide.return_value = session
+        dispatcher = Mock(spec=SessionDispatcher)
+        dispatcher.dispatch.return_value = True
+        extrapolator = Mock(spec=SessionExtrapolator)
+        extrapolator.trigger_extrapolation.side_effect = [True, True, False]
+        extrapolator.extrapolate.return_value = (session, 1000)
+
+        discovery = SessionDiscovery(
+            server=Mock(spec=PlexServer),
+            provider=provider,
+            dispatcher=dispatcher,
+            extrapolator=extrapolator,
+            scheduler=scheduler,
+        )
+        discovery._handle_notification(make_fake_notification(sessionKey='1', state='playing'))
+        assert discovery.pending_timers() == {'1': 1.0}
+        scheduler.advance(0.25)
+        assert discovery.pending_timers() == {'1': 0.75}
+
+        scheduler.advance(10)
+
+        assert dispatcher.dispatch.call_count == 3
+        assert discovery.pending_timers() == {}
+        assert scheduler.pending == 0
+
+    def test_handle_notification__cancels_timer(self):
+        scheduler = VirtualScheduler()
+        session = make_fake_session(key='1', state='playing')
+        provider = Mock(spec=SessionProvider)
+        provider.provide.return_value = session
+        dispatcher = Mock(spec=SessionDispatcher)
+        extrapolator = Mock(spec=SessionExtrapolator)
+        extrapolator.trigger_extrapolation.return_value = True
+        extrapolator.extrapolate.return_value = (session, 1000)
+
+        discovery = SessionDiscovery(
+            server=Mock(spec=PlexServer),
+            provider=provider,
+            dispatcher=dispatcher,
+            extrapolator=extrapolator,
+            scheduler=scheduler,
+        )
+        discovery._handle_notification(make_fake_notification(sessionKey='1', state='playing'))
+        discovery._handle_notification(make_fake_notification(sessionKey='1', state='stopped'))
+        scheduler.advance(10)
+
+        assert dispatcher.dispatch.call_count == 1
+        dispatcher.dispatch_removal.assert_called_once_with('1')
+
+
+class _FakePlexAdapter(requests.adapters.BaseAdapter):
+    """Answers requests with canned XML, and records their paths."""
+
+    def __init__(self, responses: Dict[str, bytes]):
+        super().__init__()
+        self.responses = responses
+        self.paths: List[str] = []
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        self.paths.append(request.path_url)
+        response = requests.Response()
+        response.status_code = 200 if request.path_url in self.responses else 404
+        response.raw = BytesIO(self.responses.get(request.path_url, b''))
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class TestRequestBudget:
+    SESSIONS_XML = (
+        b'<MediaContainer size="1">'
+        b'<Video sessionKey="1" ratingKey="2" key="/library/metadata/2" type="episode" title="Episode" '
+        b'grandparentTitle="Show" viewOffset="5000">'
+        b'<Player machineIdentifier="id" address="addr" title="Player" state="playing" />'
+        b'</Video></MediaContainer>'
+    )
+    MARKERS_XML = (
+        b'<MediaContainer size="1"><Video ratingKey="2" key="/library/metadata/2" type="episode">'
+        b'<Marker type="intro" startTimeOffset="10000" endTimeOffset="60000" />'
+        b'</Video></MediaContainer>'
+    )
+
+    @pytest.mark.parametrize('lean', [False, True])
+    def test_requests_per_notification_and_tick(self, lean: bool):
+        adapter = _FakePlexAdapter({
+            '/': b'<MediaContainer machineIdentifier="server" version="1.0" />',
+            '/status/sessions': self.SESSIONS_XML,
+            '/library/metadata/2?includeMarkers=1': self.MARKERS_XML,
+        })
+        http_session = requests.Session()
+        http_session.mount('http://', adapter)
+        server = PlexServer('http://plex:32400', 'token', session=http_session)
+        counter = RequestCounter()
+        counter.install(http_session)
+
+        scheduler = VirtualScheduler()
+        seek_serializer = Mock(spec=SeekSerializer)
+        seek_serializer.seek.return_value = True
+        auto_skipper = AutoSkipper(Mock(spec=SeekableProvider), seek_serializer=seek_serializer, scheduler=scheduler)
+        discovery = SessionDiscovery(
+            server=server,
+            provider=SessionProvider(server, clock=scheduler, lean=lean),
+            dispatcher=SessionDispatcher(auto_skipper, clock=scheduler),
+            extrapolator=auto_skipper,
+            scheduler=scheduler,
+            request_counter=counter,
+        )
+
+        def notify():
+            discovery.alert_callback({
+                'type': 'playing',
+                'PlaySessionStateNotification': [make_fake_notification(sessionKey='1', state='playing')],
+            })
+
+        notify()
+        scheduler.advance(1)
+        notify()
+        scheduler.advance(10)
+
+        seek_serializer.seek.assert_called_once()
+        stats = counter.stats()
+        # The sessions, then the markers once per ratingKey. Ticks are free.
+        assert stats['notification'] == {'count': 2, 'requests': 3, 'max_requests': 2, 'requests_per_scope': 1.5}
+        assert stats['tick']['count'] > 0
+        assert stats['tick']['requests'] == 0
+        assert adapter.paths[1:] == [
+            '/status/sessions',
+            '/library/metadata/2?includeMarkers=1',
+            '/status/sessions',
+        ]
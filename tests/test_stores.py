@@ -1,32 +1,44 @@
 from pathlib import Path
 import shelve
+from typing import Iterator
 
 import pytest
 
-from skippex.stores import Database
+from skippex.stores import Database, SkipRecord, SqliteStore
 
 
 @pytest.fixture
-def db(request, tmp_path: Path) -> Database:
+def db(request, tmp_path: Path) -> Iterator[Database]:
     if request.param == 'dict':
-        return Database({})
+        yield Database({})
     elif request.param == 'shelf':
         shelf = shelve.open(str(tmp_path / 'shelf.db'))
-        return Database(shelf)
+        yield Database(shelf)
+    elif request.param == 'sqlite':
+        store = SqliteStore(tmp_path / 'db.sqlite3')
+        yield Database(store)
+        store.close()
     else:
         raise ValueError
 
 
+@pytest.fixture
+def sqlite_store(tmp_path: Path) -> Iterator[SqliteStore]:
+    store = SqliteStore(tmp_path / 'db.sqlite3')
+    yield store
+    store.close()
+
+
 class TestDatabase:
-    @pytest.mark.parametrize('db', ['dict', 'shelf'], indirect=True)
+    @pytest.mark.parametrize('db', ['dict', 'shelf', 'sqlite'], indirect=True)
     def test_app_id__has_default(self, db: Database):
         assert db.app_id
 
-    @pytest.mark.parametrize('db', ['dict', 'shelf'], indirect=True)
+    @pytest.mark.parametrize('db', ['dict', 'shelf', 'sqlite'], indirect=True)
     def test_app_id__has_default(self, db: Database):
         assert db.app_id
 
-    @pytest.mark.parametrize('db', ['dict', 'shelf'], indirect=True)
+    @pytest.mark.parametrize('db', ['dict', 'shelf', 'sqlite'], indirect=True)
     def test_app_id__default_persists(self, db: Database):
         default = db.app_id
         assert db.app_id == default
@@ -35,3 +47,96 @@ class TestDatabase:
         db1 = Database({})
         db2 = Database({})
         assert db1.app_id != db2.app_id
+
+
+class TestSqliteStore:
+    def test_open__migrates_legacy_shelf(self, tmp_path: Path):
+        with shelve.open(str(tmp_path / 'legacy.db')) as shelf:
+            shelf['app_id'] = 'dummy_id'
+            shelf['auth_token'] = 'dummy_token'
+
+        store = SqliteStore.open(tmp_path / 'db.sqlite3', legacy_shelf_path=tmp_path / 'legacy.db')
+        try:
+            assert dict(store.items()) == {'app_id': 'dummy_id', 'auth_token': 'dummy_token'}
+        finally:
+            store.close()
+
+    def test_open__does_not_migrate_twice(self, tmp_path: Path):
+        with shelve.open(str(tmp_path / 'legacy.db')) as shelf:
+            shelf['auth_token'] = 'old_token'
+
+        store = SqliteStore.open(tmp_path / 'db.sqlite3', legacy_shelf_path=tmp_path / 'legacy.db')
+        store['auth_token'] = 'new_token'
+        store.close()
+
+        store = SqliteStore.open(tmp_path / 'db.sqlite3', legacy_shelf_path=tmp_path / 'legacy.db')
+        try:
+            assert store['auth_token'] == 'new_token'
+        finally:
+            store.close()
+
+    def test_is_shared_between_connections(self, tmp_path: Path):
+        store1 = SqliteStore(tmp_path / 'db.sqlite3')
+        store2 = SqliteStore(tmp_path / 'db.sqlite3')
+        try:
+            store1['auth_token'] = 'dummy_token'
+            assert store2['auth_token'] == 'dummy_token'
+        finally:
+            store1.close()
+            store2.close()
+
+    def test_intro_markers__persist_once_flushed(self, sqlite_store: SqliteStore):
+        sqlite_store.intro_markers['1'] = (1000, 2000)
+        sqlite_store.intro_markers['2'] = None
+        assert sqlite_store.intro_markers['1'] == (1000, 2000)
+
+        sqlite_store.flush()
+        other = SqliteStore(sqlite_store.path)
+        try:
+            assert other.intro_markers['1'] == (1000, 2000)
+            assert other.intro_markers['2'] is None
+        finally:
+            other.close()
+
+    def test_intro_markers__reads_database_once_flushed(self, sqlite_store: SqliteStore):
+        sqlite_store.intro_markers['1'] = (1000, 2000)
+        sqlite_store.flush()
+        assert not sqlite_store.intro_markers._pending
+
+        # Another worker updates the marker.
+        other = SqliteStore(sqlite_store.path)
+        try:
+            other.intro_markers['1'] = (3000, 4000)
+            other.flush()
+        finally:
+            other.close()
+        assert sqlite_store.intro_markers['1'] == (3000, 4000)
+
+    def test_update_many__rolls_back_on_error(self, sqlite_store: SqliteStore):
+        with pytest.raises(TypeError):
+            sqlite_store.update_many({'a': 1, 'b': object()})  # type: ignore
+        with pytest.raises(KeyError):
+            sqlite_store['a']
+        sqlite_store.update_many({'a': 1})
+        assert sqlite_store['a'] == 1
+
+    def test_intro_markers__missing_marker_expires(self, sqlite_store: SqliteStore):
+        sqlite_store.intro_markers._negative_ttl_sec = -1
+        sqlite_store.intro_markers['1'] = None
+        with pytest.raises(KeyError):
+            sqlite_store.intro_markers['1']
+
+    def test_skip_history__recent_first(self, sqlite_store: SqliteStore):
+        for i in range(3):
+            sqlite_store.skip_history.record(SkipRecord(
+                session_key=str(i),
+                rating_key='1',
+                player_id='player',
+                from_ms=1000,
+                to_ms=2000,
+                skipped_at=float(i),
+            ))
+        sqlite_store.flush()
+
+        recent = sqlite_store.skip_history.recent(limit=2)
+        assert [r.session_key for r in recent] == ['2', '1']
@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+import threading
+
+from skippex.traces import TraceBuffer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTraceBuffer:
+    def test_record__keeps_latest_events(self):
+        trace = TraceBuffer(capacity=2)
+        trace.record('1', 'notification', 'playing')
+        trace.record('1', 'provide_start')
+        trace.record('2', 'provide_end')
+
+        assert [(e.session_key, e.kind) for e in trace.events()] == [('1', 'provide_start'), ('2', 'provide_end')]
+
+    def test_events__filters_by_session(self):
+        trace = TraceBuffer()
+        trace.record('1', 'accept')
+        trace.record('2', 'reject', 'has no intro marker')
+
+        assert [e.kind for e in trace.events('2')] == ['reject']
+
+    def test_dump__writes_json_lines(self, tmp_path: Path):
+        clock = FakeClock()
+        trace = TraceBuffer(dump_dir=tmp_path, clock=clock)
+        clock.now = 1.5
+        trace.record('1', 'seek_sent', '9000->60000')
+
+        path = trace.dump('test')
+
+        assert path is not None
+        header, event = [json.loads(line) for line in path.read_text().splitlines()]
+        assert header['reason'] == 'test'
+        assert event == {'at': 1.5, 'session_key': '1', 'kind': 'seek_sent', 'detail': '9000->60000'}
+
+    def test_dump__rate_limited_unless_forced(self, tmp_path: Path):
+        clock = FakeClock()
+        trace = TraceBuffer(dump_dir=tmp_path, min_dump_interval_sec=60, clock=clock)
+
+        assert trace.dump('first')
+        clock.now = 30
+        assert trace.dump('second') is None
+        assert trace.dump('forced', force=True)
+
+    def test_dump__in_background(self, tmp_path: Path):
+        trace = TraceBuffer(dump_dir=tmp_path)
+        trace.record('1', 'seek_sent')
+
+        path = trace.dump('test', background=True)
+        for thread in threading.enumerate():
+            if thread.name == 'TraceDump':
+                thread.join()
+
+        assert path is not None
+        assert len(path.read_text().splitlines()) == 2
+
+    def test_dump__unique_paths_within_the_same_second(self, tmp_path: Path):
+        trace = TraceBuffer(dump_dir=tmp_path)
+
+        paths = {trace.dump('first', force=True), trace.dump('second', force=True)}
+
+        assert len(paths) == 2
+        assert set(tmp_path.iterdir()) == paths
+
+    def test_dump__noop_without_dump_dir(self):
+        assert TraceBuffer().dump('test') is None
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+
+from skippex.workers import ShardedWorkers, shard_of
+
+
+def _echo_worker(index: int, alerts: multiprocessing.Queue, results: multiprocessing.Queue):
+    for alert in iter(alerts.get, None):
+        for notification in alert['PlaySessionStateNotification']:
+            results.put((index, notification['sessionKey']))
+
+
+def _exiting_worker(index: int, alerts: multiprocessing.Queue, results: multiprocessing.Queue):
+    results.put((index, os.getpid()))
+
+
+def _alert(*session_keys: str):
+    return {
+        'type': 'playing',
+        'PlaySessionStateNotification': [{'sessionKey': k, 'state': 'playing'} for k in session_keys],
+    }
+
+
+def test_shard_of__is_stable_and_spread():
+    shards = [shard_of(str(i), 4) for i in range(1000)]
+    assert shards == [shard_of(str(i), 4) for i in range(1000)]
+    assert all(shards.count(s) > 150 for s in range(4))
+
+
+class TestShardedWorkers:
+    def test_put__routes_sessions_by_key(self):
+        results = multiprocessing.get_context('spawn').Queue()
+        workers = ShardedWorkers(3, _echo_worker, args=(results,))
+        workers.start()
+        try:
+            keys = [str(i) for i in range(20)]
+            workers.put(_alert(*keys[:10]))
+            workers.put(_alert(*keys[10:]))
+            workers.put({'type': 'timeline'})  # type: ignore
+            routed = sorted((results.get(timeout=30) for _ in keys), key=lambda r: int(r[1]))
+        finally:
+            workers.close()
+
+        assert routed == [(shard_of(k, 3), k) for k in keys]
+        assert workers.stats()['alive'] == 0
+
+    def test_monitor__restarts_dead_workers(self):
+        results = multiprocessing.get_context('spawn').Queue()
+        workers = ShardedWorkers(1, _exiting_worker, args=(results,), monitor_interval_sec=60)
+        workers.start()
+        try:
+            # Without anything being routed to it.
+            _, first_pid = results.get(timeout=30)
+            _, second_pid = results.get(timeout=30)
+        finally:
+            workers.close()
+
+        assert second_pid != first_pid
+        assert workers.restarts == 1